@@ -23,7 +23,9 @@ create table crawled_pages (
     content text not null,
     metadata jsonb not null default '{}'::jsonb,
     source_id text not null,
+    content_hash text,  -- Hash of the raw chunk, used to skip unchanged chunks on recrawl
     embedding vector(1536),  -- OpenAI embeddings are 1536 dimensions
+    fts tsvector generated always as (to_tsvector('english', content)) stored,  -- Full-text search vector for hybrid search
     created_at timestamp with time zone default timezone('utc'::text, now()) not null,
     
     -- Add a unique constraint to prevent duplicate chunks for the same URL
@@ -42,12 +44,22 @@ create index idx_crawled_pages_metadata on crawled_pages using gin (metadata);
 -- Create an index on source_id for faster filtering
 CREATE INDEX idx_crawled_pages_source_id ON crawled_pages (source_id);
 
--- Create a function to search for documentation chunks
+-- Create a full-text index for the keyword side of hybrid search
+create index idx_crawled_pages_fts on crawled_pages using gin (fts);
+
+-- Create a function to search for documentation chunks. Pages after the first (after_*) read
+-- after_offset + 2 * match_count candidates from the ivfflat index, which only returns rows from
+-- the lists it probes: raise ivfflat.probes (or hnsw.ef_search with an HNSW index, or enable
+-- pgvector 0.8's iterative scans) if deep pages come back short, at the cost of slower searches.
 create or replace function match_crawled_pages (
   query_embedding vector(1536),
   match_count int default 10,
   filter jsonb DEFAULT '{}'::jsonb,
-  source_filter text DEFAULT NULL
+  source_filter text DEFAULT NULL,
+  after_similarity float DEFAULT NULL,
+  after_url text DEFAULT NULL,
+  after_chunk_number int DEFAULT NULL,
+  after_offset int DEFAULT 0
 ) returns table (
   id bigint,
   url varchar,
@@ -62,22 +74,105 @@ as $$
 #variable_conflict use_column
 begin
   return query
+  -- The inner query orders by distance alone so the ivfflat index can serve it. It over-fetches
+  -- every row of the previous pages (after_offset) plus two pages, the second one as slack for
+  -- rows tied on distance, and the keyset condition and tie-break order apply to those candidates.
+  with candidates as (
+    select
+      id,
+      url,
+      chunk_number,
+      content,
+      metadata,
+      source_id,
+      crawled_pages.embedding <=> query_embedding as distance
+    from crawled_pages
+    where metadata @> filter
+      AND (source_filter IS NULL OR source_id = source_filter)
+    order by crawled_pages.embedding <=> query_embedding
+    limit coalesce(after_offset, 0) + 2 * match_count
+  )
   select
-    id,
-    url,
-    chunk_number,
-    content,
-    metadata,
-    source_id,
-    1 - (crawled_pages.embedding <=> query_embedding) as similarity
-  from crawled_pages
-  where metadata @> filter
-    AND (source_filter IS NULL OR source_id = source_filter)
-  order by crawled_pages.embedding <=> query_embedding
+    candidates.id,
+    candidates.url,
+    candidates.chunk_number,
+    candidates.content,
+    candidates.metadata,
+    candidates.source_id,
+    1 - candidates.distance as similarity
+  from candidates
+  -- Keyset pagination: only rows ordered after (after_similarity, after_url, after_chunk_number)
+  where after_similarity IS NULL
+    OR 1 - candidates.distance < after_similarity
+    OR (1 - candidates.distance = after_similarity
+      AND (candidates.url, candidates.chunk_number) > (after_url, after_chunk_number))
+  order by candidates.distance, candidates.url, candidates.chunk_number
   limit match_count;
 end;
 $$;
 
+-- Hybrid search over documentation chunks: vector and full-text candidates fused with
+-- reciprocal rank fusion (score = sum of 1 / (rrf_k + rank) over both retrievers) in one call
+create or replace function hybrid_search_crawled_pages (
+  query_text text,
+  query_embedding vector(1536),
+  match_count int default 10,
+  filter jsonb DEFAULT '{}'::jsonb,
+  source_filter text DEFAULT NULL,
+  rrf_k int default 60
+) returns table (
+  id bigint,
+  url varchar,
+  chunk_number integer,
+  content text,
+  metadata jsonb,
+  source_id text,
+  similarity float,
+  rrf_score float
+)
+language sql stable
+as $$
+  with semantic as (
+    -- Rank the nearest rows outside the index scan, so ties on distance break on id
+    select
+      nearest.id,
+      row_number() over (order by nearest.distance, nearest.id) as rank
+    from (
+      select cp.id, cp.embedding <=> query_embedding as distance
+      from crawled_pages cp
+      where cp.metadata @> filter
+        and (source_filter is null or cp.source_id = source_filter)
+      order by cp.embedding <=> query_embedding
+      limit match_count * 2
+    ) nearest
+  ),
+  keyword as (
+    select
+      cp.id,
+      row_number() over (order by ts_rank_cd(cp.fts, websearch_to_tsquery('english', query_text)) desc, cp.id) as rank
+    from crawled_pages cp
+    where cp.fts @@ websearch_to_tsquery('english', query_text)
+      and cp.metadata @> filter
+      and (source_filter is null or cp.source_id = source_filter)
+    order by ts_rank_cd(cp.fts, websearch_to_tsquery('english', query_text)) desc, cp.id
+    limit match_count * 2
+  )
+  select
+    cp.id,
+    cp.url,
+    cp.chunk_number,
+    cp.content,
+    cp.metadata,
+    cp.source_id,
+    1 - (cp.embedding <=> query_embedding) as similarity,
+    (coalesce(1.0 / (rrf_k + semantic.rank), 0.0) + coalesce(1.0 / (rrf_k + keyword.rank), 0.0))::float as rrf_score
+  from semantic
+  full outer join keyword on semantic.id = keyword.id
+  join crawled_pages cp on cp.id = coalesce(semantic.id, keyword.id)
+  order by rrf_score desc, cp.id
+  limit match_count;
+$$;
+
 -- Enable RLS on the crawled_pages table
 alter table crawled_pages enable row level security;
 
@@ -108,6 +203,7 @@ create table code_examples (
     metadata jsonb not null default '{}'::jsonb,
     source_id text not null,
     embedding vector(1536),  -- OpenAI embeddings are 1536 dimensions
+    fts tsvector generated always as (to_tsvector('english', content || ' ' || summary)) stored,  -- Full-text search vector for hybrid search
     created_at timestamp with time zone default timezone('utc'::text, now()) not null,
     
     -- Add a unique constraint to prevent duplicate chunks for the same URL
@@ -126,12 +222,19 @@ create index idx_code_examples_metadata on code_examples using gin (metadata);
 -- Create an index on source_id for faster filtering
 CREATE INDEX idx_code_examples_source_id ON code_examples (source_id);
 
+-- Create a full-text index for the keyword side of hybrid search
+create index idx_code_examples_fts on code_examples using gin (fts);
+
 -- Create a function to search for code examples
 create or replace function match_code_examples (
   query_embedding vector(1536),
   match_count int default 10,
   filter jsonb DEFAULT '{}'::jsonb,
-  source_filter text DEFAULT NULL
+  source_filter text DEFAULT NULL,
+  after_similarity float DEFAULT NULL,
+  after_url text DEFAULT NULL,
+  after_chunk_number int DEFAULT NULL,
+  after_offset int DEFAULT 0
 ) returns table (
   id bigint,
   url varchar,
@@ -147,23 +250,108 @@ as $$
 #variable_conflict use_column
 begin
   return query
+  -- The inner query orders by distance alone so the ivfflat index can serve it. It over-fetches
+  -- every row of the previous pages (after_offset) plus two pages, the second one as slack for
+  -- rows tied on distance, and the keyset condition and tie-break order apply to those candidates.
+  with candidates as (
+    select
+      id,
+      url,
+      chunk_number,
+      content,
+      summary,
+      metadata,
+      source_id,
+      code_examples.embedding <=> query_embedding as distance
+    from code_examples
+    where metadata @> filter
+      AND (source_filter IS NULL OR source_id = source_filter)
+    order by code_examples.embedding <=> query_embedding
+    limit coalesce(after_offset, 0) + 2 * match_count
+  )
   select
-    id,
-    url,
-    chunk_number,
-    content,
-    summary,
-    metadata,
-    source_id,
-    1 - (code_examples.embedding <=> query_embedding) as similarity
-  from code_examples
-  where metadata @> filter
-    AND (source_filter IS NULL OR source_id = source_filter)
-  order by code_examples.embedding <=> query_embedding
+    candidates.id,
+    candidates.url,
+    candidates.chunk_number,
+    candidates.content,
+    candidates.summary,
+    candidates.metadata,
+    candidates.source_id,
+    1 - candidates.distance as similarity
+  from candidates
+  -- Keyset pagination: only rows ordered after (after_similarity, after_url, after_chunk_number)
+  where after_similarity IS NULL
+    OR 1 - candidates.distance < after_similarity
+    OR (1 - candidates.distance = after_similarity
+      AND (candidates.url, candidates.chunk_number) > (after_url, after_chunk_number))
+  order by candidates.distance, candidates.url, candidates.chunk_number
   limit match_count;
 end;
 $$;
 
+-- Hybrid search over code examples, fused the same way as hybrid_search_crawled_pages
+create or replace function hybrid_search_code_examples (
+  query_text text,
+  query_embedding vector(1536),
+  match_count int default 10,
+  filter jsonb DEFAULT '{}'::jsonb,
+  source_filter text DEFAULT NULL,
+  rrf_k int default 60
+) returns table (
+  id bigint,
+  url varchar,
+  chunk_number integer,
+  content text,
+  summary text,
+  metadata jsonb,
+  source_id text,
+  similarity float,
+  rrf_score float
+)
+language sql stable
+as $$
+  with semantic as (
+    -- Rank the nearest rows outside the index scan, so ties on distance break on id
+    select
+      nearest.id,
+      row_number() over (order by nearest.distance, nearest.id) as rank
+    from (
+      select cp.id, cp.embedding <=> query_embedding as distance
+      from code_examples cp
+      where cp.metadata @> filter
+        and (source_filter is null or cp.source_id = source_filter)
+      order by cp.embedding <=> query_embedding
+      limit match_count * 2
+    ) nearest
+  ),
+  keyword as (
+    select
+      cp.id,
+      row_number() over (order by ts_rank_cd(cp.fts, websearch_to_tsquery('english', query_text)) desc, cp.id) as rank
+    from code_examples cp
+    where cp.fts @@ websearch_to_tsquery('english', query_text)
+      and cp.metadata @> filter
+      and (source_filter is null or cp.source_id = source_filter)
+    order by ts_rank_cd(cp.fts, websearch_to_tsquery('english', query_text)) desc, cp.id
+    limit match_count * 2
+  )
+  select
+    cp.id,
+    cp.url,
+    cp.chunk_number,
+    cp.content,
+    cp.summary,
+    cp.metadata,
+    cp.source_id,
+    1 - (cp.embedding <=> query_embedding) as similarity,
+    (coalesce(1.0 / (rrf_k + semantic.rank), 0.0) + coalesce(1.0 / (rrf_k + keyword.rank), 0.0))::float as rrf_score
+  from semantic
+  full outer join keyword on semantic.id = keyword.id
+  join code_examples cp on cp.id = coalesce(semantic.id, keyword.id)
+  order by rrf_score desc, cp.id
+  limit match_count;
+$$;
+
 -- Enable RLS on the code_examples table
 alter table code_examples enable row level security;
 
@@ -172,4 +360,43 @@ create policy "Allow public read access to code_examples"
   on code_examples
   for select
   to public
-  using (true);
\ No newline at end of file
+  using (true);
+
+-- Delete the trailing chunks of re-ingested pages: for each URL, every chunk numbered at or
+-- above its new chunk count. One statement covers a whole batch of URLs.
+create or replace function prune_crawled_pages (
+  urls text[],
+  chunk_counts int[]
+) returns int
+language plpgsql
+as $$
+declare
+  deleted int;
+begin
+  delete from crawled_pages c
+  using unnest(urls, chunk_counts) as t(url, chunk_count)
+  where c.url = t.url
+    and c.chunk_number >= t.chunk_count;
+  get diagnostics deleted = row_count;
+  return deleted;
+end;
+$$;
+
+-- Same as prune_crawled_pages, for code examples
+create or replace function prune_code_examples (
+  urls text[],
+  chunk_counts int[]
+) returns int
+language plpgsql
+as $$
+declare
+  deleted int;
+begin
+  delete from code_examples c
+  using unnest(urls, chunk_counts) as t(url, chunk_count)
+  where c.url = t.url
+    and c.chunk_number >= t.chunk_count;
+  get diagnostics deleted = row_count;
+  return deleted;
+end;
+$$;
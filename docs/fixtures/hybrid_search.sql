@@ -0,0 +1,73 @@
+-- Fixture for hybrid_search_crawled_pages and hybrid_search_code_examples.
+-- Run it in the Supabase SQL editor (or psql) against a database set up with crawled_pages.sql.
+-- It inserts a few rows inside a transaction, raises an exception if an expectation fails,
+-- and rolls everything back.
+
+begin;
+
+insert into sources (source_id, summary) values ('fixture.example', 'Hybrid search fixture');
+
+-- Embeddings are one-hot-ish vectors so the vector ranking is known in advance (b and d tie on
+-- distance and break on id). Contents give distinct keyword ranks: a repeats the phrase, c has
+-- it once, and in d the two words are further apart.
+insert into crawled_pages (url, chunk_number, content, metadata, source_id, embedding) values
+  ('https://fixture.example/a', 0, 'Configure the PostgreSQL connection pool size. A larger connection pool serves more clients',
+   '{"source": "fixture.example"}', 'fixture.example', (array[1, 0, 0]::real[] || array_fill(0::real, array[1533]))::vector),
+  ('https://fixture.example/b', 0, 'Unrelated notes about gardening and tomatoes',
+   '{"source": "fixture.example"}', 'fixture.example', (array[0, 1, 0]::real[] || array_fill(0::real, array[1533]))::vector),
+  ('https://fixture.example/c', 0, 'Connection pool tuning guide',
+   '{"source": "fixture.example"}', 'fixture.example', (array[0.9, 0.1, 0]::real[] || array_fill(0::real, array[1533]))::vector),
+  ('https://fixture.example/d', 0, 'Pool party connection details',
+   '{"source": "fixture.example"}', 'fixture.example', (array[0, 0, 1]::real[] || array_fill(0::real, array[1533]))::vector);
+
+insert into code_examples (url, chunk_number, content, summary, metadata, source_id, embedding) values
+  ('https://fixture.example/a', 0, 'pool = create_pool(size=10)', 'Create a connection pool',
+   '{"source": "fixture.example"}', 'fixture.example', (array[1, 0, 0]::real[] || array_fill(0::real, array[1533]))::vector),
+  ('https://fixture.example/b', 0, 'plant(tomato)', 'Plant a tomato',
+   '{"source": "fixture.example"}', 'fixture.example', (array[0, 1, 0]::real[] || array_fill(0::real, array[1533]))::vector);
+
+do $$
+declare
+  query_embedding vector(1536) := (array[1, 0, 0]::real[] || array_fill(0::real, array[1533]))::vector;
+  urls text[];
+  scores float[];
+  leaked int;
+begin
+  select array_agg(r.url order by r.rrf_score desc), array_agg(r.rrf_score order by r.rrf_score desc)
+    into urls, scores
+    from hybrid_search_crawled_pages('connection pool', query_embedding, 4, '{}'::jsonb, 'fixture.example') r;
+
+  -- All four rows come back: three match both retrievers, b only matches the vector side
+  if array_length(urls, 1) is distinct from 4 then
+    raise exception 'expected 4 results, got %', urls;
+  end if;
+  -- a and c are first and second on both retrievers; d is third on keywords and fourth on
+  -- vectors, ahead of b, which has no keyword match
+  if urls is distinct from array['https://fixture.example/a', 'https://fixture.example/c',
+                                 'https://fixture.example/d', 'https://fixture.example/b'] then
+    raise exception 'unexpected fused order: %', urls;
+  end if;
+  if not (scores[1] > scores[2] and scores[2] > scores[3] and scores[3] > scores[4]) then
+    raise exception 'rrf scores are not strictly decreasing: %', scores;
+  end if;
+
+  -- The source filter applies to both retrievers
+  select count(*) into leaked
+    from hybrid_search_crawled_pages('connection pool', query_embedding, 4, '{}'::jsonb, 'missing.example');
+  if leaked <> 0 then
+    raise exception 'source filter leaked % rows', leaked;
+  end if;
+
+  -- Code examples are matched on their content and summary
+  select array_agg(r.url order by r.rrf_score desc)
+    into urls
+    from hybrid_search_code_examples('connection pool', query_embedding, 2, '{}'::jsonb, 'fixture.example') r;
+  if urls[1] <> 'https://fixture.example/a' then
+    raise exception 'unexpected code example order: %', urls;
+  end if;
+
+  raise notice 'hybrid search fixture passed';
+end;
+$$;
+
+rollback;
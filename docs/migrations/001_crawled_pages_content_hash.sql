@@ -0,0 +1,3 @@
+-- Store a hash of each chunk's content so recrawls only re-embed chunks that changed.
+-- Run this once on databases created before content_hash was added to crawled_pages.sql.
+alter table crawled_pages add column if not exists content_hash text;
@@ -0,0 +1,42 @@
+-- Functions used to prune stale trailing chunks after upserting re-ingested pages.
+-- Run this once on databases created before they were added to crawled_pages.sql.
+-- Without them the server falls back to one delete per URL.
+
+-- Delete the trailing chunks of re-ingested pages: for each URL, every chunk numbered at or
+-- above its new chunk count. One statement covers a whole batch of URLs.
+create or replace function prune_crawled_pages (
+  urls text[],
+  chunk_counts int[]
+) returns int
+language plpgsql
+as $$
+declare
+  deleted int;
+begin
+  delete from crawled_pages c
+  using unnest(urls, chunk_counts) as t(url, chunk_count)
+  where c.url = t.url
+    and c.chunk_number >= t.chunk_count;
+  get diagnostics deleted = row_count;
+  return deleted;
+end;
+$$;
+
+-- Same as prune_crawled_pages, for code examples
+create or replace function prune_code_examples (
+  urls text[],
+  chunk_counts int[]
+) returns int
+language plpgsql
+as $$
+declare
+  deleted int;
+begin
+  delete from code_examples c
+  using unnest(urls, chunk_counts) as t(url, chunk_count)
+  where c.url = t.url
+    and c.chunk_number >= t.chunk_count;
+  get diagnostics deleted = row_count;
+  return deleted;
+end;
+$$;
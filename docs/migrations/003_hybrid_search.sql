@@ -0,0 +1,136 @@
+-- Full-text search columns, GIN indexes and the hybrid search functions used by USE_HYBRID_SEARCH.
+-- Run this once on databases created before they were added to crawled_pages.sql.
+-- Adding the generated columns rewrites both tables, so expect it to take a while on large tables.
+
+alter table crawled_pages
+  add column if not exists fts tsvector generated always as (to_tsvector('english', content)) stored;
+create index if not exists idx_crawled_pages_fts on crawled_pages using gin (fts);
+
+alter table code_examples
+  add column if not exists fts tsvector generated always as (to_tsvector('english', content || ' ' || summary)) stored;
+create index if not exists idx_code_examples_fts on code_examples using gin (fts);
+
+-- Hybrid search over documentation chunks: vector and full-text candidates fused with
+-- reciprocal rank fusion (score = sum of 1 / (rrf_k + rank) over both retrievers) in one call
+create or replace function hybrid_search_crawled_pages (
+  query_text text,
+  query_embedding vector(1536),
+  match_count int default 10,
+  filter jsonb DEFAULT '{}'::jsonb,
+  source_filter text DEFAULT NULL,
+  rrf_k int default 60
+) returns table (
+  id bigint,
+  url varchar,
+  chunk_number integer,
+  content text,
+  metadata jsonb,
+  source_id text,
+  similarity float,
+  rrf_score float
+)
+language sql stable
+as $$
+  with semantic as (
+    -- Rank the nearest rows outside the index scan, so ties on distance break on id
+    select
+      nearest.id,
+      row_number() over (order by nearest.distance, nearest.id) as rank
+    from (
+      select cp.id, cp.embedding <=> query_embedding as distance
+      from crawled_pages cp
+      where cp.metadata @> filter
+        and (source_filter is null or cp.source_id = source_filter)
+      order by cp.embedding <=> query_embedding
+      limit match_count * 2
+    ) nearest
+  ),
+  keyword as (
+    select
+      cp.id,
+      row_number() over (order by ts_rank_cd(cp.fts, websearch_to_tsquery('english', query_text)) desc, cp.id) as rank
+    from crawled_pages cp
+    where cp.fts @@ websearch_to_tsquery('english', query_text)
+      and cp.metadata @> filter
+      and (source_filter is null or cp.source_id = source_filter)
+    order by ts_rank_cd(cp.fts, websearch_to_tsquery('english', query_text)) desc, cp.id
+    limit match_count * 2
+  )
+  select
+    cp.id,
+    cp.url,
+    cp.chunk_number,
+    cp.content,
+    cp.metadata,
+    cp.source_id,
+    1 - (cp.embedding <=> query_embedding) as similarity,
+    (coalesce(1.0 / (rrf_k + semantic.rank), 0.0) + coalesce(1.0 / (rrf_k + keyword.rank), 0.0))::float as rrf_score
+  from semantic
+  full outer join keyword on semantic.id = keyword.id
+  join crawled_pages cp on cp.id = coalesce(semantic.id, keyword.id)
+  order by rrf_score desc, cp.id
+  limit match_count;
+$$;
+
+-- Hybrid search over code examples, fused the same way as hybrid_search_crawled_pages
+create or replace function hybrid_search_code_examples (
+  query_text text,
+  query_embedding vector(1536),
+  match_count int default 10,
+  filter jsonb DEFAULT '{}'::jsonb,
+  source_filter text DEFAULT NULL,
+  rrf_k int default 60
+) returns table (
+  id bigint,
+  url varchar,
+  chunk_number integer,
+  content text,
+  summary text,
+  metadata jsonb,
+  source_id text,
+  similarity float,
+  rrf_score float
+)
+language sql stable
+as $$
+  with semantic as (
+    -- Rank the nearest rows outside the index scan, so ties on distance break on id
+    select
+      nearest.id,
+      row_number() over (order by nearest.distance, nearest.id) as rank
+    from (
+      select cp.id, cp.embedding <=> query_embedding as distance
+      from code_examples cp
+      where cp.metadata @> filter
+        and (source_filter is null or cp.source_id = source_filter)
+      order by cp.embedding <=> query_embedding
+      limit match_count * 2
+    ) nearest
+  ),
+  keyword as (
+    select
+      cp.id,
+      row_number() over (order by ts_rank_cd(cp.fts, websearch_to_tsquery('english', query_text)) desc, cp.id) as rank
+    from code_examples cp
+    where cp.fts @@ websearch_to_tsquery('english', query_text)
+      and cp.metadata @> filter
+      and (source_filter is null or cp.source_id = source_filter)
+    order by ts_rank_cd(cp.fts, websearch_to_tsquery('english', query_text)) desc, cp.id
+    limit match_count * 2
+  )
+  select
+    cp.id,
+    cp.url,
+    cp.chunk_number,
+    cp.content,
+    cp.summary,
+    cp.metadata,
+    cp.source_id,
+    1 - (cp.embedding <=> query_embedding) as similarity,
+    (coalesce(1.0 / (rrf_k + semantic.rank), 0.0) + coalesce(1.0 / (rrf_k + keyword.rank), 0.0))::float as rrf_score
+  from semantic
+  full outer join keyword on semantic.id = keyword.id
+  join code_examples cp on cp.id = coalesce(semantic.id, keyword.id)
+  order by rrf_score desc, cp.id
+  limit match_count;
+$$;
@@ -0,0 +1,137 @@
+-- Keyset pagination for match_crawled_pages and match_code_examples, used by the cursors of the
+-- search tools. Run this once on databases created before it was added to crawled_pages.sql.
+-- The functions gain four parameters, so the old signatures are dropped first.
+--
+-- Deep pages read after_offset + 2 * match_count candidates from the ivfflat index, which only
+-- returns rows from the lists it probes. If deep pages come back short, raise ivfflat.probes
+-- (e.g. `alter database postgres set ivfflat.probes = 10`) at the cost of slower searches, or
+-- with an HNSW index raise hnsw.ef_search above the deepest offset you page to. pgvector 0.8+
+-- can instead enable iterative index scans (ivfflat.iterative_scan / hnsw.iterative_scan).
+
+drop function if exists match_crawled_pages(vector, int, jsonb, text);
+drop function if exists match_code_examples(vector, int, jsonb, text);
+drop function if exists match_crawled_pages(vector, int, jsonb, text, float, text, int);
+drop function if exists match_code_examples(vector, int, jsonb, text, float, text, int);
+
+create or replace function match_crawled_pages (
+  query_embedding vector(1536),
+  match_count int default 10,
+  filter jsonb DEFAULT '{}'::jsonb,
+  source_filter text DEFAULT NULL,
+  after_similarity float DEFAULT NULL,
+  after_url text DEFAULT NULL,
+  after_chunk_number int DEFAULT NULL,
+  after_offset int DEFAULT 0
+) returns table (
+  id bigint,
+  url varchar,
+  chunk_number integer,
+  content text,
+  metadata jsonb,
+  source_id text,
+  similarity float
+)
+language plpgsql
+as $$
+#variable_conflict use_column
+begin
+  return query
+  -- The inner query orders by distance alone so the ivfflat index can serve it. It over-fetches
+  -- every row of the previous pages (after_offset) plus two pages, the second one as slack for
+  -- rows tied on distance, and the keyset condition and tie-break order apply to those candidates.
+  with candidates as (
+    select
+      id,
+      url,
+      chunk_number,
+      content,
+      metadata,
+      source_id,
+      crawled_pages.embedding <=> query_embedding as distance
+    from crawled_pages
+    where metadata @> filter
+      AND (source_filter IS NULL OR source_id = source_filter)
+    order by crawled_pages.embedding <=> query_embedding
+    limit coalesce(after_offset, 0) + 2 * match_count
+  )
+  select
+    candidates.id,
+    candidates.url,
+    candidates.chunk_number,
+    candidates.content,
+    candidates.metadata,
+    candidates.source_id,
+    1 - candidates.distance as similarity
+  from candidates
+  -- Keyset pagination: only rows ordered after (after_similarity, after_url, after_chunk_number)
+  where after_similarity IS NULL
+    OR 1 - candidates.distance < after_similarity
+    OR (1 - candidates.distance = after_similarity
+      AND (candidates.url, candidates.chunk_number) > (after_url, after_chunk_number))
+  order by candidates.distance, candidates.url, candidates.chunk_number
+  limit match_count;
+end;
+$$;
+
+create or replace function match_code_examples (
+  query_embedding vector(1536),
+  match_count int default 10,
+  filter jsonb DEFAULT '{}'::jsonb,
+  source_filter text DEFAULT NULL,
+  after_similarity float DEFAULT NULL,
+  after_url text DEFAULT NULL,
+  after_chunk_number int DEFAULT NULL,
+  after_offset int DEFAULT 0
+) returns table (
+  id bigint,
+  url varchar,
+  chunk_number integer,
+  content text,
+  summary text,
+  metadata jsonb,
+  source_id text,
+  similarity float
+)
+language plpgsql
+as $$
+#variable_conflict use_column
+begin
+  return query
+  -- The inner query orders by distance alone so the ivfflat index can serve it. It over-fetches
+  -- every row of the previous pages (after_offset) plus two pages, the second one as slack for
+  -- rows tied on distance, and the keyset condition and tie-break order apply to those candidates.
+  with candidates as (
+    select
+      id,
+      url,
+      chunk_number,
+      content,
+      summary,
+      metadata,
+      source_id,
+      code_examples.embedding <=> query_embedding as distance
+    from code_examples
+    where metadata @> filter
+      AND (source_filter IS NULL OR source_id = source_filter)
+    order by code_examples.embedding <=> query_embedding
+    limit coalesce(after_offset, 0) + 2 * match_count
+  )
+  select
+    candidates.id,
+    candidates.url,
+    candidates.chunk_number,
+    candidates.content,
+    candidates.summary,
+    candidates.metadata,
+    candidates.source_id,
+    1 - candidates.distance as similarity
+  from candidates
+  -- Keyset pagination: only rows ordered after (after_similarity, after_url, after_chunk_number)
+  where after_similarity IS NULL
+    OR 1 - candidates.distance < after_similarity
+    OR (1 - candidates.distance = after_similarity
+      AND (candidates.url, candidates.chunk_number) > (after_url, after_chunk_number))
+  order by candidates.distance, candidates.url, candidates.chunk_number
+  limit match_count;
+end;
+$$;
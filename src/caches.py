@@ -0,0 +1,464 @@
+"""
+Caches used by the Crawl4AI MCP server.
+"""
+import os
+import sqlite3
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+
+def content_hash(model: str, text: str) -> str:
+    """
+    Build a content-addressed key for a text embedded with a given model.
+
+    Args:
+        model: Name of the embedding model
+        text: Text that was embedded
+
+    Returns:
+        Hex digest identifying the (model, text) pair
+    """
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent, size-bounded LRU cache of embeddings stored in SQLite.
+
+    Entries are keyed by a hash of the model name and the embedded text, so a chunk that
+    comes back byte-identical on a recrawl is never sent to the embeddings API twice.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100000):
+        """
+        Open (or create) the cache database.
+
+        Args:
+            path: Path of the SQLite database file
+            max_entries: Maximum number of embeddings kept before the least recently used are evicted
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[int, np.ndarray]:
+        """
+        Look up cached embeddings for a list of texts.
+
+        Args:
+            model: Name of the embedding model
+            texts: Texts to look up
+
+        Returns:
+            Dictionary mapping the index of each cached text to its float32 embedding
+        """
+        if not texts:
+            return {}
+
+        keys = [content_hash(model, text) for text in texts]
+        found: Dict[str, bytes] = {}
+
+        with self._lock:
+            # SQLite limits the number of bound parameters, so look keys up in slices
+            for start in range(0, len(keys), 500):
+                key_slice = keys[start:start + 500]
+                placeholders = ",".join("?" * len(key_slice))
+                rows = self._conn.execute(
+                    f"SELECT key, embedding FROM embeddings WHERE key IN ({placeholders})",
+                    key_slice
+                ).fetchall()
+                found.update(rows)
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+            results: Dict[int, np.ndarray] = {}
+            for i, key in enumerate(keys):
+                blob = found.get(key)
+                if blob is not None:
+                    results[i] = np.frombuffer(blob, dtype=np.float32)
+            self.hits += len(results)
+            self.misses += len(keys) - len(results)
+
+        return results
+
+    def put_many(self, model: str, texts: List[str], embeddings: np.ndarray) -> None:
+        """
+        Store embeddings for a list of texts, evicting the least recently used entries if needed.
+
+        Args:
+            model: Name of the embedding model
+            texts: Texts that were embedded
+            embeddings: float32 array of embeddings aligned with texts
+        """
+        if not texts:
+            return
+
+        now = time.time()
+        rows = [
+            (content_hash(model, text), model, np.asarray(embedding, dtype=np.float32).tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, model, embedding, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._size += self._conn.total_changes - before
+
+            if self._size > self.max_entries:
+                # Evict down to 90% of capacity so we don't evict on every insert
+                to_evict = self._size - int(self.max_entries * 0.9)
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (to_evict,)
+                )
+                self._size -= to_evict
+                self.evictions += to_evict
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get hit/miss counters for the cache.
+
+        Returns:
+            Dictionary with hit, miss, eviction and size counters
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "size": self._size,
+            "max_entries": self.max_entries
+        }
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+class QueryEmbeddingCache:
+    """
+    In-process LRU cache of query embeddings with a time-to-live.
+
+    Agents repeat the same queries constantly within a session; serving those from memory
+    skips the embedding round-trip entirely. Cached arrays are read-only so callers cannot
+    corrupt a shared entry.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0):
+        """
+        Create an empty cache.
+
+        Args:
+            max_entries: Maximum number of query embeddings kept before the least recently used are evicted
+            ttl: Seconds after which an entry expires
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, np.ndarray]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """
+        Look up the embedding of a query.
+
+        Args:
+            key: Cache key built from the embedding model and the normalized query
+
+        Returns:
+            The cached embedding, or None if missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, embedding: np.ndarray) -> None:
+        """
+        Store the embedding of a query, evicting the least recently used entry if needed.
+
+        Args:
+            key: Cache key built from the embedding model and the normalized query
+            embedding: Query embedding
+        """
+        embedding = np.array(embedding, dtype=np.float32)
+        embedding.setflags(write=False)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get hit/miss counters for the cache.
+
+        Returns:
+            Dictionary with hit, miss, eviction and size counters
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl
+        }
+
+
+class ResultCache:
+    """
+    In-process LRU cache of search results, invalidated by per-source version counters.
+
+    Every entry remembers the version of the source it was computed against (or the global
+    version for searches across all sources). Ingestion bumps the version of each source it
+    writes to, which makes every cached result for that source, and every unfiltered result,
+    a miss from then on. Entries also expire after a TTL to bound staleness from writers
+    outside this process.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600.0):
+        """
+        Create an empty cache.
+
+        Args:
+            max_entries: Maximum number of results kept before the least recently used are evicted
+            ttl: Seconds after which an entry expires
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple, Tuple[float, int, Any]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._global_version = 0
+
+    def version(self, source: Optional[str]) -> int:
+        """
+        Get the current version of a source.
+
+        Take this before computing a result and pass it to put(), so a result computed while
+        the source was being re-ingested is never cached as current.
+
+        Args:
+            source: Source ID, or None for searches across all sources
+
+        Returns:
+            Version counter of the source
+        """
+        with self._lock:
+            return self._global_version if source is None else self._versions.get(source, 0)
+
+    def bump(self, source: str) -> None:
+        """
+        Invalidate every cached result for a source and every unfiltered result.
+
+        Args:
+            source: Source ID whose content changed
+        """
+        with self._lock:
+            self._versions[source] = self._versions.get(source, 0) + 1
+            self._global_version += 1
+
+    def get(self, key: Tuple, source: Optional[str]) -> Optional[Any]:
+        """
+        Look up a cached result.
+
+        Args:
+            key: Cache key describing the query and its options
+            source: Source ID the query was filtered on, or None
+
+        Returns:
+            The cached result, or None if missing, expired or computed against an older version
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            current = self._global_version if source is None else self._versions.get(source, 0)
+            if entry is None or entry[1] != current or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                    self.invalidations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key: Tuple, value: Any, version: int) -> None:
+        """
+        Store a result, evicting the least recently used entry if needed.
+
+        Args:
+            key: Cache key describing the query and its options
+            value: Result to cache; it must not be mutated afterwards
+            version: Source version taken with version() before the result was computed
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic(), version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get hit/miss counters for the cache.
+
+        Returns:
+            Dictionary with hit, miss, invalidation and size counters
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl
+        }
+
+
+class RerankScoreCache:
+    """
+    In-process LRU cache of cross-encoder scores.
+
+    Agents re-ask the same questions and get the same top chunks back; caching the score of
+    each (model, query, document) pair means only pairs never seen before reach the model.
+    Keys hash the document content, so a chunk whose content changes is scored again.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        """
+        Create an empty cache.
+
+        Args:
+            max_entries: Maximum number of scores kept before the least recently used are evicted
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, float]" = OrderedDict()
+
+    @staticmethod
+    def key(model: str, query: str, document: str) -> str:
+        """
+        Build the cache key of a scored pair.
+
+        Args:
+            model: Name of the cross-encoder (including anything that changes its scores)
+            query: Query text
+            document: Document text as scored
+
+        Returns:
+            Hex digest identifying the (model, query, document) triple
+        """
+        return content_hash(f"{model}\0{query}", document)
+
+    def get_many(self, keys: List[str]) -> Dict[int, float]:
+        """
+        Look up cached scores.
+
+        Args:
+            keys: Keys built with key()
+
+        Returns:
+            Dictionary mapping the index of each cached key to its score
+        """
+        found: Dict[int, float] = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                score = self._entries.get(key)
+                if score is not None:
+                    self._entries.move_to_end(key)
+                    found[i] = score
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, keys: List[str], scores: List[float]) -> None:
+        """
+        Store scores, evicting the least recently used entries if needed.
+
+        Args:
+            keys: Keys built with key()
+            scores: Scores aligned with keys
+        """
+        with self._lock:
+            for key, score in zip(keys, scores):
+                self._entries[key] = score
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get hit/miss counters for the cache.
+
+        Returns:
+            Dictionary with hit, miss, eviction and size counters
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "max_entries": self.max_entries
+        }
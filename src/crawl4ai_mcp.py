@@ -5,35 +5,56 @@ This server provides tools to crawl websites using Crawl4AI, automatically detec
 the appropriate crawl method based on URL type (sitemap, txt file, or regular webpage).
 """
 from mcp.server.fastmcp import FastMCP, Context
-from sentence_transformers import CrossEncoder
 from contextlib import asynccontextmanager
 from collections.abc import AsyncIterator
 from dataclasses import dataclass
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Union, AsyncIterable
 from urllib.parse import urlparse, urldefrag
-from xml.etree import ElementTree
 from dotenv import load_dotenv
-from supabase import Client
+from supabase import AsyncClient
 from pathlib import Path
-import requests
+import httpx
+import hashlib
+import uuid
+import base64
 import asyncio
 import json
+import time
 import os
 import re
-import concurrent.futures
 
-from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode, MemoryAdaptiveDispatcher
+from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode
 
+from crawl_state import CrawlCheckpointStore, ValidatorStore
+from crawl_scheduler import CrawlScheduler, CrawlFrontier
+from sitemaps import SitemapEntry, iter_sitemap_entries
+from static_fetch import StaticFetch, StaticFetcher
+from reranker import RerankEngine
+from caches import RerankScoreCache
 from utils import (
+    CACHE_DIR,
+    EMBEDDING_PROVIDER,
+    CONTEXTUAL_MAX_CONCURRENCY,
+    gather_bounded,
+    install_blocking_executor,
+    get_embedding_provider,
+    check_embedding_dimension,
+    get_embedding_cache,
+    get_query_embedding_cache,
+    get_result_cache,
+    get_local_vector_index,
+    create_query_embeddings,
+    normalize_query,
     get_supabase_client, 
     add_documents_to_supabase, 
     search_documents,
     extract_code_blocks,
     generate_code_example_summary,
     add_code_examples_to_supabase,
+    prune_chunks,
     update_source_info,
     extract_source_summary,
-    search_code_examples
+    search_code_examples as search_code_examples_impl
 )
 
 # Load environment variables from the project root .env file
@@ -48,8 +69,12 @@ load_dotenv(dotenv_path, override=True)
 class Crawl4AIContext:
     """Context for the Crawl4AI MCP server."""
     crawler: AsyncWebCrawler
-    supabase_client: Client
-    reranking_model: Optional[CrossEncoder] = None
+    supabase_client: AsyncClient
+    reranker: Optional[RerankEngine] = None
+    validator_store: Optional[ValidatorStore] = None
+    crawl_scheduler: Optional[CrawlScheduler] = None
+    static_fetcher: Optional[StaticFetcher] = None
+    checkpoint_store: Optional[CrawlCheckpointStore] = None
 
 @asynccontextmanager
 async def crawl4ai_lifespan(server: FastMCP) -> AsyncIterator[Crawl4AIContext]:
@@ -72,27 +97,125 @@ async def crawl4ai_lifespan(server: FastMCP) -> AsyncIterator[Crawl4AIContext]:
     crawler = AsyncWebCrawler(config=browser_config)
     await crawler.__aenter__()
     
+    # Bound the threads used for blocking work offloaded from the event loop
+    install_blocking_executor()
+    
     # Initialize Supabase client
-    supabase_client = get_supabase_client()
+    supabase_client = await get_supabase_client()
+    
+    # Load a local embedding model up front rather than on the first request
+    if EMBEDDING_PROVIDER == "local":
+        try:
+            dimension = await asyncio.to_thread(lambda: get_embedding_provider().dimension)
+            print(f"Loaded local embedding model with dimension {dimension}")
+        except Exception as e:
+            print(f"Failed to load local embedding model: {e}")
+    
+    # Fail fast if the embedding model does not produce embeddings of the configured size
+    if os.getenv("CHECK_EMBEDDING_DIMENSION", "true") == "true":
+        try:
+            await check_embedding_dimension()
+        except ValueError:
+            await crawler.__aexit__(None, None, None)
+            raise
+        except Exception as e:
+            print(f"Could not check the embedding dimension: {e}")
     
     # Initialize cross-encoder model for reranking if enabled
-    reranking_model = None
+    reranker = None
     if os.getenv("USE_RERANKING", "false") == "true":
         try:
-            reranking_model = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
+            score_cache_size = int(os.getenv("RERANK_SCORE_CACHE_SIZE", "10000"))
+            reranker = await asyncio.to_thread(
+                RerankEngine,
+                os.getenv("RERANKING_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+                backend=os.getenv("RERANKING_BACKEND", "torch"),
+                model_file=os.getenv("RERANKING_MODEL_FILE") or None,
+                max_length=int(os.getenv("RERANKING_MAX_LENGTH", "256")),
+                max_batch_pairs=int(os.getenv("RERANKING_MAX_BATCH_PAIRS", "64")),
+                score_cache=RerankScoreCache(score_cache_size) if score_cache_size > 0 else None
+            )
         except Exception as e:
             print(f"Failed to load reranking model: {e}")
-            reranking_model = None
+            reranker = None
+    
+    # Open the validator store used to skip unchanged pages on recrawl if enabled
+    validator_store = None
+    if os.getenv("USE_CONDITIONAL_RECRAWL", "false") == "true":
+        try:
+            validator_store = ValidatorStore(os.path.join(CACHE_DIR, "crawl_state.sqlite"))
+        except Exception as e:
+            print(f"Failed to open crawl validator store: {e}")
+            validator_store = None
+    
+    # Open the checkpoint store that makes crawls resumable if enabled
+    checkpoint_store = None
+    if os.getenv("USE_CRAWL_CHECKPOINTS", "true") == "true":
+        try:
+            checkpoint_store = CrawlCheckpointStore(os.path.join(CACHE_DIR, "crawl_checkpoints.sqlite"))
+            pruned = await asyncio.to_thread(checkpoint_store.prune, float(os.getenv("CRAWL_CHECKPOINT_TTL_DAYS", "7")) * 86400)
+            if pruned:
+                print(f"Pruned {pruned} expired crawl checkpoints")
+        except Exception as e:
+            print(f"Failed to open crawl checkpoint store: {e}")
+            checkpoint_store = None
+    
+    # Per-host politeness and adaptive concurrency, shared by every crawl of the server
+    crawl_scheduler = CrawlScheduler(
+        host_max_concurrency=int(os.getenv("CRAWL_HOST_MAX_CONCURRENCY", "8")),
+        host_initial_concurrency=int(os.getenv("CRAWL_HOST_INITIAL_CONCURRENCY", "2")),
+        host_rate=float(os.getenv("CRAWL_HOST_RATE", "10")),
+        memory_threshold_percent=float(os.getenv("CRAWL_MEMORY_THRESHOLD_PERCENT", "70")),
+        max_backoff=float(os.getenv("CRAWL_MAX_BACKOFF", "120"))
+    )
+    
+    # Fetch static text, markdown and (optionally) HTML pages without the browser
+    static_fetcher = None
+    if os.getenv("USE_STATIC_FETCH", "true") == "true":
+        static_fetcher = StaticFetcher(
+            convert_html=os.getenv("STATIC_FETCH_HTML", "false") == "true",
+            max_bytes=int(os.getenv("STATIC_FETCH_MAX_BYTES", str(5 * 1024 * 1024))),
+            min_text_chars=int(os.getenv("STATIC_FETCH_MIN_TEXT_CHARS", "500"))
+        )
+    
+    # Open the local vector index if enabled, filling it from Supabase in the background the first time
+    local_index = get_local_vector_index()
+    bootstrap_task = None
+    if local_index and not local_index.ready:
+        async def bootstrap_local_index() -> None:
+            try:
+                loaded = await local_index.bootstrap(supabase_client)
+                print(f"Loaded {loaded} chunks into the local vector index")
+            except Exception as e:
+                print(f"Failed to bootstrap local vector index: {e}. Searching through Supabase until it is rebuilt.")
+        bootstrap_task = asyncio.create_task(bootstrap_local_index())
     
     try:
         yield Crawl4AIContext(
             crawler=crawler,
             supabase_client=supabase_client,
-            reranking_model=reranking_model
+            reranker=reranker,
+            validator_store=validator_store,
+            crawl_scheduler=crawl_scheduler,
+            static_fetcher=static_fetcher,
+            checkpoint_store=checkpoint_store
         )
     finally:
         # Clean up the crawler
         await crawler.__aexit__(None, None, None)
+        if validator_store:
+            validator_store.close()
+        if checkpoint_store:
+            checkpoint_store.close()
+        if reranker:
+            reranker.close()
+        if static_fetcher:
+            await static_fetcher.close()
+        if local_index:
+            if bootstrap_task:
+                local_index.cancel_bootstrap()
+                await bootstrap_task
+            local_index.close()
 
 # Initialize FastMCP server
 mcp = FastMCP(
@@ -103,12 +226,12 @@ mcp = FastMCP(
     port=os.getenv("PORT", "8051")
 )
 
-def rerank_results(model: CrossEncoder, query: str, results: List[Dict[str, Any]], content_key: str = "content") -> List[Dict[str, Any]]:
+async def rerank_results(reranker: RerankEngine, query: str, results: List[Dict[str, Any]], content_key: str = "content") -> List[Dict[str, Any]]:
     """
-    Rerank search results using a cross-encoder model.
+    Rerank search results using the cross-encoder engine.
     
     Args:
-        model: The cross-encoder model to use for reranking
+        reranker: The rerank engine to score with
         query: The search query
         results: List of search results
         content_key: The key in each result dict that contains the text content
@@ -116,30 +239,54 @@ def rerank_results(model: CrossEncoder, query: str, results: List[Dict[str, Any]
     Returns:
         Reranked list of results
     """
-    if not model or not results:
-        return results
+    return (await rerank_result_sets(reranker, [query], [results], content_key))[0]
+
+async def rerank_result_sets(
+    reranker: RerankEngine,
+    queries: List[str],
+    result_sets: List[List[Dict[str, Any]]],
+    content_key: str = "content"
+) -> List[List[Dict[str, Any]]]:
+    """
+    Rerank the results of several queries in a single cross-encoder request.
     
-    try:
-        # Extract content from results
-        texts = [result.get(content_key, "") for result in results]
-        
-        # Create pairs of [query, document] for the cross-encoder
-        pairs = [[query, text] for text in texts]
+    Args:
+        reranker: The rerank engine to score with
+        queries: The search queries
+        result_sets: List of search results for each query
+        content_key: The key in each result dict that contains the text content
         
-        # Get relevance scores from the cross-encoder
-        scores = model.predict(pairs)
+    Returns:
+        Reranked list of results for each query
+    """
+    if not reranker or not any(result_sets):
+        return result_sets
+    
+    try:
+        # Create pairs of [query, document] for every query at once; normalizing the query
+        # lets trivially different spellings share cached scores
+        pairs = [
+            [normalize_query(query), result.get(content_key, "")]
+            for query, results in zip(queries, result_sets)
+            for result in results
+        ]
         
-        # Add scores to results and sort by score (descending)
-        for i, result in enumerate(results):
-            result["rerank_score"] = float(scores[i])
+        # Get relevance scores from the engine's worker thread
+        scores = await reranker.score(pairs)
         
-        # Sort by rerank score
-        reranked = sorted(results, key=lambda x: x.get("rerank_score", 0), reverse=True)
+        # Add scores to results and sort each query's results by score (descending)
+        reranked_sets = []
+        offset = 0
+        for results in result_sets:
+            for i, result in enumerate(results):
+                result["rerank_score"] = scores[offset + i]
+            offset += len(results)
+            reranked_sets.append(sorted(results, key=lambda x: x.get("rerank_score", 0), reverse=True))
         
-        return reranked
+        return reranked_sets
     except Exception as e:
         print(f"Error during reranking: {e}")
-        return results
+        return result_sets
 
 import re
 
@@ -154,8 +301,9 @@ def is_sitemap(url: str) -> bool:
         True if the URL is a sitemap, False otherwise
     """
     parsed = urlparse(url)
-    # Match if the last path segment is 'sitemap' or 'sitemap' with an extension (e.g., sitemap.xml, sitemap.gz)
-    sitemap_pattern = re.compile(r'^sitemap(\.[a-zA-Z0-9]+)?$')
+    # Match if the last path segment is 'sitemap', optionally with a suffix and an extension
+    # (e.g., sitemap.xml, sitemap_index.xml, sitemap-pages.xml.gz)
+    sitemap_pattern = re.compile(r'^sitemap[\w-]*(\.[a-zA-Z0-9]+)?(\.gz)?$')
     path_segments = [segment for segment in parsed.path.split('/') if segment]
     return bool(path_segments and sitemap_pattern.match(path_segments[-1]))
 
@@ -171,27 +319,103 @@ def is_txt(url: str) -> bool:
     """
     return url.endswith('.txt')
 
-def parse_sitemap(sitemap_url: str) -> List[str]:
+def normalize_url(url: str) -> str:
     """
-    Parse a sitemap and extract URLs.
+    Normalize a URL for deduplication by removing its fragment.
     
     Args:
-        sitemap_url: URL of the sitemap
+        url: URL to normalize
         
     Returns:
-        List of URLs found in the sitemap
+        The URL without its fragment
     """
-    resp = requests.get(sitemap_url)
-    urls = []
+    return urldefrag(url)[0]
 
-    if resp.status_code == 200:
-        try:
-            tree = ElementTree.fromstring(resp.content)
-            urls = [loc.text for loc in tree.findall('.//{*}loc')]
-        except Exception as e:
-            print(f"Error parsing sitemap XML: {e}")
+def page_from_result(result, lastmod: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Build the page dictionary passed to the ingestion pipeline from a crawl result,
+    including the validators recorded once the page has been stored.
+    
+    Args:
+        result: crawl4ai CrawlResult
+        lastmod: Sitemap <lastmod> the page was crawled under, if any
+        
+    Returns:
+        Dictionary with URL, markdown content and validators
+    """
+    headers = {key.lower(): value for key, value in (result.response_headers or {}).items()}
+    return {
+        'url': result.url,
+        'markdown': result.markdown,
+        'validators': {
+            'etag': headers.get('etag'),
+            'last_modified': headers.get('last-modified'),
+            'lastmod': lastmod,
+            'links': [normalize_url(link["href"]) for link in result.links.get("internal", [])]
+        }
+    }
+
+async def revalidate_urls(
+    validator_store: ValidatorStore,
+    urls: List[str],
+    lastmods: Optional[Dict[str, Optional[str]]] = None
+) -> Tuple[List[str], List[str]]:
+    """
+    Decide which URLs need to be crawled again, without rendering them.
+    
+    A URL is unchanged if its sitemap <lastmod> matches the one recorded at the last crawl,
+    or if a conditional GET with the recorded ETag / Last-Modified returns 304. URLs that were
+    never recorded, or whose validators can't prove they are unchanged, are crawled.
+    
+    Args:
+        validator_store: Store of validators recorded at previous crawls
+        urls: URLs to revalidate
+        lastmods: Optional mapping of URL to its current sitemap <lastmod>
+        
+    Returns:
+        Tuple of (changed URLs, unchanged URLs)
+    """
+    lastmods = lastmods or {}
+    records = await asyncio.to_thread(validator_store.get_many, urls)
+    changed = []
+    unchanged = []
+    to_check = []
+
+    for url in urls:
+        record = records.get(url)
+        lastmod = lastmods.get(url)
+        if record is None:
+            changed.append(url)
+        elif lastmod:
+            # The sitemap tells us directly whether the page changed
+            (unchanged if record["lastmod"] == lastmod else changed).append(url)
+        elif record["etag"] or record["last_modified"]:
+            to_check.append(url)
+        else:
+            changed.append(url)
+
+    if to_check:
+        async with httpx.AsyncClient(follow_redirects=True, timeout=REVALIDATION_TIMEOUT) as client:
+            async def is_unchanged(url: str) -> bool:
+                headers = {}
+                if records[url]["etag"]:
+                    headers["If-None-Match"] = records[url]["etag"]
+                if records[url]["last_modified"]:
+                    headers["If-Modified-Since"] = records[url]["last_modified"]
+                try:
+                    # Only the status line is needed; the body is never read
+                    async with client.stream("GET", url, headers=headers) as response:
+                        return response.status_code == 304
+                except Exception as e:
+                    print(f"Conditional request failed for {url}: {e}")
+                    return False
 
-    return urls
+            results = await gather_bounded([is_unchanged(url) for url in to_check], REVALIDATION_MAX_CONCURRENCY)
+        for url, not_modified in zip(to_check, results):
+            (unchanged if not_modified else changed).append(url)
+
+    print(f"Revalidated {len(urls)} URLs: {len(changed)} to crawl, {len(unchanged)} unchanged")
+    return changed, unchanged
 
 def smart_chunk_markdown(text: str, chunk_size: int = 5000) -> List[str]:
     """Split text into chunks, respecting code blocks and paragraphs."""
@@ -257,19 +481,517 @@ def extract_section_info(chunk: str) -> Dict[str, Any]:
         "word_count": len(chunk.split())
     }
 
-def process_code_example(args):
+# Bounds for conditional revalidation of previously crawled URLs
+REVALIDATION_MAX_CONCURRENCY = int(os.getenv("REVALIDATION_MAX_CONCURRENCY", "20"))
+REVALIDATION_TIMEOUT = float(os.getenv("REVALIDATION_TIMEOUT", "10"))
+
+# Bounds for the streaming ingestion pipeline used by smart_crawl_url
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "8"))
+PIPELINE_STORE_WORKERS = int(os.getenv("PIPELINE_STORE_WORKERS", "2"))
+PIPELINE_FLUSH_CHUNKS = int(os.getenv("PIPELINE_FLUSH_CHUNKS", "256"))
+
+async def store_code_examples(supabase_client: AsyncClient, url: str, markdown: str) -> int:
+    """
+    Extract code examples from a page, summarize them and store them in Supabase.
+    
+    Args:
+        supabase_client: Supabase client
+        url: URL of the page
+        markdown: Markdown content of the page
+        
+    Returns:
+        Number of code examples stored
+    """
+    code_blocks = extract_code_blocks(markdown)
+    if not code_blocks:
+        # The page may have had code examples on a previous crawl
+        await prune_chunks(supabase_client, 'code_examples', {url: 0})
+        return 0
+
+    # Generate summaries concurrently with a bounded number of requests in flight
+    summaries = await gather_bounded(
+        [generate_code_example_summary(block['code'], block['context_before'], block['context_after'])
+         for block in code_blocks],
+        CONTEXTUAL_MAX_CONCURRENCY
+    )
+
+    parsed_url = urlparse(url)
+    source_id = parsed_url.netloc or parsed_url.path
+
+    code_urls = []
+    code_chunk_numbers = []
+    code_examples = []
+    code_summaries = []
+    code_metadatas = []
+    for i, (block, summary) in enumerate(zip(code_blocks, summaries)):
+        code_urls.append(url)
+        code_chunk_numbers.append(i)
+        code_examples.append(block['code'])
+        code_summaries.append(summary)
+        
+        # Create metadata for code example
+        code_metadatas.append({
+            "chunk_index": i,
+            "url": url,
+            "source": source_id,
+            "char_count": len(block['code']),
+            "word_count": len(block['code'].split())
+        })
+
+    await add_code_examples_to_supabase(
+        supabase_client, 
+        code_urls, 
+        code_chunk_numbers, 
+        code_examples, 
+        code_summaries, 
+        code_metadatas
+    )
+    return len(code_examples)
+
+async def run_ingestion_pipeline(
+    supabase_client: AsyncClient,
+    pages: AsyncIterator[Dict[str, Any]],
+    crawl_type: str,
+    chunk_size: int = 5000,
+    validator_store: Optional[ValidatorStore] = None,
+    checkpoint_store: Optional[CrawlCheckpointStore] = None,
+    crawl_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Stream crawled pages through chunking and storage while the crawl is still running.
+    
+    The crawl, chunk and store stages are connected by bounded queues, so pages are
+    contextualized, embedded and inserted while others are still being fetched, and at most
+    PIPELINE_QUEUE_SIZE pages per stage are held in memory. Several store workers run
+    concurrently and each flushes the chunks of all pages waiting for it at once.
+    Pages marked unchanged by revalidation are counted and skipped. With a checkpoint store,
+    the frontier URL of each page is marked ingested once its chunks are stored.
+    
+    Args:
+        supabase_client: Supabase client
+        pages: Async iterator of dictionaries with URL and markdown content
+        crawl_type: Crawl type recorded in chunk metadata
+        chunk_size: Maximum size of each content chunk in characters
+        validator_store: Optional store in which the validators of stored pages are recorded
+        checkpoint_store: Optional store in which stored pages are checkpointed
+        crawl_id: Id of the crawl in the checkpoint store
+        
+    Returns:
+        Dictionary with pipeline statistics
+    """
+    page_queue: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    store_queue: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    extract_code_examples_enabled = os.getenv("USE_AGENTIC_RAG", "false") == "true"
+    crawl_time = str(asyncio.current_task().get_coro().__name__)
+
+    stats = {
+        "pages_crawled": 0,
+        "pages_unchanged": 0,
+        "chunks_stored": 0,
+        "chunks_unchanged": 0,
+        "code_examples_stored": 0,
+        "urls_crawled": []
+    }
+    source_summaries: Dict[str, str] = {}
+    source_word_counts: Dict[str, int] = {}
+
+    async def crawl_stage() -> None:
+        try:
+            async for page in pages:
+                await page_queue.put(page)
+        finally:
+            await page_queue.put(None)
+
+    async def chunk_stage() -> None:
+        try:
+            while True:
+                page = await page_queue.get()
+                if page is None:
+                    break
+                if page.get('unchanged'):
+                    stats["pages_unchanged"] += 1
+                    continue
+                try:
+                    source_url = page['url']
+                    md = page['markdown']
+                    chunks = smart_chunk_markdown(md, chunk_size=chunk_size)
+
+                    # Extract source_id
+                    parsed_url = urlparse(source_url)
+                    source_id = parsed_url.netloc or parsed_url.path
+
+                    metadatas = []
+                    page_word_count = 0
+                    for i, chunk in enumerate(chunks):
+                        # Extract metadata
+                        meta = extract_section_info(chunk)
+                        meta["chunk_index"] = i
+                        meta["url"] = source_url
+                        meta["source"] = source_id
+                        meta["crawl_type"] = crawl_type
+                        meta["crawl_time"] = crawl_time
+                        metadatas.append(meta)
+                        page_word_count += meta.get("word_count", 0)
+
+                    # Create the source the first time we see it (before inserting its documents)
+                    if source_id not in source_summaries:
+                        source_summaries[source_id] = await extract_source_summary(source_id, md[:5000])
+                        source_word_counts[source_id] = 0
+                        await update_source_info(supabase_client, source_id, source_summaries[source_id], page_word_count)
+                    source_word_counts[source_id] += page_word_count
+
+                    stats["pages_crawled"] += 1
+                    if len(stats["urls_crawled"]) < 5:
+                        stats["urls_crawled"].append(source_url)
+
+                    await store_queue.put({
+                        'url': source_url,
+                        'markdown': md,
+                        'chunks': chunks,
+                        'metadatas': metadatas,
+                        'validators': page.get('validators'),
+                        'crawl_url': page.get('crawl_url')
+                    })
+                except Exception as e:
+                    print(f"Error chunking page {page.get('url')}: {e}")
+        finally:
+            for _ in range(PIPELINE_STORE_WORKERS):
+                await store_queue.put(None)
+
+    async def store_stage() -> None:
+        done = False
+        while not done:
+            item = await store_queue.get()
+            if item is None:
+                break
+
+            # Flush every page already waiting for storage together, up to the chunk budget
+            items = [item]
+            pending_chunks = len(item['chunks'])
+            while pending_chunks < PIPELINE_FLUSH_CHUNKS and not store_queue.empty():
+                next_item = store_queue.get_nowait()
+                if next_item is None:
+                    done = True
+                    break
+                items.append(next_item)
+                pending_chunks += len(next_item['chunks'])
+
+            urls = []
+            chunk_numbers = []
+            contents = []
+            metadatas = []
+            for page in items:
+                for i, chunk in enumerate(page['chunks']):
+                    urls.append(page['url'])
+                    chunk_numbers.append(i)
+                    contents.append(chunk)
+                    metadatas.append(page['metadatas'][i])
+            url_to_full_document = {page['url']: page['markdown'] for page in items}
+
+            try:
+                ingest_stats = await add_documents_to_supabase(supabase_client, urls, chunk_numbers, contents, metadatas, url_to_full_document)
+                stats["chunks_stored"] += ingest_stats["inserted"]
+                stats["chunks_unchanged"] += ingest_stats["unchanged"]
+            except Exception as e:
+                print(f"Error storing documents for {len(items)} pages: {e}")
+                continue
+
+            # Record validators only once a page is stored, so a failed store is retried next crawl.
+            # They are keyed by the frontier URL, which is what the next crawl looks up after a redirect.
+            if validator_store:
+                for page in items:
+                    if page['validators']:
+                        try:
+                            await asyncio.to_thread(validator_store.record, page['crawl_url'] or page['url'], **page['validators'])
+                        except Exception as e:
+                            print(f"Error recording validators for {page['url']}: {e}")
+
+            # Checkpoint pages only once they are stored, so a resumed crawl fetches the rest again
+            if checkpoint_store:
+                try:
+                    await asyncio.to_thread(
+                        checkpoint_store.set_status, crawl_id, [page['crawl_url'] for page in items if page['crawl_url']], "ingested"
+                    )
+                except Exception as e:
+                    print(f"Error checkpointing {len(items)} pages of crawl {crawl_id}: {e}")
+
+            if extract_code_examples_enabled:
+                for page in items:
+                    try:
+                        stats["code_examples_stored"] += await store_code_examples(supabase_client, page['url'], page['markdown'])
+                    except Exception as e:
+                        print(f"Error storing code examples for {page['url']}: {e}")
+
+    stage_results = await asyncio.gather(
+        crawl_stage(),
+        chunk_stage(),
+        *(store_stage() for _ in range(PIPELINE_STORE_WORKERS)),
+        return_exceptions=True
+    )
+
+    # Record the final word counts now that every page of each source has been seen
+    for source_id, summary in source_summaries.items():
+        await update_source_info(supabase_client, source_id, summary, source_word_counts[source_id])
+
+    # Surface a failed crawl only after the pages fetched before the failure have been stored
+    for result in stage_results:
+        if isinstance(result, Exception):
+            raise result
+
+    stats["sources_updated"] = len(source_summaries)
+    return stats
+
+def format_document_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Format a crawled_pages search result for a RAG tool response.
+    
+    Args:
+        result: Row returned by search_documents, possibly reranked
+        
+    Returns:
+        Dictionary with URL, content, metadata and scores
+    """
+    formatted_result = {
+        "url": result.get("url"),
+        "chunk_number": result.get("chunk_number"),
+        "content": result.get("content"),
+        "metadata": result.get("metadata"),
+        "similarity": result.get("similarity")
+    }
+    # Include fusion and rerank scores if available
+    if "rrf_score" in result:
+        formatted_result["rrf_score"] = result["rrf_score"]
+    if "rerank_score" in result:
+        formatted_result["rerank_score"] = result["rerank_score"]
+    return formatted_result
+
+def format_code_example_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Format a code_examples search result for a tool response.
+    
+    Args:
+        result: Row returned by search_code_examples, possibly reranked
+        
+    Returns:
+        Dictionary with URL, code, summary, metadata and scores
+    """
+    formatted_result = {
+        "url": result.get("url"),
+        "chunk_number": result.get("chunk_number"),
+        "code": result.get("content"),
+        "summary": result.get("summary"),
+        "metadata": result.get("metadata"),
+        "source_id": result.get("source_id"),
+        "similarity": result.get("similarity")
+    }
+    # Include fusion and rerank scores if available
+    if "rrf_score" in result:
+        formatted_result["rrf_score"] = result["rrf_score"]
+    if "rerank_score" in result:
+        formatted_result["rerank_score"] = result["rerank_score"]
+    return formatted_result
+
+# Response modes of the search tools and the fields each returns when no fields are selected
+RESPONSE_MODES = ("full", "snippet")
+SNIPPET_DEFAULT_FIELDS = ("url", "chunk_number", "snippet", "summary", "similarity", "rrf_score", "rerank_score")
+SNIPPET_CHARS = int(os.getenv("SNIPPET_CHARS", "300"))
+
+def snippet_window(content: str, query: str, max_chars: int = SNIPPET_CHARS) -> str:
+    """
+    Cut the window of a chunk that best matches a query.
+    
+    The window of max_chars characters containing the most query term occurrences
+    (distinct terms first) is centered on those matches and snapped to word boundaries.
+    Without any match the window is the start of the chunk.
+    
+    Args:
+        content: Full chunk content
+        query: Search query
+        max_chars: Maximum length of the window, without the ellipses
+        
+    Returns:
+        The snippet, with "..." marking text cut on either side
+    """
+    if len(content) <= max_chars:
+        return content
+    
+    terms = {term for term in re.findall(r"\w+", query.lower()) if len(term) > 1}
+    matches = [
+        (match.start(), match.end(), match.group().lower())
+        for match in re.finditer(r"\w+", content)
+        if match.group().lower() in terms
+    ] if terms else []
+    
+    start = 0
+    if matches:
+        # Slide over the matches, keeping every match that fits in one window
+        best = (0, 0, 0, 0)  # (distinct terms, occurrences, first match, last match)
+        left = 0
+        for right in range(len(matches)):
+            while matches[right][1] - matches[left][0] > max_chars:
+                left += 1
+            window = matches[left:right + 1]
+            score = (len({term for _, _, term in window}), len(window))
+            if score > best[:2]:
+                best = (score[0], score[1], left, right)
+        span_start, span_end = matches[best[2]][0], matches[best[3]][1]
+        start = max(0, min(span_start - (max_chars - (span_end - span_start)) // 2, len(content) - max_chars))
+    end = min(len(content), start + max_chars)
+    
+    # Snap both ends to word boundaries so the snippet does not start or end mid-word
+    if start > 0:
+        space = content.find(" ", start, start + 20)
+        start = space + 1 if space != -1 else start
+    if end < len(content):
+        space = content.rfind(" ", end - 20, end)
+        end = space if space > start else end
+    
+    return ("..." if start > 0 else "") + content[start:end].strip() + ("..." if end < len(content) else "")
+
+def shape_results(
+    results: List[Dict[str, Any]],
+    query: str,
+    response_mode: str = "full",
+    fields: Optional[List[str]] = None,
+    content_key: str = "content"
+) -> List[Dict[str, Any]]:
+    """
+    Shape formatted search results for a tool response.
+    
+    "full" returns every field; "snippet" replaces the content by a window around the best
+    matching span and drops the metadata. Selected fields restrict either mode further;
+    "snippet" can also be selected in full mode. Fields a result does not have are ignored.
+    
+    Args:
+        results: Formatted results, as cached by the search tools
+        query: Search query the snippets are centered on
+        response_mode: "full" or "snippet"
+        fields: Optional list of fields to return
+        content_key: Field holding the chunk content
+        
+    Returns:
+        New list of results; the input results are not modified
+    """
+    if response_mode == "full" and not fields:
+        return results
+    
+    selected = list(fields) if fields else list(SNIPPET_DEFAULT_FIELDS)
+    shaped_results = []
+    for result in results:
+        shaped = dict(result)
+        if "snippet" in selected and result.get(content_key) is not None:
+            shaped["snippet"] = snippet_window(result[content_key], query)
+        shaped_results.append({field: shaped[field] for field in selected if field in shaped})
+    return shaped_results
+
+def dump_response(payload: Dict[str, Any], compact: bool = False) -> str:
     """
-    Process a single code example to generate its summary.
-    This function is designed to be used with concurrent.futures.
+    Serialize a tool response.
     
     Args:
-        args: Tuple containing (code, context_before, context_after)
+        payload: Response dictionary
+        compact: Emit JSON without indentation or spaces after separators
         
     Returns:
-        The generated summary
+        JSON string
     """
-    code, context_before, context_after = args
-    return generate_code_example_summary(code, context_before, context_after)
+    if compact:
+        return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+    return json.dumps(payload, indent=2)
+
+def cursor_scope(*parts: Any) -> str:
+    """
+    Fingerprint what a cursor pages through, so it cannot be replayed against another query.
+    
+    Args:
+        parts: Table, normalized query, source filter, ...
+        
+    Returns:
+        Short hex digest of the parts
+    """
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:16]
+
+def encode_cursor(payload: Dict[str, Any]) -> str:
+    """
+    Encode a keyset position as an opaque cursor.
+    
+    Args:
+        payload: Scope and position of the last row of a page
+        
+    Returns:
+        URL-safe cursor string
+    """
+    data = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, scope: str) -> Dict[str, Any]:
+    """
+    Decode a cursor produced by encode_cursor.
+    
+    Args:
+        cursor: Cursor returned by a previous call
+        scope: Scope the cursor must belong to
+        
+    Returns:
+        The cursor payload
+        
+    Raises:
+        ValueError: If the cursor is malformed or was issued for a different query
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(payload, dict) or payload.get("scope") != scope:
+        raise ValueError("Cursor was issued for a different query or source filter")
+    return payload
+
+def next_page_cursor(
+    results: List[Dict[str, Any]],
+    match_count: int,
+    scope: str,
+    after: Optional[Dict[str, Any]] = None
+) -> Optional[str]:
+    """
+    Build the cursor of the page following a page of vector search results.
+    
+    The keyset is the last row in (similarity desc, url, chunk_number) order, which is not
+    necessarily the last row returned once the page has been reranked. The cursor also counts
+    the rows returned so far, which the database over-fetches from its vector index.
+    
+    Args:
+        results: Formatted results of the page
+        match_count: Requested page size
+        scope: Scope of the search
+        after: Decoded cursor the page was started after, if any
+        
+    Returns:
+        Cursor of the next page, or None if this page was the last one
+    """
+    if not results or len(results) < match_count:
+        return None
+    last = max(results, key=lambda result: (-(result.get("similarity") or 0.0), result.get("url") or "", result.get("chunk_number") or 0))
+    return encode_cursor({
+        "scope": scope,
+        "similarity": last.get("similarity"),
+        "url": last.get("url"),
+        "chunk_number": last.get("chunk_number"),
+        "offset": (after or {}).get("offset", 0) + len(results)
+    })
+
+def validate_response_mode(response_mode: str) -> Optional[str]:
+    """
+    Check a response_mode argument.
+    
+    Args:
+        response_mode: Requested response mode
+        
+    Returns:
+        Error message, or None if the mode is valid
+    """
+    if response_mode not in RESPONSE_MODES:
+        return f"Unknown response_mode '{response_mode}', expected one of: {', '.join(RESPONSE_MODES)}"
+    return None
 
 @mcp.tool()
 async def crawl_single_page(ctx: Context, url: str) -> str:
@@ -332,64 +1054,24 @@ async def crawl_single_page(ctx: Context, url: str) -> str:
             url_to_full_document = {url: result.markdown}
             
             # Update source information FIRST (before inserting documents)
-            source_summary = extract_source_summary(source_id, result.markdown[:5000])  # Use first 5000 chars for summary
-            update_source_info(supabase_client, source_id, source_summary, total_word_count)
+            source_summary = await extract_source_summary(source_id, result.markdown[:5000])  # Use first 5000 chars for summary
+            await update_source_info(supabase_client, source_id, source_summary, total_word_count)
             
             # Add documentation chunks to Supabase (AFTER source exists)
-            add_documents_to_supabase(supabase_client, urls, chunk_numbers, contents, metadatas, url_to_full_document)
+            ingest_stats = await add_documents_to_supabase(supabase_client, urls, chunk_numbers, contents, metadatas, url_to_full_document)
             
             # Extract and process code examples only if enabled
+            code_examples_stored = 0
             extract_code_examples = os.getenv("USE_AGENTIC_RAG", "false") == "true"
             if extract_code_examples:
-                code_blocks = extract_code_blocks(result.markdown)
-                if code_blocks:
-                    code_urls = []
-                    code_chunk_numbers = []
-                    code_examples = []
-                    code_summaries = []
-                    code_metadatas = []
-                    
-                    # Process code examples in parallel
-                    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                        # Prepare arguments for parallel processing
-                        summary_args = [(block['code'], block['context_before'], block['context_after']) 
-                                        for block in code_blocks]
-                        
-                        # Generate summaries in parallel
-                        summaries = list(executor.map(process_code_example, summary_args))
-                    
-                    # Prepare code example data
-                    for i, (block, summary) in enumerate(zip(code_blocks, summaries)):
-                        code_urls.append(url)
-                        code_chunk_numbers.append(i)
-                        code_examples.append(block['code'])
-                        code_summaries.append(summary)
-                        
-                        # Create metadata for code example
-                        code_meta = {
-                            "chunk_index": i,
-                            "url": url,
-                            "source": source_id,
-                            "char_count": len(block['code']),
-                            "word_count": len(block['code'].split())
-                        }
-                        code_metadatas.append(code_meta)
-                    
-                    # Add code examples to Supabase
-                    add_code_examples_to_supabase(
-                        supabase_client, 
-                        code_urls, 
-                        code_chunk_numbers, 
-                        code_examples, 
-                        code_summaries, 
-                        code_metadatas
-                    )
+                code_examples_stored = await store_code_examples(supabase_client, url, result.markdown)
             
             return json.dumps({
                 "success": True,
                 "url": url,
-                "chunks_stored": len(chunks),
-                "code_examples_stored": len(code_blocks) if code_blocks else 0,
+                "chunks_stored": ingest_stats["inserted"],
+                "chunks_unchanged": ingest_stats["unchanged"],
+                "code_examples_stored": code_examples_stored,
                 "content_length": len(result.markdown),
                 "total_word_count": total_word_count,
                 "source_id": source_id,
@@ -412,7 +1094,7 @@ async def crawl_single_page(ctx: Context, url: str) -> str:
         }, indent=2)
 
 @mcp.tool()
-async def smart_crawl_url(ctx: Context, url: str, max_depth: int = 3, max_concurrent: int = 10, chunk_size: int = 5000) -> str:
+async def smart_crawl_url(ctx: Context, url: str, max_depth: int = 3, max_concurrent: int = 10, chunk_size: int = 5000, crawl_id: str = None) -> str:
     """
     Intelligently crawl a URL based on its type and store content in Supabase.
     
@@ -422,6 +1104,12 @@ async def smart_crawl_url(ctx: Context, url: str, max_depth: int = 3, max_concur
     - For regular webpages: Recursively crawls internal links up to the specified depth
     
     All crawled content is chunked and stored in Supabase for later retrieval and querying.
+    Pages are stored as they are crawled rather than after the whole crawl has finished.
+    
+    Crawls are checkpointed as they go: call again with the crawl_id of a crawl that was
+    interrupted (server restart, timeout) to resume it, skipping pages already stored. A
+    resumed crawl keeps the max_depth and chunk_size it was started with. Pass your own
+    crawl_id up front to be able to resume a call that never returned.
     
     Args:
         ctx: The MCP server provided context
@@ -429,6 +1117,7 @@ async def smart_crawl_url(ctx: Context, url: str, max_depth: int = 3, max_concur
         max_depth: Maximum recursion depth for regular URLs (default: 3)
         max_concurrent: Maximum number of concurrent browser sessions (default: 10)
         chunk_size: Maximum size of each content chunk in characters (default: 1000)
+        crawl_id: Id of the crawl to resume, or to start under (default: a new id)
     
     Returns:
         JSON string with crawl summary and storage information
@@ -437,178 +1126,116 @@ async def smart_crawl_url(ctx: Context, url: str, max_depth: int = 3, max_concur
         # Get the crawler from the context
         crawler = ctx.request_context.lifespan_context.crawler
         supabase_client = ctx.request_context.lifespan_context.supabase_client
+        validator_store = ctx.request_context.lifespan_context.validator_store
+        crawl_scheduler = ctx.request_context.lifespan_context.crawl_scheduler
+        static_fetcher = ctx.request_context.lifespan_context.static_fetcher
+        checkpoint_store = ctx.request_context.lifespan_context.checkpoint_store
+        
+        # Resume the crawl if it was started before, otherwise record it
+        resumed = False
+        completed = False
+        if checkpoint_store:
+            crawl = await asyncio.to_thread(checkpoint_store.get, crawl_id) if crawl_id else None
+            if crawl:
+                if crawl["url"] != url:
+                    return json.dumps({
+                        "success": False,
+                        "url": url,
+                        "crawl_id": crawl_id,
+                        "error": f"Crawl {crawl_id} was started for {crawl['url']}"
+                    }, indent=2)
+                resumed = True
+                completed = crawl["status"] == "completed"
+                max_depth = crawl["max_depth"]
+                chunk_size = crawl["chunk_size"]
+            else:
+                crawl_id = crawl_id or uuid.uuid4().hex
+                await asyncio.to_thread(checkpoint_store.start, crawl_id, url, max_depth, chunk_size)
+        elif crawl_id:
+            return json.dumps({
+                "success": False,
+                "url": url,
+                "crawl_id": crawl_id,
+                "error": "Resumable crawls are disabled. Set USE_CRAWL_CHECKPOINTS=true to use crawl_id."
+            }, indent=2)
         
         # Determine the crawl strategy
-        crawl_results = []
         crawl_type = None
+        sitemap_stats = {"entries": 0}
         
         if is_txt(url):
             # For text files, use simple crawl
-            crawl_results = await crawl_markdown_file(crawler, url)
+            pages = iterate_pages([] if completed else await crawl_markdown_file(crawler, url, static_fetcher=static_fetcher))
             crawl_type = "text_file"
         elif is_sitemap(url):
-            # For sitemaps, extract URLs and crawl in parallel
-            sitemap_urls = parse_sitemap(url)
-            if not sitemap_urls:
-                return json.dumps({
-                    "success": False,
-                    "url": url,
-                    "error": "No URLs found in sitemap"
-                }, indent=2)
-            crawl_results = await crawl_batch(crawler, sitemap_urls, max_concurrent=max_concurrent)
+            # For sitemaps, crawl pages while the sitemap (and any nested sitemaps) are still being parsed
+            pages = crawl_batch(
+                crawler,
+                count_entries(iter_sitemap_entries(url, max_concurrency=SITEMAP_MAX_CONCURRENCY), sitemap_stats),
+                max_concurrent=max_concurrent,
+                validator_store=validator_store,
+                scheduler=crawl_scheduler,
+                static_fetcher=static_fetcher,
+                checkpoint_store=checkpoint_store,
+                crawl_id=crawl_id
+            )
             crawl_type = "sitemap"
         else:
             # For regular URLs, use recursive crawl
-            crawl_results = await crawl_recursive_internal_links(crawler, [url], max_depth=max_depth, max_concurrent=max_concurrent)
+            pages = crawl_recursive_internal_links(
+                crawler, [url], max_depth=max_depth, max_concurrent=max_concurrent,
+                validator_store=validator_store, scheduler=crawl_scheduler, static_fetcher=static_fetcher,
+                checkpoint_store=checkpoint_store, crawl_id=crawl_id
+            )
             crawl_type = "webpage"
         
-        if not crawl_results:
+        # Chunk, embed and store pages while the crawl is still running
+        stats = await run_ingestion_pipeline(
+            supabase_client, pages, crawl_type, chunk_size=chunk_size, validator_store=validator_store,
+            checkpoint_store=checkpoint_store, crawl_id=crawl_id
+        )
+        if checkpoint_store:
+            await asyncio.to_thread(checkpoint_store.finish, crawl_id)
+        
+        # A resumed crawl may legitimately have nothing left to fetch
+        if not stats["pages_crawled"] and not stats["pages_unchanged"] and not resumed:
             return json.dumps({
                 "success": False,
                 "url": url,
-                "error": "No content found"
+                "crawl_id": crawl_id,
+                "error": "No URLs found in sitemap" if crawl_type == "sitemap" and not sitemap_stats["entries"] else "No content found"
             }, indent=2)
         
-        # Process results and store in Supabase
-        urls = []
-        chunk_numbers = []
-        contents = []
-        metadatas = []
-        chunk_count = 0
-        
-        # Track sources and their content
-        source_content_map = {}
-        source_word_counts = {}
-        
-        # Process documentation chunks
-        for doc in crawl_results:
-            source_url = doc['url']
-            md = doc['markdown']
-            chunks = smart_chunk_markdown(md, chunk_size=chunk_size)
-            
-            # Extract source_id
-            parsed_url = urlparse(source_url)
-            source_id = parsed_url.netloc or parsed_url.path
-            
-            # Store content for source summary generation
-            if source_id not in source_content_map:
-                source_content_map[source_id] = md[:5000]  # Store first 5000 chars
-                source_word_counts[source_id] = 0
-            
-            for i, chunk in enumerate(chunks):
-                urls.append(source_url)
-                chunk_numbers.append(i)
-                contents.append(chunk)
-                
-                # Extract metadata
-                meta = extract_section_info(chunk)
-                meta["chunk_index"] = i
-                meta["url"] = source_url
-                meta["source"] = source_id
-                meta["crawl_type"] = crawl_type
-                meta["crawl_time"] = str(asyncio.current_task().get_coro().__name__)
-                metadatas.append(meta)
-                
-                # Accumulate word count
-                source_word_counts[source_id] += meta.get("word_count", 0)
-                
-                chunk_count += 1
-        
-        # Create url_to_full_document mapping
-        url_to_full_document = {}
-        for doc in crawl_results:
-            url_to_full_document[doc['url']] = doc['markdown']
-        
-        # Update source information for each unique source FIRST (before inserting documents)
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            source_summary_args = [(source_id, content) for source_id, content in source_content_map.items()]
-            source_summaries = list(executor.map(lambda args: extract_source_summary(args[0], args[1]), source_summary_args))
-        
-        for (source_id, _), summary in zip(source_summary_args, source_summaries):
-            word_count = source_word_counts.get(source_id, 0)
-            update_source_info(supabase_client, source_id, summary, word_count)
-        
-        # Add documentation chunks to Supabase (AFTER sources exist)
-        batch_size = 20
-        add_documents_to_supabase(supabase_client, urls, chunk_numbers, contents, metadatas, url_to_full_document, batch_size=batch_size)
-        
-        # Extract and process code examples from all documents only if enabled
-        extract_code_examples_enabled = os.getenv("USE_AGENTIC_RAG", "false") == "true"
-        if extract_code_examples_enabled:
-            all_code_blocks = []
-            code_urls = []
-            code_chunk_numbers = []
-            code_examples = []
-            code_summaries = []
-            code_metadatas = []
-            
-            # Extract code blocks from all documents
-            for doc in crawl_results:
-                source_url = doc['url']
-                md = doc['markdown']
-                code_blocks = extract_code_blocks(md)
-                
-                if code_blocks:
-                    # Process code examples in parallel
-                    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                        # Prepare arguments for parallel processing
-                        summary_args = [(block['code'], block['context_before'], block['context_after']) 
-                                        for block in code_blocks]
-                        
-                        # Generate summaries in parallel
-                        summaries = list(executor.map(process_code_example, summary_args))
-                    
-                    # Prepare code example data
-                    parsed_url = urlparse(source_url)
-                    source_id = parsed_url.netloc or parsed_url.path
-                    
-                    for i, (block, summary) in enumerate(zip(code_blocks, summaries)):
-                        code_urls.append(source_url)
-                        code_chunk_numbers.append(len(code_examples))  # Use global code example index
-                        code_examples.append(block['code'])
-                        code_summaries.append(summary)
-                        
-                        # Create metadata for code example
-                        code_meta = {
-                            "chunk_index": len(code_examples) - 1,
-                            "url": source_url,
-                            "source": source_id,
-                            "char_count": len(block['code']),
-                            "word_count": len(block['code'].split())
-                        }
-                        code_metadatas.append(code_meta)
-            
-            # Add all code examples to Supabase
-            if code_examples:
-                add_code_examples_to_supabase(
-                    supabase_client, 
-                    code_urls, 
-                    code_chunk_numbers, 
-                    code_examples, 
-                    code_summaries, 
-                    code_metadatas,
-                    batch_size=batch_size
-                )
-        
         return json.dumps({
             "success": True,
             "url": url,
+            "crawl_id": crawl_id,
+            "resumed": resumed,
             "crawl_type": crawl_type,
-            "pages_crawled": len(crawl_results),
-            "chunks_stored": chunk_count,
-            "code_examples_stored": len(code_examples),
-            "sources_updated": len(source_content_map),
-            "urls_crawled": [doc['url'] for doc in crawl_results][:5] + (["..."] if len(crawl_results) > 5 else [])
+            "pages_crawled": stats["pages_crawled"],
+            "pages_unchanged": stats["pages_unchanged"],
+            "chunks_stored": stats["chunks_stored"],
+            "chunks_unchanged": stats["chunks_unchanged"],
+            "code_examples_stored": stats["code_examples_stored"],
+            "sources_updated": stats["sources_updated"],
+            "urls_crawled": stats["urls_crawled"] + (["..."] if stats["pages_crawled"] > 5 else []),
+            "checkpointed_urls": await asyncio.to_thread(checkpoint_store.counts, crawl_id) if checkpoint_store else None
         }, indent=2)
     except Exception as e:
+        # The crawl keeps its checkpoints and can be resumed with the same crawl_id
         return json.dumps({
             "success": False,
             "url": url,
+            "crawl_id": crawl_id,
             "error": str(e)
         }, indent=2)
 
+# Default and maximum number of sources returned by get_available_sources per call
+SOURCES_PAGE_SIZE = int(os.getenv("SOURCES_PAGE_SIZE", "100"))
+SOURCES_MAX_PAGE_SIZE = 1000
+
 @mcp.tool()
-async def get_available_sources(ctx: Context) -> str:
+async def get_available_sources(ctx: Context, cursor: str = None, limit: int = SOURCES_PAGE_SIZE) -> str:
     """
     Get all available sources from the sources table.
     
@@ -619,8 +1246,12 @@ async def get_available_sources(ctx: Context) -> str:
     Always use this tool before calling the RAG query or code example query tool
     with a specific source filter!
     
+    Sources are returned in pages ordered by source_id; pass next_cursor back to get the next page.
+    
     Args:
         ctx: The MCP server provided context
+        cursor: Optional next_cursor of a previous call, to get the following page of sources
+        limit: Maximum number of sources to return (default: 100, at most 1000)
     
     Returns:
         JSON string with the list of available sources and their details
@@ -628,17 +1259,27 @@ async def get_available_sources(ctx: Context) -> str:
     try:
         # Get the Supabase client from the context
         supabase_client = ctx.request_context.lifespan_context.supabase_client
+        limit = max(1, min(limit, SOURCES_MAX_PAGE_SIZE))
+        scope = cursor_scope("sources")
         
-        # Query the sources table directly
-        result = supabase_client.from_('sources')\
-            .select('*')\
+        # Query the sources table directly, continuing after the last source_id of the previous page
+        query_builder = supabase_client.from_('sources').select('*')
+        if cursor:
+            query_builder = query_builder.gt('source_id', decode_cursor(cursor, scope)["source_id"])
+        result = await query_builder\
             .order('source_id')\
+            .limit(limit + 1)\
             .execute()
         
+        # One extra row tells whether there is a next page
+        rows = result.data or []
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
         # Format the sources with their details
         sources = []
-        if result.data:
-            for source in result.data:
+        if rows:
+            for source in rows:
                 sources.append({
                     "source_id": source.get("source_id"),
                     "summary": source.get("summary"),
@@ -650,7 +1291,8 @@ async def get_available_sources(ctx: Context) -> str:
         return json.dumps({
             "success": True,
             "sources": sources,
-            "count": len(sources)
+            "count": len(sources),
+            "next_cursor": encode_cursor({"scope": scope, "source_id": sources[-1]["source_id"]}) if has_more else None
         }, indent=2)
     except Exception as e:
         return json.dumps({
@@ -659,7 +1301,52 @@ async def get_available_sources(ctx: Context) -> str:
         }, indent=2)
 
 @mcp.tool()
-async def perform_rag_query(ctx: Context, query: str, source: str = None, match_count: int = 5) -> str:
+async def get_cache_stats(ctx: Context) -> str:
+    """
+    Get hit-rate statistics for the server's embedding caches.
+    
+    Reports the on-disk embedding cache used during ingestion, the in-process
+    query embedding cache shared by the RAG query and code example search tools,
+    the result cache in front of both tools, the rerank score cache and the
+    local vector index, along with the batching counters of the reranking engine,
+    the adaptive crawl limits learned for each host and the pages fetched without
+    the browser.
+    
+    Args:
+        ctx: The MCP server provided context
+    
+    Returns:
+        JSON string with the statistics of each enabled cache
+    """
+    caches = {
+        "embedding_cache": get_embedding_cache(),
+        "query_embedding_cache": get_query_embedding_cache(),
+        "result_cache": get_result_cache(),
+        "local_vector_index": get_local_vector_index()
+    }
+    reranker = ctx.request_context.lifespan_context.reranker
+    caches["rerank_score_cache"] = reranker.score_cache if reranker else None
+    crawl_scheduler = ctx.request_context.lifespan_context.crawl_scheduler
+    static_fetcher = ctx.request_context.lifespan_context.static_fetcher
+    return json.dumps({
+        "success": True,
+        "caches": {name: cache.stats() if cache else None for name, cache in caches.items()},
+        "reranker": reranker.stats() if reranker else None,
+        "crawl_hosts": crawl_scheduler.stats() if crawl_scheduler else {},
+        "static_fetch": static_fetcher.stats() if static_fetcher else None
+    }, indent=2)
+
+@mcp.tool()
+async def perform_rag_query(
+    ctx: Context,
+    query: str,
+    source: str = None,
+    match_count: int = 5,
+    response_mode: str = "full",
+    fields: List[str] = None,
+    compact: bool = False,
+    cursor: str = None
+) -> str:
     """
     Perform a RAG (Retrieval Augmented Generation) query on the stored content.
     
@@ -667,15 +1354,28 @@ async def perform_rag_query(ctx: Context, query: str, source: str = None, match_
     the matching documents. Optionally filter by source domain.
     Get the source by using the get_available_sources tool before calling this search!
     
+    Use response_mode="snippet" to get a short window of each chunk around the best matching
+    text instead of the full content, then fetch the chunks you need with get_chunk.
+    To see more results, pass the returned next_cursor back with the same query and source
+    (vector search only).
+    
     Args:
         ctx: The MCP server provided context
         query: The search query
         source: Optional source domain to filter results (e.g., 'example.com')
         match_count: Maximum number of results to return (default: 5)
+        response_mode: "full" (default) returns content and metadata, "snippet" returns url, chunk_number, snippet and scores
+        fields: Optional list of result fields to return (e.g. ["url", "chunk_number", "snippet"])
+        compact: If true, return JSON without indentation
+        cursor: Optional next_cursor of a previous call, to get the following page of results
     
     Returns:
         JSON string with the search results
     """
+    error = validate_response_mode(response_mode)
+    if error:
+        return json.dumps({"success": False, "query": query, "error": error}, indent=2)
+    
     try:
         # Get the Supabase client from the context
         supabase_client = ctx.request_context.lifespan_context.supabase_client
@@ -688,108 +1388,56 @@ async def perform_rag_query(ctx: Context, query: str, source: str = None, match_
         if source and source.strip():
             filter_metadata = {"source": source}
         
-        if use_hybrid_search:
-            # Hybrid search: combine vector and keyword search
-            
-            # 1. Get vector search results (get more to account for filtering)
-            vector_results = search_documents(
-                client=supabase_client,
-                query=query,
-                match_count=match_count * 2,  # Get double to have room for filtering
-                filter_metadata=filter_metadata
-            )
-            
-            # 2. Get keyword search results using ILIKE
-            keyword_query = supabase_client.from_('crawled_pages')\
-                .select('id, url, chunk_number, content, metadata, source_id')\
-                .ilike('content', f'%{query}%')
-            
-            # Apply source filter if provided
-            if source and source.strip():
-                keyword_query = keyword_query.eq('source_id', source)
-            
-            # Execute keyword search
-            keyword_response = keyword_query.limit(match_count * 2).execute()
-            keyword_results = keyword_response.data if keyword_response.data else []
-            
-            # 3. Combine results with preference for items appearing in both
-            seen_ids = set()
-            combined_results = []
-            
-            # First, add items that appear in both searches (these are the best matches)
-            vector_ids = {r.get('id') for r in vector_results if r.get('id')}
-            for kr in keyword_results:
-                if kr['id'] in vector_ids and kr['id'] not in seen_ids:
-                    # Find the vector result to get similarity score
-                    for vr in vector_results:
-                        if vr.get('id') == kr['id']:
-                            # Boost similarity score for items in both results
-                            vr['similarity'] = min(1.0, vr.get('similarity', 0) * 1.2)
-                            combined_results.append(vr)
-                            seen_ids.add(kr['id'])
-                            break
-            
-            # Then add remaining vector results (semantic matches without exact keyword)
-            for vr in vector_results:
-                if vr.get('id') and vr['id'] not in seen_ids and len(combined_results) < match_count:
-                    combined_results.append(vr)
-                    seen_ids.add(vr['id'])
-            
-            # Finally, add pure keyword matches if we still need more results
-            for kr in keyword_results:
-                if kr['id'] not in seen_ids and len(combined_results) < match_count:
-                    # Convert keyword result to match vector result format
-                    combined_results.append({
-                        'id': kr['id'],
-                        'url': kr['url'],
-                        'chunk_number': kr['chunk_number'],
-                        'content': kr['content'],
-                        'metadata': kr['metadata'],
-                        'source_id': kr['source_id'],
-                        'similarity': 0.5  # Default similarity for keyword-only matches
-                    })
-                    seen_ids.add(kr['id'])
-            
-            # Use combined results
-            results = combined_results[:match_count]
+        use_reranking = os.getenv("USE_RERANKING", "false") == "true"
+        reranking_applied = use_reranking and ctx.request_context.lifespan_context.reranker is not None
+        
+        # Pages after the first continue from the keyset carried by the cursor
+        cache_source = source if source and source.strip() else None
+        scope = cursor_scope("crawled_pages", normalize_query(query), cache_source)
+        after = None
+        if cursor:
+            if use_hybrid_search:
+                raise ValueError("Cursors are only supported for vector search")
+            after = decode_cursor(cursor, scope)
+        
+        # Serve repeated queries from the result cache; ingestion into a source invalidates its entries
+        result_cache = get_result_cache()
+        cache_key = ("crawled_pages", normalize_query(query), cache_source, match_count, use_hybrid_search, reranking_applied, cursor)
+        formatted_results = result_cache.get(cache_key, cache_source) if result_cache else None
+        
+        if formatted_results is None:
+            cache_version = result_cache.version(cache_source) if result_cache else 0
             
-        else:
-            # Standard vector search only
-            results = search_documents(
+            # Hybrid mode fuses vector and full-text search with reciprocal rank fusion in one RPC
+            results = await search_documents(
                 client=supabase_client,
                 query=query,
                 match_count=match_count,
-                filter_metadata=filter_metadata
+                filter_metadata=filter_metadata,
+                use_hybrid_search=use_hybrid_search,
+                after=after
             )
         
-        # Apply reranking if enabled
-        use_reranking = os.getenv("USE_RERANKING", "false") == "true"
-        if use_reranking and ctx.request_context.lifespan_context.reranking_model:
-            results = rerank_results(ctx.request_context.lifespan_context.reranking_model, query, results, content_key="content")
-        
-        # Format the results
-        formatted_results = []
-        for result in results:
-            formatted_result = {
-                "url": result.get("url"),
-                "content": result.get("content"),
-                "metadata": result.get("metadata"),
-                "similarity": result.get("similarity")
-            }
-            # Include rerank score if available
-            if "rerank_score" in result:
-                formatted_result["rerank_score"] = result["rerank_score"]
-            formatted_results.append(formatted_result)
+            # Apply reranking if enabled; reranking orders results within the page
+            if reranking_applied:
+                results = await rerank_results(ctx.request_context.lifespan_context.reranker, query, results, content_key="content")
         
-        return json.dumps({
+            # Format the results
+            formatted_results = [format_document_result(result) for result in results]
+
+            if result_cache:
+                result_cache.put(cache_key, formatted_results, cache_version)
+        
+        return dump_response({
             "success": True,
             "query": query,
             "source_filter": source,
             "search_mode": "hybrid" if use_hybrid_search else "vector",
-            "reranking_applied": use_reranking and ctx.request_context.lifespan_context.reranking_model is not None,
-            "results": formatted_results,
-            "count": len(formatted_results)
-        }, indent=2)
+            "reranking_applied": reranking_applied,
+            "results": shape_results(formatted_results, query, response_mode, fields),
+            "count": len(formatted_results),
+            "next_cursor": None if use_hybrid_search else next_page_cursor(formatted_results, match_count, scope, after)
+        }, compact)
     except Exception as e:
         return json.dumps({
             "success": False,
@@ -797,8 +1445,156 @@ async def perform_rag_query(ctx: Context, query: str, source: str = None, match_
             "error": str(e)
         }, indent=2)
 
+# Maximum number of queries accepted by perform_rag_queries in one call
+RAG_QUERIES_MAX_BATCH = int(os.getenv("RAG_QUERIES_MAX_BATCH", "20"))
+
 @mcp.tool()
-async def search_code_examples(ctx: Context, query: str, source_id: str = None, match_count: int = 5) -> str:
+async def perform_rag_queries(
+    ctx: Context,
+    queries: List[str],
+    source: str = None,
+    match_count: int = 5,
+    dedupe: bool = False,
+    response_mode: str = "full",
+    fields: List[str] = None,
+    compact: bool = False
+) -> str:
+    """
+    Perform several related RAG queries on the stored content in one call.
+    
+    Prefer this over calling perform_rag_query repeatedly: all queries are embedded in one
+    request, searched concurrently and reranked in a single pass. Optionally filter by
+    source domain. Get the source by using the get_available_sources tool before calling this search!
+    
+    Args:
+        ctx: The MCP server provided context
+        queries: The search queries (up to 20)
+        source: Optional source domain to filter results (e.g., 'example.com')
+        match_count: Maximum number of results to return per query (default: 5)
+        dedupe: If true, a chunk matching several queries is only returned for the query it scores best on
+        response_mode: "full" (default) returns content and metadata, "snippet" returns url, chunk_number, snippet and scores
+        fields: Optional list of result fields to return (e.g. ["url", "chunk_number", "snippet"])
+        compact: If true, return JSON without indentation
+    
+    Returns:
+        JSON string with the search results of each query
+    """
+    error = validate_response_mode(response_mode)
+    if error:
+        return json.dumps({"success": False, "error": error}, indent=2)
+    
+    try:
+        queries = [query for query in queries if query and query.strip()]
+        if not queries:
+            return json.dumps({"success": False, "error": "No queries provided"}, indent=2)
+        if len(queries) > RAG_QUERIES_MAX_BATCH:
+            return json.dumps({
+                "success": False,
+                "error": f"At most {RAG_QUERIES_MAX_BATCH} queries can be run in one call, got {len(queries)}"
+            }, indent=2)
+
+        # Get the Supabase client from the context
+        supabase_client = ctx.request_context.lifespan_context.supabase_client
+        reranker = ctx.request_context.lifespan_context.reranker
+        
+        use_hybrid_search = os.getenv("USE_HYBRID_SEARCH", "false") == "true"
+        use_reranking = os.getenv("USE_RERANKING", "false") == "true"
+        reranking_applied = use_reranking and reranker is not None
+        
+        filter_metadata = None
+        cache_source = None
+        if source and source.strip():
+            filter_metadata = {"source": source}
+            cache_source = source
+        
+        # Reuse results cached by perform_rag_query or earlier batches; only misses are searched
+        result_cache = get_result_cache()
+        cache_version = result_cache.version(cache_source) if result_cache else 0
+        normalized_queries = [normalize_query(query) for query in queries]
+        cache_keys = [
+            ("crawled_pages", normalized, cache_source, match_count, use_hybrid_search, reranking_applied, None)
+            for normalized in normalized_queries
+        ]
+        formatted_sets = [result_cache.get(key, cache_source) if result_cache else None for key in cache_keys]
+        missing = [i for i, formatted in enumerate(formatted_sets) if formatted is None]
+        
+        if missing:
+            # One embedding request for every query, then all searches concurrently
+            query_embeddings = await create_query_embeddings([normalized_queries[i] for i in missing])
+            result_sets = await asyncio.gather(*(
+                search_documents(
+                    client=supabase_client,
+                    query=queries[i],
+                    match_count=match_count,
+                    filter_metadata=filter_metadata,
+                    use_hybrid_search=use_hybrid_search,
+                    query_embedding=embedding
+                )
+                for i, embedding in zip(missing, query_embeddings)
+            ))
+            
+            # Rerank every (query, document) pair in one cross-encoder batch
+            if reranking_applied:
+                result_sets = await rerank_result_sets(
+                    reranker, [queries[i] for i in missing], list(result_sets), content_key="content"
+                )
+            
+            for i, results in zip(missing, result_sets):
+                formatted_sets[i] = [format_document_result(result) for result in results]
+                if result_cache:
+                    result_cache.put(cache_keys[i], formatted_sets[i], cache_version)
+        
+        if dedupe:
+            # Keep each chunk only under the query it scores best on
+            score_key = "rerank_score" if reranking_applied else ("rrf_score" if use_hybrid_search else "similarity")
+            best: Dict[Tuple[str, Any], Tuple[float, int]] = {}
+            for i, formatted_results in enumerate(formatted_sets):
+                for result in formatted_results:
+                    chunk_key = (result["url"], (result.get("metadata") or {}).get("chunk_index"), result["content"])
+                    score = result.get(score_key) or 0.0
+                    if chunk_key not in best or score > best[chunk_key][0]:
+                        best[chunk_key] = (score, i)
+            formatted_sets = [
+                [
+                    result for result in formatted_results
+                    if best[(result["url"], (result.get("metadata") or {}).get("chunk_index"), result["content"])][1] == i
+                ]
+                for i, formatted_results in enumerate(formatted_sets)
+            ]
+        
+        return dump_response({
+            "success": True,
+            "source_filter": source,
+            "search_mode": "hybrid" if use_hybrid_search else "vector",
+            "reranking_applied": reranking_applied,
+            "deduplicated": dedupe,
+            "results": [
+                {
+                    "query": query,
+                    "results": shape_results(formatted_results, query, response_mode, fields),
+                    "count": len(formatted_results)
+                }
+                for query, formatted_results in zip(queries, formatted_sets)
+            ]
+        }, compact)
+    except Exception as e:
+        return json.dumps({
+            "success": False,
+            "queries": queries,
+            "error": str(e)
+        }, indent=2)
+
+@mcp.tool()
+async def search_code_examples(
+    ctx: Context,
+    query: str,
+    source_id: str = None,
+    match_count: int = 5,
+    response_mode: str = "full",
+    fields: List[str] = None,
+    compact: bool = False,
+    cursor: str = None
+) -> str:
     """
     Search for code examples relevant to the query.
     
@@ -813,10 +1609,18 @@ async def search_code_examples(ctx: Context, query: str, source_id: str = None,
         query: The search query
         source_id: Optional source ID to filter results (e.g., 'example.com')
         match_count: Maximum number of results to return (default: 5)
+        response_mode: "full" (default) returns code and metadata, "snippet" returns url, chunk_number, snippet, summary and scores
+        fields: Optional list of result fields to return (e.g. ["url", "chunk_number", "summary"])
+        compact: If true, return JSON without indentation
+        cursor: Optional next_cursor of a previous call, to get the following page of results (vector search only)
     
     Returns:
         JSON string with the search results
     """
+    error = validate_response_mode(response_mode)
+    if error:
+        return json.dumps({"success": False, "query": query, "error": error}, indent=2)
+    
     # Check if code example extraction is enabled
     extract_code_examples_enabled = os.getenv("USE_AGENTIC_RAG", "false") == "true"
     if not extract_code_examples_enabled:
@@ -837,116 +1641,56 @@ async def search_code_examples(ctx: Context, query: str, source_id: str = None,
         if source_id and source_id.strip():
             filter_metadata = {"source": source_id}
         
-        if use_hybrid_search:
-            # Hybrid search: combine vector and keyword search
-            
-            # Import the search function from utils
-            from utils import search_code_examples as search_code_examples_impl
-            
-            # 1. Get vector search results (get more to account for filtering)
-            vector_results = search_code_examples_impl(
-                client=supabase_client,
-                query=query,
-                match_count=match_count * 2,  # Get double to have room for filtering
-                filter_metadata=filter_metadata
-            )
-            
-            # 2. Get keyword search results using ILIKE on both content and summary
-            keyword_query = supabase_client.from_('code_examples')\
-                .select('id, url, chunk_number, content, summary, metadata, source_id')\
-                .or_(f'content.ilike.%{query}%,summary.ilike.%{query}%')
-            
-            # Apply source filter if provided
-            if source_id and source_id.strip():
-                keyword_query = keyword_query.eq('source_id', source_id)
-            
-            # Execute keyword search
-            keyword_response = keyword_query.limit(match_count * 2).execute()
-            keyword_results = keyword_response.data if keyword_response.data else []
-            
-            # 3. Combine results with preference for items appearing in both
-            seen_ids = set()
-            combined_results = []
-            
-            # First, add items that appear in both searches (these are the best matches)
-            vector_ids = {r.get('id') for r in vector_results if r.get('id')}
-            for kr in keyword_results:
-                if kr['id'] in vector_ids and kr['id'] not in seen_ids:
-                    # Find the vector result to get similarity score
-                    for vr in vector_results:
-                        if vr.get('id') == kr['id']:
-                            # Boost similarity score for items in both results
-                            vr['similarity'] = min(1.0, vr.get('similarity', 0) * 1.2)
-                            combined_results.append(vr)
-                            seen_ids.add(kr['id'])
-                            break
-            
-            # Then add remaining vector results (semantic matches without exact keyword)
-            for vr in vector_results:
-                if vr.get('id') and vr['id'] not in seen_ids and len(combined_results) < match_count:
-                    combined_results.append(vr)
-                    seen_ids.add(vr['id'])
-            
-            # Finally, add pure keyword matches if we still need more results
-            for kr in keyword_results:
-                if kr['id'] not in seen_ids and len(combined_results) < match_count:
-                    # Convert keyword result to match vector result format
-                    combined_results.append({
-                        'id': kr['id'],
-                        'url': kr['url'],
-                        'chunk_number': kr['chunk_number'],
-                        'content': kr['content'],
-                        'summary': kr['summary'],
-                        'metadata': kr['metadata'],
-                        'source_id': kr['source_id'],
-                        'similarity': 0.5  # Default similarity for keyword-only matches
-                    })
-                    seen_ids.add(kr['id'])
-            
-            # Use combined results
-            results = combined_results[:match_count]
-            
-        else:
-            # Standard vector search only
-            from utils import search_code_examples as search_code_examples_impl
+        use_reranking = os.getenv("USE_RERANKING", "false") == "true"
+        reranking_applied = use_reranking and ctx.request_context.lifespan_context.reranker is not None
+        
+        # Pages after the first continue from the keyset carried by the cursor
+        cache_source = source_id if source_id and source_id.strip() else None
+        scope = cursor_scope("code_examples", normalize_query(query), cache_source)
+        after = None
+        if cursor:
+            if use_hybrid_search:
+                raise ValueError("Cursors are only supported for vector search")
+            after = decode_cursor(cursor, scope)
+        
+        # Serve repeated queries from the result cache; ingestion into a source invalidates its entries
+        result_cache = get_result_cache()
+        cache_key = ("code_examples", normalize_query(query), cache_source, match_count, use_hybrid_search, reranking_applied, cursor)
+        formatted_results = result_cache.get(cache_key, cache_source) if result_cache else None
+        
+        if formatted_results is None:
+            cache_version = result_cache.version(cache_source) if result_cache else 0
             
-            results = search_code_examples_impl(
+            # Hybrid mode fuses vector and full-text search with reciprocal rank fusion in one RPC
+            results = await search_code_examples_impl(
                 client=supabase_client,
                 query=query,
                 match_count=match_count,
-                filter_metadata=filter_metadata
+                filter_metadata=filter_metadata,
+                use_hybrid_search=use_hybrid_search,
+                after=after
             )
         
-        # Apply reranking if enabled
-        use_reranking = os.getenv("USE_RERANKING", "false") == "true"
-        if use_reranking and ctx.request_context.lifespan_context.reranking_model:
-            results = rerank_results(ctx.request_context.lifespan_context.reranking_model, query, results, content_key="content")
-        
-        # Format the results
-        formatted_results = []
-        for result in results:
-            formatted_result = {
-                "url": result.get("url"),
-                "code": result.get("content"),
-                "summary": result.get("summary"),
-                "metadata": result.get("metadata"),
-                "source_id": result.get("source_id"),
-                "similarity": result.get("similarity")
-            }
-            # Include rerank score if available
-            if "rerank_score" in result:
-                formatted_result["rerank_score"] = result["rerank_score"]
-            formatted_results.append(formatted_result)
+            # Apply reranking if enabled
+            if reranking_applied:
+                results = await rerank_results(ctx.request_context.lifespan_context.reranker, query, results, content_key="content")
         
-        return json.dumps({
+            # Format the results
+            formatted_results = [format_code_example_result(result) for result in results]
+
+            if result_cache:
+                result_cache.put(cache_key, formatted_results, cache_version)
+        
+        return dump_response({
             "success": True,
             "query": query,
             "source_filter": source_id,
             "search_mode": "hybrid" if use_hybrid_search else "vector",
-            "reranking_applied": use_reranking and ctx.request_context.lifespan_context.reranking_model is not None,
-            "results": formatted_results,
-            "count": len(formatted_results)
-        }, indent=2)
+            "reranking_applied": reranking_applied,
+            "results": shape_results(formatted_results, query, response_mode, fields, content_key="code"),
+            "count": len(formatted_results),
+            "next_cursor": None if use_hybrid_search else next_page_cursor(formatted_results, match_count, scope, after)
+        }, compact)
     except Exception as e:
         return json.dumps({
             "success": False,
@@ -954,17 +1698,98 @@ async def search_code_examples(ctx: Context, query: str, source_id: str = None,
             "error": str(e)
         }, indent=2)
 
-async def crawl_markdown_file(crawler: AsyncWebCrawler, url: str) -> List[Dict[str, Any]]:
+@mcp.tool()
+async def get_chunk(ctx: Context, url: str, chunk_number: int, code_example: bool = False, compact: bool = False) -> str:
+    """
+    Get the full content of one stored chunk.
+    
+    Use this after a search with response_mode="snippet" to read the chunks worth reading
+    in full. Chunks are identified by the url and chunk_number fields of the search results.
+    
+    Args:
+        ctx: The MCP server provided context
+        url: URL of the chunk, as returned by the search
+        chunk_number: Chunk number, as returned by the search
+        code_example: If true, get a code example from search_code_examples instead of a page chunk
+        compact: If true, return JSON without indentation
+    
+    Returns:
+        JSON string with the chunk content and metadata
+    """
+    try:
+        # Get the Supabase client from the context
+        supabase_client = ctx.request_context.lifespan_context.supabase_client
+        
+        table = "code_examples" if code_example else "crawled_pages"
+        columns = "url, chunk_number, content, summary, metadata, source_id" if code_example else "url, chunk_number, content, metadata, source_id"
+        result = await supabase_client.table(table)\
+            .select(columns)\
+            .eq("url", url)\
+            .eq("chunk_number", chunk_number)\
+            .limit(1)\
+            .execute()
+        
+        if not result.data:
+            return json.dumps({
+                "success": False,
+                "url": url,
+                "chunk_number": chunk_number,
+                "error": f"No chunk {chunk_number} stored for {url}"
+            }, indent=2)
+        
+        row = result.data[0]
+        chunk = format_code_example_result(row) if code_example else format_document_result(row)
+        chunk.pop("similarity", None)
+        chunk["source_id"] = row.get("source_id")
+        return dump_response({"success": True, "chunk": chunk}, compact)
+    except Exception as e:
+        return json.dumps({
+            "success": False,
+            "url": url,
+            "chunk_number": chunk_number,
+            "error": str(e)
+        }, indent=2)
+
+async def iterate_pages(pages: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Wrap a list of crawled pages as an async iterator for the ingestion pipeline.
+    
+    Args:
+        pages: List of dictionaries with URL and markdown content
+        
+    Yields:
+        Each page in order
+    """
+    for page in pages:
+        yield page
+
+async def crawl_markdown_file(
+    crawler: AsyncWebCrawler,
+    url: str,
+    static_fetcher: Optional[StaticFetcher] = None
+) -> List[Dict[str, Any]]:
     """
     Crawl a .txt or markdown file.
     
+    With a static fetcher, the file is downloaded directly and the browser is only used
+    if the server does not return it as text.
+    
     Args:
         crawler: AsyncWebCrawler instance
         url: URL of the file
+        static_fetcher: Optional fetcher tried before the browser
         
     Returns:
         List of dictionaries with URL and markdown content
     """
+    if static_fetcher:
+        try:
+            fetched = await static_fetcher.fetch(url)
+            if fetched is not None and fetched.page:
+                return [fetched.page]
+        except Exception as e:
+            print(f"Direct fetch of {url} failed: {e}. Using the browser.")
+
     crawl_config = CrawlerRunConfig()
 
     result = await crawler.arun(url=url, config=crawl_config)
@@ -974,78 +1799,282 @@ async def crawl_markdown_file(crawler: AsyncWebCrawler, url: str) -> List[Dict[s
         print(f"Failed to crawl {url}: {result.error_message}")
         return []
 
-async def crawl_batch(crawler: AsyncWebCrawler, urls: List[str], max_concurrent: int = 10) -> List[Dict[str, Any]]:
+# Maximum number of sitemaps of a sitemap index downloaded at the same time
+SITEMAP_MAX_CONCURRENCY = int(os.getenv("SITEMAP_MAX_CONCURRENCY", "4"))
+
+async def count_entries(entries: AsyncIterable[SitemapEntry], counter: Dict[str, int]) -> AsyncIterator[SitemapEntry]:
     """
-    Batch crawl multiple URLs in parallel.
+    Pass sitemap entries through while counting them.
     
     Args:
-        crawler: AsyncWebCrawler instance
-        urls: List of URLs to crawl
-        max_concurrent: Maximum number of concurrent browser sessions
+        entries: Sitemap entries
+        counter: Dictionary whose "entries" count is incremented for each entry
         
-    Returns:
-        List of dictionaries with URL and markdown content
+    Yields:
+        Each entry unchanged
     """
-    crawl_config = CrawlerRunConfig(cache_mode=CacheMode.BYPASS, stream=False)
-    dispatcher = MemoryAdaptiveDispatcher(
-        memory_threshold_percent=70.0,
-        check_interval=1.0,
-        max_session_permit=max_concurrent
-    )
+    async for entry in entries:
+        counter["entries"] += 1
+        yield entry
+
+# Number of times a URL throttled with 429/503 is retried after its host's pause
+CRAWL_MAX_RETRIES = int(os.getenv("CRAWL_MAX_RETRIES", "2"))
 
-    results = await crawler.arun_many(urls=urls, config=crawl_config, dispatcher=dispatcher)
-    return [{'url': r.url, 'markdown': r.markdown} for r in results if r.success and r.markdown]
+# Sitemap entries gathered before they are revalidated and pushed to the frontier together
+SITEMAP_SEED_BATCH = 100
 
-async def crawl_recursive_internal_links(crawler: AsyncWebCrawler, start_urls: List[str], max_depth: int = 3, max_concurrent: int = 10) -> List[Dict[str, Any]]:
+async def crawl_frontier(
+    crawler: AsyncWebCrawler,
+    start_urls: Union[List[str], AsyncIterable[SitemapEntry]],
+    max_depth: int = 1,
+    max_concurrent: int = 10,
+    lastmods: Optional[Dict[str, Optional[str]]] = None,
+    validator_store: Optional[ValidatorStore] = None,
+    scheduler: Optional[CrawlScheduler] = None,
+    static_fetcher: Optional[StaticFetcher] = None,
+    checkpoint_store: Optional[CrawlCheckpointStore] = None,
+    crawl_id: Optional[str] = None
+) -> AsyncIterator[Dict[str, Any]]:
     """
-    Recursively crawl internal links from start URLs up to a maximum depth.
+    Crawl URLs from a frontier with a pool of workers, yielding pages as soon as each one finishes.
+    
+    max_concurrent workers take URLs from a per-host frontier, each tracking the depth of its
+    URL. The scheduler admits a URL only when its host's token bucket, adaptive concurrency
+    limit and Retry-After pause allow it, and while system memory is below its threshold, so
+    several hosts are crawled side by side, each as fast as it tolerates. Links found on a page
+    are pushed to the frontier as soon as the page finishes, up to max_depth. Start URLs can be
+    streamed from a sitemap resolver, in which case crawling starts with the first entries
+    parsed and entries with a priority above the default 0.5 jump their host's queue. URLs throttled
+    with 429/503 are retried up to CRAWL_MAX_RETRIES times once their host's pause is over.
+    With a static fetcher, pages that do not need rendering are fetched without the browser.
+    If a validator store is given, URLs that revalidate as unchanged are not rendered;
+    they are yielded as {'url': ..., 'unchanged': True} and their recorded links are followed.
+    With a checkpoint store, every URL discovered is recorded under crawl_id and failures are
+    marked; pages carry their frontier URL as 'crawl_url' so the ingestion pipeline can mark
+    them ingested. If the crawl was started before, URLs it already discovered are not queued
+    again and the URLs left pending (queued or failed) are crawled first.
     
     Args:
         crawler: AsyncWebCrawler instance
-        start_urls: List of starting URLs
-        max_depth: Maximum recursion depth
+        start_urls: URLs to start from (depth 0), or sitemap entries streamed while they are parsed
+        max_depth: Maximum recursion depth; 1 crawls only the start URLs
         max_concurrent: Maximum number of concurrent browser sessions
+        lastmods: Optional mapping of URL to its sitemap <lastmod>
+        validator_store: Optional store of validators used to skip unchanged pages
+        scheduler: Per-host scheduler shared by the server's crawls (a private one if None)
+        static_fetcher: Optional fetcher tried before the browser for static pages
+        checkpoint_store: Optional store in which the crawl's frontier is checkpointed
+        crawl_id: Id of the crawl in the checkpoint store
         
-    Returns:
-        List of dictionaries with URL and markdown content
+    Yields:
+        Dictionaries with URL, markdown content and validators
     """
-    run_config = CrawlerRunConfig(cache_mode=CacheMode.BYPASS, stream=False)
-    dispatcher = MemoryAdaptiveDispatcher(
-        memory_threshold_percent=70.0,
-        check_interval=1.0,
-        max_session_permit=max_concurrent
-    )
+    lastmods = {normalize_url(url): lastmod for url, lastmod in (lastmods or {}).items()}
+    priorities: Dict[str, float] = {}
+    run_config = CrawlerRunConfig(cache_mode=CacheMode.BYPASS)
+    frontier = CrawlFrontier(scheduler or CrawlScheduler())
 
-    visited = set()
+    # Bounded so workers pause when the ingestion pipeline falls behind
+    pages: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue(maxsize=max_concurrent)
+    seen = set()
+    resumed: List[Tuple[str, int]] = []
+    if checkpoint_store:
+        known, resumed = await asyncio.to_thread(checkpoint_store.load, crawl_id)
+        seen.update(known)
 
-    def normalize_url(url):
-        return urldefrag(url)[0]
+    async def checkpoint(urls: List[str], status: str) -> None:
+        if checkpoint_store and urls:
+            try:
+                await asyncio.to_thread(checkpoint_store.set_status, crawl_id, urls, status)
+            except Exception as e:
+                print(f"Error checkpointing crawl {crawl_id}: {e}")
 
-    current_urls = set([normalize_url(u) for u in start_urls])
-    results_all = []
+    async def enqueue(urls: List[str], depth: int) -> None:
+        if depth >= max_depth:
+            return
+        new_urls = [url for url in dict.fromkeys(normalize_url(u) for u in urls) if url not in seen]
+        seen.update(new_urls)
+        if checkpoint_store:
+            # Record discovered URLs before crawling them, so an interruption cannot lose them
+            try:
+                await asyncio.to_thread(checkpoint_store.add_urls, crawl_id, new_urls, depth)
+            except Exception as e:
+                print(f"Error checkpointing crawl {crawl_id}: {e}")
+        if validator_store and new_urls:
+            new_urls, unchanged = await revalidate_urls(validator_store, new_urls, lastmods)
+            await checkpoint(unchanged, "unchanged")
+            for url, record in (await asyncio.to_thread(validator_store.get_many, unchanged)).items():
+                await pages.put({'url': url, 'unchanged': True})
+                await enqueue(record["links"], depth + 1)
+        for url in new_urls:
+            await frontier.put(url, depth, 0, first=priorities.get(url, 0.5) > 0.5)
 
-    for depth in range(max_depth):
-        urls_to_crawl = [normalize_url(url) for url in current_urls if normalize_url(url) not in visited]
-        if not urls_to_crawl:
-            break
+    async def fetch(url: str) -> StaticFetch:
+        # Static resources skip the browser; anything that needs rendering falls back to it
+        if static_fetcher:
+            try:
+                fetched = await static_fetcher.fetch(url)
+                if fetched is not None:
+                    return fetched
+            except Exception as e:
+                print(f"Direct fetch of {url} failed: {e}. Using the browser.")
+        result = await crawler.arun(url=url, config=run_config)
+        page = page_from_result(result) if result.success and result.markdown else None
+        return StaticFetch(result.status_code, result.response_headers or {}, result.url, page, result.error_message)
 
-        results = await crawler.arun_many(urls=urls_to_crawl, config=run_config, dispatcher=dispatcher)
-        next_level_urls = set()
+    async def worker() -> None:
+        while True:
+            url, depth, attempt = await frontier.get()
+            try:
+                started = time.monotonic()
+                try:
+                    fetched = await fetch(url)
+                except Exception:
+                    await frontier.scheduler.release(url, None, time.monotonic() - started)
+                    raise
+                pause = await frontier.scheduler.release(
+                    url, fetched.status_code, time.monotonic() - started, fetched.headers
+                )
+                if pause is not None:
+                    if attempt < CRAWL_MAX_RETRIES:
+                        print(f"{url} was throttled ({fetched.status_code}), retrying in {pause:.1f}s")
+                        await frontier.put(url, depth, attempt + 1)
+                    else:
+                        print(f"Giving up on {url} after {attempt + 1} throttled attempts")
+                        await checkpoint([url], "failed")
+                    continue
+                # Redirect targets count as visited too
+                seen.add(normalize_url(fetched.url))
+                if fetched.page:
+                    page = fetched.page
+                    page['validators']['lastmod'] = lastmods.get(url)
+                    page['crawl_url'] = url
+                    await enqueue(page['validators']['links'], depth + 1)
+                    await pages.put(page)
+                else:
+                    print(f"Failed to crawl {url}: {fetched.error}")
+                    await checkpoint([url], "failed")
+            except Exception as e:
+                print(f"Error crawling {url}: {e}")
+                await checkpoint([url], "failed")
+            finally:
+                frontier.task_done()
 
-        for result in results:
-            norm_url = normalize_url(result.url)
-            visited.add(norm_url)
+    async def supervise() -> None:
+        # The frontier is exhausted once every queued URL is done and no worker can add more
+        try:
+            for url, depth in resumed:
+                await frontier.put(url, depth, 0)
+            if isinstance(start_urls, list):
+                await enqueue(start_urls, 0)
+            else:
+                batch = []
+                async for entry in start_urls:
+                    url = normalize_url(entry.loc)
+                    lastmods[url] = entry.lastmod
+                    if entry.priority is not None:
+                        priorities[url] = entry.priority
+                    batch.append(url)
+                    if len(batch) >= SITEMAP_SEED_BATCH:
+                        await enqueue(batch, 0)
+                        batch = []
+                await enqueue(batch, 0)
+            await frontier.join()
+        finally:
+            await pages.put(None)
 
-            if result.success and result.markdown:
-                results_all.append({'url': result.url, 'markdown': result.markdown})
-                for link in result.links.get("internal", []):
-                    next_url = normalize_url(link["href"])
-                    if next_url not in visited:
-                        next_level_urls.add(next_url)
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, max_concurrent))]
+    supervisor = asyncio.create_task(supervise())
+    try:
+        while True:
+            page = await pages.get()
+            if page is None:
+                break
+            yield page
+        # Surface a failure to seed the frontier
+        await supervisor
+    finally:
+        for task in workers + [supervisor]:
+            task.cancel()
+        await asyncio.gather(*workers, supervisor, return_exceptions=True)
 
-        current_urls = next_level_urls
+async def crawl_batch(
+    crawler: AsyncWebCrawler,
+    urls: Union[List[str], AsyncIterable[SitemapEntry]],
+    max_concurrent: int = 10,
+    lastmods: Optional[Dict[str, Optional[str]]] = None,
+    validator_store: Optional[ValidatorStore] = None,
+    scheduler: Optional[CrawlScheduler] = None,
+    static_fetcher: Optional[StaticFetcher] = None,
+    checkpoint_store: Optional[CrawlCheckpointStore] = None,
+    crawl_id: Optional[str] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Batch crawl multiple URLs in parallel, yielding pages as soon as each one finishes.
+    If a validator store is given, URLs that revalidate as unchanged are not rendered and
+    are yielded as {'url': ..., 'unchanged': True} instead.
+    
+    Args:
+        crawler: AsyncWebCrawler instance
+        urls: List of URLs to crawl, or sitemap entries streamed while they are parsed
+        max_concurrent: Maximum number of concurrent browser sessions
+        lastmods: Optional mapping of URL to its sitemap <lastmod>
+        validator_store: Optional store of validators used to skip unchanged pages
+        scheduler: Per-host scheduler shared by the server's crawls
+        static_fetcher: Optional fetcher tried before the browser for static pages
+        checkpoint_store: Optional store in which the crawl's frontier is checkpointed
+        crawl_id: Id of the crawl in the checkpoint store
+        
+    Yields:
+        Dictionaries with URL, markdown content and validators
+    """
+    async for page in crawl_frontier(
+        crawler, urls, max_depth=1, max_concurrent=max_concurrent,
+        lastmods=lastmods, validator_store=validator_store, scheduler=scheduler, static_fetcher=static_fetcher,
+        checkpoint_store=checkpoint_store, crawl_id=crawl_id
+    ):
+        yield page
 
-    return results_all
+async def crawl_recursive_internal_links(
+    crawler: AsyncWebCrawler,
+    start_urls: List[str],
+    max_depth: int = 3,
+    max_concurrent: int = 10,
+    validator_store: Optional[ValidatorStore] = None,
+    scheduler: Optional[CrawlScheduler] = None,
+    static_fetcher: Optional[StaticFetcher] = None,
+    checkpoint_store: Optional[CrawlCheckpointStore] = None,
+    crawl_id: Optional[str] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Recursively crawl internal links from start URLs up to a maximum depth,
+    yielding pages as soon as each one finishes.
+    
+    Links found on a page are pushed to the frontier as soon as the page finishes, so every
+    browser session stays busy instead of waiting for the slowest page of a depth level.
+    If a validator store is given, URLs that revalidate as unchanged are not rendered;
+    they are yielded as {'url': ..., 'unchanged': True} and their recorded links are followed.
+    
+    Args:
+        crawler: AsyncWebCrawler instance
+        start_urls: List of starting URLs
+        max_depth: Maximum recursion depth
+        max_concurrent: Maximum number of concurrent browser sessions
+        validator_store: Optional store of validators used to skip unchanged pages
+        scheduler: Per-host scheduler shared by the server's crawls
+        static_fetcher: Optional fetcher tried before the browser for static pages
+        checkpoint_store: Optional store in which the crawl's frontier is checkpointed
+        crawl_id: Id of the crawl in the checkpoint store
+        
+    Yields:
+        Dictionaries with URL, markdown content and validators
+    """
+    async for page in crawl_frontier(
+        crawler, start_urls, max_depth=max_depth, max_concurrent=max_concurrent,
+        validator_store=validator_store, scheduler=scheduler, static_fetcher=static_fetcher,
+        checkpoint_store=checkpoint_store, crawl_id=crawl_id
+    ):
+        yield page
 
 async def main():
     transport = os.getenv("TRANSPORT", "sse")
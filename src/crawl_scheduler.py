@@ -0,0 +1,315 @@
+"""
+Per-host crawl scheduling for the Crawl4AI MCP server.
+"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Any, Deque, Dict, Mapping, Optional, Tuple
+from urllib.parse import urlparse
+
+try:
+    import psutil
+except ImportError:  # psutil is optional; without it crawls are not gated on memory
+    psutil = None
+
+# Status codes a host uses to ask crawlers to slow down
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+@dataclass
+class HostState:
+    """Admission and congestion state of one host."""
+    limit: float
+    tokens: float
+    refilled_at: float
+    in_flight: int = 0
+    blocked_until: float = 0.0
+    latency: Optional[float] = None
+    baseline_latency: Optional[float] = None
+    consecutive_throttles: int = 0
+    requests: int = 0
+    throttled: int = 0
+    errors: int = 0
+
+
+class CrawlScheduler:
+    """
+    Decides when a page of a given host may be fetched.
+
+    Each host has a token bucket capping its request rate and an AIMD concurrency limit:
+    the limit grows by 1/limit after every fast response, is cut by a quarter when latency
+    climbs well above the best latency seen for the host, and is halved on errors and on
+    429/503 responses. Throttled hosts are also paused for their Retry-After delay (or an
+    exponential backoff when they send none). New pages are only admitted while system
+    memory is below a threshold, like crawl4ai's MemoryAdaptiveDispatcher.
+
+    One scheduler is shared by every crawl of the server, so concurrent crawls of the same
+    host share its limits.
+    """
+
+    def __init__(
+        self,
+        host_max_concurrency: int = 8,
+        host_initial_concurrency: int = 2,
+        host_rate: float = 10.0,
+        host_burst: Optional[float] = None,
+        memory_threshold_percent: float = 70.0,
+        check_interval: float = 1.0,
+        slow_latency_factor: float = 3.0,
+        max_backoff: float = 120.0
+    ):
+        """
+        Create a scheduler.
+
+        Args:
+            host_max_concurrency: Upper bound of the per-host concurrency limit
+            host_initial_concurrency: Concurrency limit of a host before any response is seen
+            host_rate: Maximum requests per second per host
+            host_burst: Token bucket size per host (defaults to host_max_concurrency)
+            memory_threshold_percent: System memory usage above which no page is admitted
+            check_interval: Seconds between memory checks while memory is above the threshold
+            slow_latency_factor: Latency, relative to the host's best latency, treated as congestion
+            max_backoff: Upper bound in seconds of Retry-After and backoff pauses
+        """
+        self.host_max_concurrency = max(1, host_max_concurrency)
+        self.host_initial_concurrency = max(1, min(host_initial_concurrency, self.host_max_concurrency))
+        self.host_rate = host_rate
+        self.host_burst = host_burst or float(self.host_max_concurrency)
+        self.memory_threshold_percent = memory_threshold_percent
+        self.check_interval = check_interval
+        self.slow_latency_factor = slow_latency_factor
+        self.max_backoff = max_backoff
+        self._hosts: Dict[str, HostState] = {}
+        self._condition = asyncio.Condition()
+
+    def _host(self, host: str) -> HostState:
+        state = self._hosts.get(host)
+        if state is None:
+            state = HostState(
+                limit=float(self.host_initial_concurrency),
+                tokens=self.host_burst,
+                refilled_at=time.monotonic()
+            )
+            self._hosts[host] = state
+        return state
+
+    def _admission_delay(self, host: str, now: float) -> Optional[float]:
+        """Seconds until host can be admitted: 0 if now, None if only a release can unblock it."""
+        state = self._host(host)
+        if state.blocked_until > now:
+            return state.blocked_until - now
+        if state.in_flight >= int(state.limit):
+            return None
+        state.tokens = min(self.host_burst, state.tokens + (now - state.refilled_at) * self.host_rate)
+        state.refilled_at = now
+        if state.tokens < 1:
+            return (1 - state.tokens) / self.host_rate
+        return 0.0
+
+    def _memory_delay(self) -> float:
+        if psutil is not None and psutil.virtual_memory().percent >= self.memory_threshold_percent:
+            return self.check_interval
+        return 0.0
+
+    def _admit(self, host: str) -> None:
+        state = self._host(host)
+        state.tokens -= 1
+        state.in_flight += 1
+        state.requests += 1
+
+    async def release(
+        self,
+        url: str,
+        status_code: Optional[int],
+        latency: float,
+        headers: Optional[Mapping[str, str]] = None
+    ) -> Optional[float]:
+        """
+        Record the outcome of a fetch admitted by a CrawlFrontier.
+
+        Args:
+            url: URL that was fetched
+            status_code: HTTP status of the response, or None if the fetch failed
+            latency: Seconds the fetch took
+            headers: Response headers, used for Retry-After
+
+        Returns:
+            Seconds the host is paused for if it throttled the request (the URL is worth
+            retrying), otherwise None
+        """
+        host = host_of(url)
+        async with self._condition:
+            state = self._host(host)
+            state.in_flight = max(0, state.in_flight - 1)
+            backoff = None
+
+            if status_code in THROTTLE_STATUS_CODES:
+                state.throttled += 1
+                state.consecutive_throttles += 1
+                state.limit = max(1.0, state.limit / 2)
+                retry_after = parse_retry_after(headers)
+                backoff = min(self.max_backoff, retry_after if retry_after is not None else 2.0 ** state.consecutive_throttles)
+                state.blocked_until = max(state.blocked_until, time.monotonic() + backoff)
+            elif status_code is None or status_code >= 500:
+                state.errors += 1
+                state.limit = max(1.0, state.limit / 2)
+            else:
+                state.consecutive_throttles = 0
+                state.latency = latency if state.latency is None else 0.8 * state.latency + 0.2 * latency
+                state.baseline_latency = state.latency if state.baseline_latency is None else min(state.baseline_latency, state.latency)
+                if state.latency > self.slow_latency_factor * state.baseline_latency:
+                    state.limit = max(1.0, state.limit * 0.75)
+                else:
+                    state.limit = min(float(self.host_max_concurrency), state.limit + 1 / state.limit)
+
+            self._condition.notify_all()
+            return backoff
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the congestion state of every host seen so far.
+
+        Returns:
+            Dictionary mapping each host to its limit, in-flight count, latency and counters
+        """
+        now = time.monotonic()
+        return {
+            host: {
+                "concurrency_limit": round(state.limit, 2),
+                "in_flight": state.in_flight,
+                "latency": state.latency,
+                "paused_for": max(0.0, state.blocked_until - now),
+                "requests": state.requests,
+                "throttled": state.throttled,
+                "errors": state.errors
+            }
+            for host, state in self._hosts.items()
+        }
+
+
+class CrawlFrontier:
+    """
+    Queue of URLs to crawl, grouped by host and admitted through a CrawlScheduler.
+
+    get() returns the next URL, round-robin across hosts, whose host the scheduler admits
+    right now, so a paused or saturated host never holds up workers that could be fetching
+    from other hosts. join() and task_done() behave like asyncio.Queue.
+    """
+
+    def __init__(self, scheduler: CrawlScheduler):
+        """
+        Create an empty frontier.
+
+        Args:
+            scheduler: Scheduler shared by the server's crawls
+        """
+        self.scheduler = scheduler
+        self._queues: "OrderedDict[str, Deque[Tuple[Any, ...]]]" = OrderedDict()
+        self._unfinished = 0
+        self._finished = asyncio.Event()
+        self._finished.set()
+
+    async def put(self, url: str, *extra: Any, first: bool = False) -> None:
+        """
+        Add a URL to the frontier.
+
+        Args:
+            url: URL to crawl
+            extra: Values returned along with the URL by get() (e.g. depth)
+            first: Put the URL at the front of its host's queue instead of the back
+        """
+        async with self.scheduler._condition:
+            queue = self._queues.setdefault(host_of(url), deque())
+            if first:
+                queue.appendleft((url, *extra))
+            else:
+                queue.append((url, *extra))
+            self._unfinished += 1
+            self._finished.clear()
+            self.scheduler._condition.notify_all()
+
+    async def get(self) -> Tuple[Any, ...]:
+        """
+        Wait for a URL whose host may be fetched, and admit it.
+
+        The caller must report the fetch with CrawlScheduler.release() and then call task_done().
+
+        Returns:
+            Tuple of the URL and the extra values it was put with
+        """
+        condition = self.scheduler._condition
+        async with condition:
+            while True:
+                timeout = None
+                memory_delay = self.scheduler._memory_delay() if self._queues else 0.0
+                if memory_delay:
+                    timeout = memory_delay
+                else:
+                    now = time.monotonic()
+                    for host in list(self._queues):
+                        delay = self.scheduler._admission_delay(host, now)
+                        if delay == 0:
+                            queue = self._queues[host]
+                            item = queue.popleft()
+                            if queue:
+                                self._queues.move_to_end(host)
+                            else:
+                                del self._queues[host]
+                            self.scheduler._admit(host)
+                            return item
+                        if delay is not None:
+                            timeout = delay if timeout is None else min(timeout, delay)
+                try:
+                    await asyncio.wait_for(condition.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    def task_done(self) -> None:
+        """Mark a URL returned by get() as fully processed."""
+        self._unfinished -= 1
+        if self._unfinished <= 0:
+            self._unfinished = 0
+            self._finished.set()
+
+    async def join(self) -> None:
+        """Wait until every URL put in the frontier has been processed."""
+        await self._finished.wait()
+
+
+def host_of(url: str) -> str:
+    """
+    Get the host a URL is scheduled under.
+
+    Args:
+        url: URL to schedule
+
+    Returns:
+        Lowercased network location of the URL
+    """
+    return urlparse(url).netloc.lower()
+
+
+def parse_retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """
+    Parse a Retry-After header given in seconds or as an HTTP date.
+
+    Args:
+        headers: Response headers
+
+    Returns:
+        Seconds to wait, or None if the header is missing or malformed
+    """
+    if not headers:
+        return None
+    value = next((v for k, v in headers.items() if k.lower() == "retry-after"), None)
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
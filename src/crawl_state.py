@@ -0,0 +1,326 @@
+"""
+Persistent crawl state for the Crawl4AI MCP server.
+"""
+import os
+import json
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+
+class ValidatorStore:
+    """
+    SQLite store of HTTP validators recorded for every crawled URL.
+
+    For each URL we keep the ETag and Last-Modified headers of the last successful crawl,
+    the sitemap <lastmod> it was crawled under, and its internal links, so a recrawl can
+    revalidate pages cheaply and still follow the links of pages it decides to skip.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open (or create) the store.
+
+        Args:
+            path: Path of the SQLite database file
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS validators (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                lastmod TEXT,
+                links TEXT,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get_many(self, urls: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the recorded validators for a list of URLs.
+
+        Args:
+            urls: URLs to look up
+
+        Returns:
+            Dictionary mapping each known URL to its etag, last_modified, lastmod and links
+        """
+        records: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for start in range(0, len(urls), 500):
+                url_slice = urls[start:start + 500]
+                placeholders = ",".join("?" * len(url_slice))
+                rows = self._conn.execute(
+                    f"SELECT url, etag, last_modified, lastmod, links FROM validators WHERE url IN ({placeholders})",
+                    url_slice
+                ).fetchall()
+                for row in rows:
+                    records[row["url"]] = {
+                        "etag": row["etag"],
+                        "last_modified": row["last_modified"],
+                        "lastmod": row["lastmod"],
+                        "links": json.loads(row["links"]) if row["links"] else []
+                    }
+        return records
+
+    def record(
+        self,
+        url: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        lastmod: Optional[str] = None,
+        links: Optional[List[str]] = None
+    ) -> None:
+        """
+        Record the validators of a successfully crawled and stored URL.
+
+        Args:
+            url: Crawled URL
+            etag: ETag response header, if any
+            last_modified: Last-Modified response header, if any
+            lastmod: Sitemap <lastmod> the URL was crawled under, if any
+            links: Internal links found on the page
+        """
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO validators (url, etag, last_modified, lastmod, links, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    etag = excluded.etag,
+                    last_modified = excluded.last_modified,
+                    lastmod = excluded.lastmod,
+                    links = excluded.links,
+                    updated_at = excluded.updated_at
+                """,
+                (url, etag, last_modified, lastmod, json.dumps(links or []), time.time())
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+class CrawlCheckpointStore:
+    """
+    SQLite store of the frontier and progress of every crawl, so crawls can be resumed.
+
+    Each crawl is identified by a crawl id. Every URL it discovers is recorded with its depth
+    as queued, and moves to ingested once its chunks are stored, or to unchanged or failed.
+    Crawling and ingestion checkpoint together: a page only leaves the queued state after it
+    is stored, so a crawl interrupted by a restart or timeout resumes from the queued URLs
+    without refetching or re-embedding finished pages.
+    """
+
+    # Statuses of a URL that a resumed crawl fetches again
+    PENDING_STATUSES = ("queued", "failed")
+
+    def __init__(self, path: str):
+        """
+        Open (or create) the store.
+
+        Args:
+            path: Path of the SQLite database file
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS crawls (
+                crawl_id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                max_depth INTEGER NOT NULL,
+                chunk_size INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS crawl_urls (
+                crawl_id TEXT NOT NULL,
+                url TEXT NOT NULL,
+                depth INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (crawl_id, url)
+            );
+            """
+        )
+        self._conn.commit()
+
+    def get(self, crawl_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a recorded crawl.
+
+        Args:
+            crawl_id: Id of the crawl
+
+        Returns:
+            Dictionary with the crawl's url, max_depth, chunk_size and status, or None if unknown
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url, max_depth, chunk_size, status FROM crawls WHERE crawl_id = ?",
+                (crawl_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def start(self, crawl_id: str, url: str, max_depth: int, chunk_size: int) -> None:
+        """
+        Record a new crawl.
+
+        Args:
+            crawl_id: Id of the crawl
+            url: URL the crawl starts from
+            max_depth: Maximum recursion depth of the crawl
+            chunk_size: Chunk size its pages are stored with
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO crawls (crawl_id, url, max_depth, chunk_size, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 'running', ?, ?)",
+                (crawl_id, url, max_depth, chunk_size, now, now)
+            )
+            self._conn.commit()
+
+    def finish(self, crawl_id: str, status: str = "completed") -> None:
+        """
+        Set the status of a crawl.
+
+        Args:
+            crawl_id: Id of the crawl
+            status: New status of the crawl
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE crawls SET status = ?, updated_at = ? WHERE crawl_id = ?",
+                (status, time.time(), crawl_id)
+            )
+            self._conn.commit()
+
+    def load(self, crawl_id: str) -> Tuple[Set[str], List[Tuple[str, int]]]:
+        """
+        Load the frontier of a crawl to resume it.
+
+        Args:
+            crawl_id: Id of the crawl
+
+        Returns:
+            Tuple of every URL the crawl has discovered, and the (url, depth) pairs still to
+            fetch, shallowest first
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT url, depth, status FROM crawl_urls WHERE crawl_id = ? ORDER BY depth, rowid",
+                (crawl_id,)
+            ).fetchall()
+        known = {row["url"] for row in rows}
+        pending = [(row["url"], row["depth"]) for row in rows if row["status"] in self.PENDING_STATUSES]
+        return known, pending
+
+    def add_urls(self, crawl_id: str, urls: List[str], depth: int) -> None:
+        """
+        Record URLs discovered by a crawl as queued. URLs it already knows are left as they are.
+
+        Args:
+            crawl_id: Id of the crawl
+            urls: Discovered URLs
+            depth: Depth the URLs were discovered at
+        """
+        if not urls:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO crawl_urls (crawl_id, url, depth, status, updated_at) "
+                "VALUES (?, ?, ?, 'queued', ?)",
+                [(crawl_id, url, depth, now) for url in urls]
+            )
+            self._conn.execute("UPDATE crawls SET updated_at = ? WHERE crawl_id = ?", (now, crawl_id))
+            self._conn.commit()
+
+    def set_status(self, crawl_id: str, urls: List[str], status: str) -> None:
+        """
+        Set the status of URLs of a crawl.
+
+        Args:
+            crawl_id: Id of the crawl
+            urls: URLs to update
+            status: "ingested", "unchanged" or "failed"
+        """
+        if not urls:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE crawl_urls SET status = ?, updated_at = ? WHERE crawl_id = ? AND url = ?",
+                [(status, now, crawl_id, url) for url in urls]
+            )
+            self._conn.commit()
+
+    def counts(self, crawl_id: str) -> Dict[str, int]:
+        """
+        Count the URLs of a crawl by status.
+
+        Args:
+            crawl_id: Id of the crawl
+
+        Returns:
+            Dictionary mapping each status to its number of URLs
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) AS count FROM crawl_urls WHERE crawl_id = ? GROUP BY status",
+                (crawl_id,)
+            ).fetchall()
+        return {row["status"]: row["count"] for row in rows}
+
+    def prune(self, max_age: float) -> int:
+        """
+        Delete crawls not updated for a while, with their URLs.
+
+        Args:
+            max_age: Age in seconds after which a crawl is deleted
+
+        Returns:
+            Number of crawls deleted
+        """
+        cutoff = time.time() - max_age
+        with self._lock:
+            crawl_ids = [row["crawl_id"] for row in self._conn.execute(
+                "SELECT crawl_id FROM crawls WHERE updated_at < ?", (cutoff,)
+            ).fetchall()]
+            for crawl_id in crawl_ids:
+                self._conn.execute("DELETE FROM crawl_urls WHERE crawl_id = ?", (crawl_id,))
+                self._conn.execute("DELETE FROM crawls WHERE crawl_id = ?", (crawl_id,))
+            self._conn.commit()
+        return len(crawl_ids)
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,183 @@
+"""
+Cross-encoder reranking engine for the Crawl4AI MCP server.
+"""
+import asyncio
+import queue
+import threading
+import time
+from typing import List, Dict, Any, Optional, Tuple
+
+from sentence_transformers import CrossEncoder
+
+from caches import RerankScoreCache
+
+
+class RerankEngine:
+    """
+    Cross-encoder that scores (query, document) pairs on a dedicated worker thread.
+
+    Requests from concurrent callers are queued and the worker scores everything that
+    arrives within a short window in one predict() call, so concurrent queries share
+    batches instead of serializing on the model, and the event loop never runs inference.
+    Inputs are truncated to max_length tokens by the tokenizer, and documents are cut to a
+    character budget first so multi-thousand-character chunks are not tokenized in full.
+    The model can run on the ONNX or OpenVINO backends, e.g. an int8-quantized ONNX export.
+    With a score cache, only pairs that were never scored before are sent to the model.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        backend: str = "torch",
+        model_file: Optional[str] = None,
+        max_length: int = 256,
+        max_batch_pairs: int = 64,
+        batch_wait: float = 0.002,
+        score_cache: Optional[RerankScoreCache] = None
+    ):
+        """
+        Load the model and start the worker thread.
+
+        Args:
+            model_name: Hugging Face name or path of the cross-encoder
+            backend: "torch", "onnx" or "openvino"
+            model_file: Model file to load for the onnx/openvino backends (e.g. onnx/model_qint8_avx512_vnni.onnx)
+            max_length: Maximum number of tokens per (query, document) pair
+            max_batch_pairs: Maximum number of pairs scored in one predict() call
+            batch_wait: Seconds the worker waits for more requests before scoring a batch
+            score_cache: Optional cache of scores for previously seen pairs
+        """
+        self.model_name = model_name
+        self.backend = backend
+        self.max_length = max_length
+        self.max_batch_pairs = max_batch_pairs
+        self.batch_wait = batch_wait
+        # Roughly 4 characters per token leaves headroom for the query
+        self.max_document_chars = max_length * 4
+        self.score_cache = score_cache
+        # Everything that changes the score of a pair is part of the cache key
+        self.cache_model_key = f"{model_name}:{backend}:{model_file or ''}:{max_length}"
+
+        kwargs: Dict[str, Any] = {"device": "cpu", "max_length": max_length}
+        if backend != "torch":
+            kwargs["backend"] = backend
+            if model_file:
+                kwargs["model_kwargs"] = {"file_name": model_file}
+        self.model = CrossEncoder(model_name, **kwargs)
+
+        self.batches = 0
+        self.pairs_scored = 0
+        self.requests = 0
+        self._queue: "queue.Queue[Optional[Tuple[List[List[str]], asyncio.AbstractEventLoop, asyncio.Future]]]" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="rerank-engine", daemon=True)
+        self._worker.start()
+
+    async def score(self, pairs: List[List[str]]) -> List[float]:
+        """
+        Score (query, document) pairs.
+
+        Args:
+            pairs: List of [query, document] pairs
+
+        Returns:
+            Relevance scores aligned with pairs
+        """
+        if not pairs:
+            return []
+        truncated = [[query, document[:self.max_document_chars]] for query, document in pairs]
+
+        cached: Dict[int, float] = {}
+        keys: List[str] = []
+        if self.score_cache:
+            keys = [RerankScoreCache.key(self.cache_model_key, query, document) for query, document in truncated]
+            cached = self.score_cache.get_many(keys)
+            if len(cached) == len(truncated):
+                return [cached[i] for i in range(len(truncated))]
+
+        missing = [i for i in range(len(truncated)) if i not in cached]
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put(([truncated[i] for i in missing], loop, future))
+        new_scores = await future
+
+        if self.score_cache:
+            self.score_cache.put_many([keys[i] for i in missing], new_scores)
+        scores = dict(cached)
+        scores.update(zip(missing, new_scores))
+        return [scores[i] for i in range(len(truncated))]
+
+    def _run(self) -> None:
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+
+            # Collect whatever else arrives within the batching window, up to the pair budget
+            batch = [request]
+            pair_count = len(request[0])
+            deadline = time.monotonic() + self.batch_wait
+            while pair_count < self.max_batch_pairs:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    next_request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if next_request is None:
+                    self._queue.put(None)  # Finish this batch, then stop
+                    break
+                batch.append(next_request)
+                pair_count += len(next_request[0])
+
+            pairs = [pair for pairs, _, _ in batch for pair in pairs]
+            try:
+                scores = self.model.predict(pairs, batch_size=max(len(pairs), 1), show_progress_bar=False)
+                error = None
+            except Exception as e:
+                scores = None
+                error = e
+
+            self.batches += 1
+            self.requests += len(batch)
+            self.pairs_scored += len(pairs)
+
+            offset = 0
+            for request_pairs, loop, future in batch:
+                if error is None:
+                    result = [float(score) for score in scores[offset:offset + len(request_pairs)]]
+                    loop.call_soon_threadsafe(_resolve, future, result, None)
+                else:
+                    loop.call_soon_threadsafe(_resolve, future, None, error)
+                offset += len(request_pairs)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get batching counters for the engine.
+
+        Returns:
+            Dictionary with request, batch and pair counters
+        """
+        return {
+            "model": self.model_name,
+            "backend": self.backend,
+            "max_length": self.max_length,
+            "requests": self.requests,
+            "batches": self.batches,
+            "pairs_scored": self.pairs_scored,
+            "avg_requests_per_batch": self.requests / self.batches if self.batches else 0.0
+        }
+
+    def close(self) -> None:
+        """Stop the worker thread once queued requests are scored."""
+        self._queue.put(None)
+        self._worker.join()
+
+
+def _resolve(future: asyncio.Future, result: Optional[List[float]], error: Optional[Exception]) -> None:
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
@@ -0,0 +1,176 @@
+"""
+Streaming sitemap resolution for the Crawl4AI MCP server.
+"""
+import asyncio
+import zlib
+from typing import AsyncIterator, NamedTuple, Optional, Set, Tuple, Union
+from xml.etree import ElementTree
+
+import httpx
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class SitemapEntry(NamedTuple):
+    """A page listed in a sitemap."""
+    loc: str
+    lastmod: Optional[str] = None
+    priority: Optional[float] = None
+
+
+async def iter_sitemap_entries(
+    sitemap_url: str,
+    client: Optional[httpx.AsyncClient] = None,
+    max_concurrency: int = 4,
+    max_depth: int = 3,
+    timeout: float = 30.0
+) -> AsyncIterator[SitemapEntry]:
+    """
+    Resolve a sitemap or sitemap index into the pages it lists, yielding them as they are parsed.
+
+    Sitemap indexes are followed recursively, with up to max_concurrency child sitemaps
+    downloaded at once. Each document is streamed through an incremental XML parser and
+    gzip-compressed sitemaps (.xml.gz) are decompressed on the fly, so even 50,000-URL
+    sitemaps are never held in memory whole.
+
+    Args:
+        sitemap_url: URL of the sitemap or sitemap index
+        client: Optional HTTP client to reuse; a private one is opened otherwise
+        max_concurrency: Maximum number of sitemaps downloaded at the same time
+        max_depth: Maximum nesting of sitemap indexes
+        timeout: Timeout in seconds of each request when no client is given
+
+    Yields:
+        SitemapEntry of every page, in parse order across sitemaps
+    """
+    own_client = client is None
+    if own_client:
+        client = httpx.AsyncClient(follow_redirects=True, timeout=timeout)
+
+    # Bounded so parsing pauses when the crawl consumes entries slower than they are found
+    entries: "asyncio.Queue[Optional[SitemapEntry]]" = asyncio.Queue(maxsize=1000)
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    seen: Set[str] = {sitemap_url}
+    tasks: Set[asyncio.Task] = set()
+    pending = 0
+
+    def spawn(url: str, depth: int) -> None:
+        nonlocal pending
+        pending += 1
+        task = asyncio.create_task(resolve(url, depth))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    async def resolve(url: str, depth: int) -> None:
+        nonlocal pending
+        try:
+            async with semaphore:
+                async for kind, item in parse_sitemap_stream(client, url):
+                    if kind == "url":
+                        await entries.put(item)
+                    elif depth < max_depth and item not in seen:
+                        # Start each child sitemap as soon as the index lists it
+                        seen.add(item)
+                        spawn(item, depth + 1)
+        except Exception as e:
+            print(f"Error reading sitemap {url}: {e}")
+        finally:
+            pending -= 1
+            if pending == 0:
+                await entries.put(None)
+
+    try:
+        spawn(sitemap_url, 0)
+        while True:
+            entry = await entries.get()
+            if entry is None:
+                break
+            yield entry
+    finally:
+        for task in list(tasks):
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if own_client:
+            await client.aclose()
+
+
+async def parse_sitemap_stream(
+    client: httpx.AsyncClient,
+    sitemap_url: str
+) -> AsyncIterator[Tuple[str, Union[str, SitemapEntry]]]:
+    """
+    Stream one sitemap document and yield its entries while it downloads.
+
+    Args:
+        client: HTTP client
+        sitemap_url: URL of a sitemap or sitemap index, optionally gzip-compressed
+
+    Yields:
+        ("url", SitemapEntry) for each page and ("sitemap", url) for each child sitemap of an index
+    """
+    parser = ElementTree.XMLPullParser(events=("start", "end"))
+    root = None
+
+    def drain_events():
+        nonlocal root
+        for event, element in parser.read_events():
+            if event == "start":
+                if root is None:
+                    root = element
+                continue
+            tag = element.tag.rsplit("}", 1)[-1]
+            if tag not in ("url", "sitemap"):
+                continue
+
+            loc = element.findtext("{*}loc")
+            if loc and loc.strip():
+                if tag == "sitemap":
+                    yield "sitemap", loc.strip()
+                else:
+                    lastmod = element.findtext("{*}lastmod")
+                    yield "url", SitemapEntry(
+                        loc=loc.strip(),
+                        lastmod=lastmod.strip() if lastmod and lastmod.strip() else None,
+                        priority=parse_priority(element.findtext("{*}priority"))
+                    )
+            # Drop parsed entries so the tree never grows past the current one
+            root.clear()
+
+    async with client.stream("GET", sitemap_url) as response:
+        if response.status_code != 200:
+            print(f"Error fetching sitemap {sitemap_url}: HTTP {response.status_code}")
+            return
+
+        decompressor = None
+        first_chunk = True
+        async for chunk in response.aiter_bytes():
+            if first_chunk:
+                first_chunk = False
+                # .xml.gz files are usually served as-is rather than with Content-Encoding: gzip
+                if chunk[:2] == GZIP_MAGIC:
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            parser.feed(decompressor.decompress(chunk) if decompressor else chunk)
+            for item in drain_events():
+                yield item
+
+        if decompressor:
+            parser.feed(decompressor.flush())
+        parser.close()
+        for item in drain_events():
+            yield item
+
+
+def parse_priority(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a sitemap <priority> value.
+
+    Args:
+        value: Text of the <priority> element, if any
+
+    Returns:
+        The priority, or None if missing or malformed
+    """
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
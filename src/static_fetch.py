@@ -0,0 +1,250 @@
+"""
+Browserless fetching of static resources for the Crawl4AI MCP server.
+"""
+import asyncio
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional
+from urllib.parse import urldefrag, urljoin, urlparse
+
+import httpx
+
+from crawl_scheduler import THROTTLE_STATUS_CODES
+
+# Content types returned as-is, without rendering
+TEXT_CONTENT_TYPES = ("text/plain", "text/markdown", "text/x-markdown")
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+# Paths fetched without the browser even when HTML conversion is disabled
+TEXT_SUFFIXES = (".txt", ".md", ".markdown")
+# Client errors that are final; other 4xx (often bot blocking) are retried in the browser
+FINAL_CLIENT_ERRORS = (404, 410)
+
+
+class StaticFetch(NamedTuple):
+    """Outcome of a browserless fetch that does not need the browser."""
+    status_code: int
+    headers: Mapping[str, str]
+    url: str
+    page: Optional[Dict[str, Any]]
+    error: Optional[str] = None
+
+
+class PageScanner(HTMLParser):
+    """Collects the links and the amount of visible text of an HTML document."""
+
+    HIDDEN_TAGS = ("script", "style", "noscript", "template", "svg")
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links: List[str] = []
+        self.text_chars = 0
+        self.noscript_text = ""
+        self._hidden: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.HIDDEN_TAGS:
+            self._hidden.append(tag)
+        elif tag == "a":
+            href = dict(attrs).get("href")
+            if href:
+                self.links.append(href)
+
+    def handle_endtag(self, tag):
+        if self._hidden and self._hidden[-1] == tag:
+            self._hidden.pop()
+
+    def handle_data(self, data):
+        if not self._hidden:
+            self.text_chars += len(data.strip())
+        elif self._hidden[-1] == "noscript":
+            self.noscript_text += data.lower()
+
+
+class StaticFetcher:
+    """
+    Fetches pages over a pooled HTTP client instead of the headless browser when possible.
+
+    Plain text and markdown (llms.txt, README.md, ...) are returned as-is. Static HTML is
+    converted to markdown with crawl4ai's markdown generator, without Chromium, when
+    convert_html is enabled. HTML with too little visible text, or asking for JavaScript,
+    is treated as client-rendered and left to the browser. Hosts whose pages keep needing
+    the browser are learned and skipped on later fetches.
+    """
+
+    def __init__(
+        self,
+        convert_html: bool = False,
+        max_bytes: int = 5 * 1024 * 1024,
+        min_text_chars: int = 500,
+        browser_host_threshold: int = 3,
+        max_connections: int = 50,
+        timeout: float = 20.0
+    ):
+        """
+        Create the fetcher and its connection pool.
+
+        Args:
+            convert_html: Convert static HTML to markdown instead of rendering it
+            max_bytes: Largest response read without the browser
+            min_text_chars: Visible characters below which HTML is treated as client-rendered
+            browser_host_threshold: Client-rendered pages, with no static page, after which a host always uses the browser
+            max_connections: Size of the connection pool
+            timeout: Timeout in seconds of each request
+        """
+        self.convert_html = convert_html
+        self.max_bytes = max_bytes
+        self.min_text_chars = min_text_chars
+        self.browser_host_threshold = browser_host_threshold
+        self.client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+        self._markdown_generator = None
+        self._static_pages: Dict[str, int] = {}
+        self._rendered_pages: Dict[str, int] = {}
+        self.fetched = 0
+        self.fallbacks = 0
+
+    def needs_browser(self, url: str) -> bool:
+        """
+        Check whether a URL should go straight to the browser.
+
+        Args:
+            url: URL to crawl
+
+        Returns:
+            True if the URL is not a text file and HTML conversion is disabled, or its host
+            was learned to be client-rendered
+        """
+        path = urlparse(url).path.lower()
+        if path.endswith(TEXT_SUFFIXES):
+            return False
+        if not self.convert_html:
+            return True
+        host = urlparse(url).netloc.lower()
+        return not self._static_pages.get(host) and self._rendered_pages.get(host, 0) >= self.browser_host_threshold
+
+    async def fetch(self, url: str) -> Optional[StaticFetch]:
+        """
+        Fetch a page without the browser.
+
+        Args:
+            url: URL to fetch
+
+        Returns:
+            The fetch outcome, with the page if it could be read without rendering, or None
+            if the URL needs the browser (client-rendered, unsupported type, too large, or
+            refused with a 4xx other than 404/410/429)
+        """
+        if self.needs_browser(url):
+            return None
+
+        async with self.client.stream("GET", url) as response:
+            final_url = str(response.url)
+            status = response.status_code
+            if 400 <= status < 500 and status not in FINAL_CLIENT_ERRORS and status not in THROTTLE_STATUS_CODES:
+                # Many sites refuse non-browser clients (e.g. 403) but serve the browser
+                return self._fallback(None)
+            if status != 200:
+                # Missing pages, throttling and server errors are reported as they are
+                return StaticFetch(status, response.headers, final_url, None, f"HTTP {status}")
+
+            content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+            is_text = content_type in TEXT_CONTENT_TYPES
+            is_html = content_type in HTML_CONTENT_TYPES
+            if not (is_text or (is_html and self.convert_html)):
+                return self._fallback(None)
+            if int(response.headers.get("content-length") or 0) > self.max_bytes:
+                return self._fallback(None)
+
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body.extend(chunk)
+                if len(body) > self.max_bytes:
+                    return self._fallback(None)
+            text = body.decode(response.encoding or "utf-8", errors="replace")
+
+        host = urlparse(final_url).netloc.lower()
+        links: List[str] = []
+        if is_html:
+            scanner = PageScanner()
+            await asyncio.to_thread(scanner.feed, text)
+            if scanner.text_chars < self.min_text_chars or (
+                "javascript" in scanner.noscript_text and scanner.text_chars < 2 * self.min_text_chars
+            ):
+                return self._fallback(host)
+            markdown = await asyncio.to_thread(self._html_to_markdown, text, final_url)
+            links = internal_links(scanner.links, final_url)
+        else:
+            markdown = text
+
+        if not markdown.strip():
+            return self._fallback(host if is_html else None)
+
+        self.fetched += 1
+        if is_html:
+            self._static_pages[host] = self._static_pages.get(host, 0) + 1
+        headers = response.headers
+        return StaticFetch(200, headers, final_url, {
+            'url': final_url,
+            'markdown': markdown,
+            'validators': {
+                'etag': headers.get('etag'),
+                'last_modified': headers.get('last-modified'),
+                'lastmod': None,
+                'links': links
+            }
+        })
+
+    def _fallback(self, rendered_host: Optional[str]) -> None:
+        self.fallbacks += 1
+        if rendered_host:
+            self._rendered_pages[rendered_host] = self._rendered_pages.get(rendered_host, 0) + 1
+        return None
+
+    def _html_to_markdown(self, html: str, url: str) -> str:
+        if self._markdown_generator is None:
+            from crawl4ai import DefaultMarkdownGenerator
+            self._markdown_generator = DefaultMarkdownGenerator()
+        return self._markdown_generator.generate_markdown(input_html=html, base_url=url).raw_markdown
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get counters of the fast path.
+
+        Returns:
+            Dictionary with pages fetched without the browser, fallbacks and browser-only hosts
+        """
+        return {
+            "pages_fetched": self.fetched,
+            "browser_fallbacks": self.fallbacks,
+            "browser_only_hosts": sorted(
+                host for host, count in self._rendered_pages.items()
+                if count >= self.browser_host_threshold and not self._static_pages.get(host)
+            )
+        }
+
+    async def close(self) -> None:
+        """Close the connection pool."""
+        await self.client.aclose()
+
+
+def internal_links(hrefs: List[str], base_url: str) -> List[str]:
+    """
+    Resolve the links of a page and keep those on its own host.
+
+    Args:
+        hrefs: href attributes found on the page
+        base_url: Final URL of the page
+
+    Returns:
+        Absolute internal URLs without fragments, in order of first appearance
+    """
+    host = urlparse(base_url).netloc.lower()
+    links = []
+    for href in hrefs:
+        url = urldefrag(urljoin(base_url, href.strip()))[0]
+        parsed = urlparse(url)
+        if parsed.scheme in ("http", "https") and parsed.netloc.lower() == host:
+            links.append(url)
+    return list(dict.fromkeys(links))
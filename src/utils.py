@@ -2,19 +2,546 @@
 Utility functions for the Crawl4AI MCP server.
 """
 import os
+import asyncio
 import concurrent.futures
-from typing import List, Dict, Any, Optional, Tuple
+import threading
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Optional, Tuple, Awaitable
 import json
-from supabase import create_client, Client
+import base64
+import numpy as np
+from supabase import acreate_client, AsyncClient
 from urllib.parse import urlparse
 import openai
 import re
-import time
+from pathlib import Path
 
-# Load OpenAI API key for embeddings
-openai.api_key = os.getenv("OPENAI_API_KEY")
+from caches import EmbeddingCache, QueryEmbeddingCache, ResultCache, content_hash
+from vector_index import LocalVectorIndex
 
-def get_or_create_source_uuid(client: Client, domain_name: str, table_name_for_source: str) -> Optional[str]:
+try:
+    import tiktoken
+except ImportError:  # Token counts fall back to a character-based estimate
+    tiktoken = None
+
+# Embedding backend and model used for documents, code examples and queries
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL") or (
+    "sentence-transformers/all-MiniLM-L6-v2" if EMBEDDING_PROVIDER == "local" else "text-embedding-3-small"
+)
+
+# Native embedding size of the OpenAI models, used when EMBEDDING_DIMENSIONS is not set
+OPENAI_EMBEDDING_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536
+}
+
+# Directory for local on-disk state (embedding cache, etc.)
+CACHE_DIR = os.getenv("CACHE_DIR") or str(Path(__file__).resolve().parent.parent / ".cache")
+
+# Threads available to blocking calls offloaded with asyncio.to_thread
+BLOCKING_EXECUTOR_MAX_WORKERS = int(os.getenv("BLOCKING_EXECUTOR_MAX_WORKERS", "8"))
+
+# Maximum number of embedding batches in flight at once during ingestion
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+
+# Budgets for packing embedding requests and Supabase insert payloads.
+# The embeddings API accepts up to 2048 inputs and 300k tokens per request, and 8191 tokens per input.
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "100000"))
+EMBEDDING_BATCH_MAX_ITEMS = int(os.getenv("EMBEDDING_BATCH_MAX_ITEMS", "256"))
+EMBEDDING_MAX_INPUT_TOKENS = 8191
+SUPABASE_INSERT_MAX_BYTES = int(os.getenv("SUPABASE_INSERT_MAX_BYTES", str(4 * 1024 * 1024)))
+
+# Contextual embeddings: "document" situates up to CONTEXTUAL_CHUNKS_PER_CALL chunks of a document
+# in one LLM call, "chunk" makes one call per chunk
+CONTEXTUAL_EMBEDDING_MODE = os.getenv("CONTEXTUAL_EMBEDDING_MODE", "document")
+CONTEXTUAL_CHUNKS_PER_CALL = int(os.getenv("CONTEXTUAL_CHUNKS_PER_CALL", "20"))
+CONTEXTUAL_MAX_CONCURRENCY = int(os.getenv("CONTEXTUAL_MAX_CONCURRENCY", "10"))
+
+# Kept constant so the system prompt + document prefix is identical across calls for a document
+CONTEXTUAL_DOCUMENT_SYSTEM_PROMPT = """You are a helpful assistant that provides concise contextual information.
+You will be given a document and a numbered list of chunks taken from it. For every chunk, give a short succinct context to situate the chunk within the overall document for the purposes of improving search retrieval of the chunk.
+Answer only with a JSON object of the form {"contexts": [{"index": <chunk index>, "context": "<succinct context>"}]} containing one entry per chunk."""
+
+_embedding_cache: Optional[EmbeddingCache] = None
+_query_embedding_cache: Optional[QueryEmbeddingCache] = None
+_result_cache: Optional[ResultCache] = None
+_local_vector_index: Optional[LocalVectorIndex] = None
+_async_openai_client: Optional[openai.AsyncOpenAI] = None
+_tokenizer = None
+
+def get_async_openai_client() -> openai.AsyncOpenAI:
+    """
+    Get the shared async OpenAI client, creating it on first use.
+
+    Returns:
+        AsyncOpenAI client instance
+    """
+    global _async_openai_client
+    if _async_openai_client is None:
+        _async_openai_client = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _async_openai_client
+
+class EmbeddingProvider(ABC):
+    """
+    Interface for the backends that turn texts into embeddings.
+    
+    Implementations embed a batch of texts in one call and expose the model name and
+    embedding dimension, which together identify their embeddings in the cache.
+    """
+
+    def __init__(self, model: str, dimension: Optional[int] = None):
+        self.model = model
+        self._dimension = dimension
+
+    @property
+    def dimension(self) -> int:
+        """Dimension of the embeddings produced by this provider."""
+        return self._dimension
+
+    @property
+    def cache_key(self) -> str:
+        """Identifier of this provider's embedding space, used to namespace cached embeddings."""
+        return f"{type(self).__name__}:{self.model}:{self.dimension}"
+
+    @abstractmethod
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed a batch of non-empty texts.
+        
+        Args:
+            texts: Texts to embed
+            
+        Returns:
+            float32 array of shape (len(texts), dimension)
+        """
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """Embeddings from the OpenAI embeddings API."""
+
+    def __init__(self, model: str = "text-embedding-3-small", dimension: Optional[int] = None):
+        # text-embedding-3 models can shorten their output; others only produce their native size
+        self._request_dimension = dimension
+        super().__init__(model, dimension or OPENAI_EMBEDDING_DIMENSIONS.get(model, 1536))
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        # Request base64 so embeddings are decoded straight into float32 arrays, never Python float lists
+        params = {"model": self.model, "input": texts, "encoding_format": "base64"}
+        if self._request_dimension:
+            params["dimensions"] = self._request_dimension
+        response = await get_async_openai_client().embeddings.create(**params)
+        if not response.data:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        # Raises AttributeError if an item is an error object rather than an embedding
+        return np.stack([
+            np.frombuffer(base64.b64decode(item.embedding), dtype=np.float32)
+            for item in sorted(response.data, key=lambda item: item.index)
+        ])
+
+class SentenceTransformerEmbeddingProvider(EmbeddingProvider):
+    """
+    Local CPU embeddings from a sentence-transformers model.
+    
+    Inference runs in batches off the event loop, optionally on the ONNX or OpenVINO runtime
+    with a quantized model file (e.g. "onnx/model_qint8_avx512_vnni.onnx").
+    """
+
+    def __init__(
+        self,
+        model: str,
+        dimension: Optional[int] = None,
+        backend: str = "torch",
+        model_file: Optional[str] = None,
+        batch_size: int = 32
+    ):
+        super().__init__(model, dimension)
+        self.backend = backend
+        self.model_file = model_file
+        self.batch_size = batch_size
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(
+                    self.model,
+                    device="cpu",
+                    backend=self.backend,
+                    model_kwargs={"file_name": self.model_file} if self.model_file else None,
+                    truncate_dim=self._dimension
+                )
+        return self._model
+
+    @property
+    def dimension(self) -> int:
+        if self._dimension is None:
+            self._dimension = self._load().get_sentence_embedding_dimension()
+        return self._dimension
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        model = self._load()
+        with self._lock:  # One inference at a time; each call is already batched
+            embeddings = model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True, show_progress_bar=False)
+        return np.asarray(embeddings, dtype=np.float32)
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        return await asyncio.to_thread(self._encode, texts)
+
+_embedding_provider: Optional[EmbeddingProvider] = None
+
+def get_embedding_provider() -> EmbeddingProvider:
+    """
+    Get the configured embedding provider, creating it on first use.
+    
+    EMBEDDING_PROVIDER selects "openai" (default) or "local" (sentence-transformers on CPU).
+    EMBEDDING_MODEL and EMBEDDING_DIMENSIONS override the model and embedding size.
+    
+    Returns:
+        The embedding provider
+    """
+    global _embedding_provider
+    if _embedding_provider is None:
+        dimension = int(os.getenv("EMBEDDING_DIMENSIONS")) if os.getenv("EMBEDDING_DIMENSIONS") else None
+        if EMBEDDING_PROVIDER == "local":
+            _embedding_provider = SentenceTransformerEmbeddingProvider(
+                EMBEDDING_MODEL,
+                dimension=dimension,
+                backend=os.getenv("LOCAL_EMBEDDING_BACKEND", "torch"),
+                model_file=os.getenv("LOCAL_EMBEDDING_MODEL_FILE") or None,
+                batch_size=int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "32"))
+            )
+        else:
+            _embedding_provider = OpenAIEmbeddingProvider(EMBEDDING_MODEL, dimension=dimension)
+    return _embedding_provider
+
+async def check_embedding_dimension() -> int:
+    """
+    Check that the embedding provider returns embeddings of its configured size.
+
+    Call this at startup: a mismatch would otherwise fail the shape check of every batch and
+    store zero vectors. Known OpenAI models are checked against their native size without a
+    request; other models embed a probe text, which for a remote API is a billed request.
+
+    Returns:
+        The embedding dimension
+
+    Raises:
+        ValueError: If the embeddings do not (or cannot) have the configured dimension
+    """
+    provider = get_embedding_provider()
+    if isinstance(provider, OpenAIEmbeddingProvider) and provider.model in OPENAI_EMBEDDING_DIMENSIONS:
+        native = OPENAI_EMBEDDING_DIMENSIONS[provider.model]
+        # Only the text-embedding-3 models can shorten their embeddings
+        shortenable = provider.model.startswith("text-embedding-3")
+        if provider.dimension > native or (provider.dimension != native and not shortenable):
+            raise ValueError(
+                f"Embedding model {provider.model} cannot return embeddings of dimension {provider.dimension} "
+                f"(native size {native}). Set EMBEDDING_DIMENSIONS to the model's size."
+            )
+        return provider.dimension
+
+    embeddings = await provider.embed(["dimension check"])
+    if embeddings.ndim != 2 or embeddings.shape[1] != provider.dimension:
+        raise ValueError(
+            f"Embedding model {provider.model} returned embeddings of shape {embeddings.shape}, "
+            f"expected dimension {provider.dimension}. Set EMBEDDING_DIMENSIONS to the model's size."
+        )
+    return provider.dimension
+
+def install_blocking_executor() -> None:
+    """
+    Bound the thread pool behind asyncio.to_thread on the running event loop.
+
+    Blocking calls that have no async API (local models, SQLite stores, the local vector
+    index) are offloaded with asyncio.to_thread; capping the pool at
+    BLOCKING_EXECUTOR_MAX_WORKERS keeps a large crawl from starving other requests of threads.
+    """
+    asyncio.get_running_loop().set_default_executor(
+        concurrent.futures.ThreadPoolExecutor(max_workers=BLOCKING_EXECUTOR_MAX_WORKERS, thread_name_prefix="blocking")
+    )
+
+async def gather_bounded(coroutines: List[Awaitable[Any]], limit: int) -> List[Any]:
+    """
+    Run coroutines concurrently with at most `limit` of them in flight at once.
+
+    Args:
+        coroutines: Coroutines to run
+        limit: Maximum number of coroutines running at the same time
+
+    Returns:
+        List of results in the same order as the coroutines
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(coroutine: Awaitable[Any]) -> Any:
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(run(c) for c in coroutines))
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Get the persistent embedding cache, creating it on first use.
+
+    Returns:
+        The embedding cache, or None if caching is disabled or the cache could not be opened
+    """
+    global _embedding_cache
+    if os.getenv("USE_EMBEDDING_CACHE", "true") != "true":
+        return None
+    if _embedding_cache is None:
+        try:
+            _embedding_cache = EmbeddingCache(
+                os.getenv("EMBEDDING_CACHE_PATH") or os.path.join(CACHE_DIR, "embeddings.sqlite"),
+                max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+            )
+        except Exception as e:
+            print(f"Failed to open embedding cache: {e}. Continuing without it.")
+            return None
+    return _embedding_cache
+
+def get_query_embedding_cache() -> Optional[QueryEmbeddingCache]:
+    """
+    Get the in-process query embedding cache, creating it on first use.
+
+    Returns:
+        The query embedding cache, or None if QUERY_EMBEDDING_CACHE_SIZE is 0
+    """
+    global _query_embedding_cache
+    max_entries = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+    if max_entries <= 0:
+        return None
+    if _query_embedding_cache is None:
+        _query_embedding_cache = QueryEmbeddingCache(
+            max_entries=max_entries,
+            ttl=float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "3600"))
+        )
+    return _query_embedding_cache
+
+def get_local_vector_index() -> Optional[LocalVectorIndex]:
+    """
+    Get the local vector index mirroring crawled_pages, opening it on first use.
+
+    Returns:
+        The local vector index, or None if USE_LOCAL_VECTOR_INDEX is not enabled or it could not be opened
+    """
+    global _local_vector_index
+    if os.getenv("USE_LOCAL_VECTOR_INDEX", "false") != "true":
+        return None
+    if _local_vector_index is None:
+        try:
+            _local_vector_index = LocalVectorIndex(
+                os.getenv("LOCAL_VECTOR_INDEX_DIR") or os.path.join(CACHE_DIR, "vector_index"),
+                get_embedding_provider().dimension,
+                ef_search=int(os.getenv("LOCAL_VECTOR_INDEX_EF_SEARCH", "64"))
+            )
+        except Exception as e:
+            print(f"Failed to open local vector index: {e}. Searching through Supabase only.")
+            return None
+    return _local_vector_index
+
+def get_result_cache() -> Optional[ResultCache]:
+    """
+    Get the in-process search result cache, creating it on first use.
+
+    Returns:
+        The result cache, or None if RESULT_CACHE_SIZE is 0
+    """
+    global _result_cache
+    max_entries = int(os.getenv("RESULT_CACHE_SIZE", "256"))
+    if max_entries <= 0:
+        return None
+    if _result_cache is None:
+        _result_cache = ResultCache(
+            max_entries=max_entries,
+            ttl=float(os.getenv("RESULT_CACHE_TTL", "3600"))
+        )
+    return _result_cache
+
+def invalidate_cached_results(urls: List[str]) -> None:
+    """
+    Invalidate cached search results for the sources of the given URLs.
+
+    Call this after content for those URLs has been written, so no result computed
+    during the write survives it.
+
+    Args:
+        urls: URLs whose content changed
+    """
+    if _result_cache is None:
+        return
+    for url in set(urls):
+        parsed_url = urlparse(url)
+        source_id = parsed_url.netloc or parsed_url.path
+        if source_id:
+            _result_cache.bump(source_id)
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a search query so trivially different spellings share one embedding.
+
+    Args:
+        query: Query text
+
+    Returns:
+        The query with surrounding whitespace stripped and inner whitespace collapsed
+    """
+    return " ".join(query.split())
+
+def get_tokenizer():
+    """
+    Get the local tokenizer used to budget embedding requests, loading it on first use.
+
+    Returns:
+        A tiktoken encoding, or None if tiktoken is not available
+    """
+    global _tokenizer
+    if _tokenizer is None and tiktoken is not None:
+        try:
+            _tokenizer = tiktoken.encoding_for_model(EMBEDDING_MODEL)
+        except Exception:
+            _tokenizer = tiktoken.get_encoding("cl100k_base")
+    return _tokenizer
+
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens in a text with the local tokenizer.
+    Falls back to a 4-characters-per-token estimate if no tokenizer is available.
+
+    Args:
+        text: Text to count tokens for
+
+    Returns:
+        Number of tokens
+    """
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return len(text) // 4 + 1
+    return len(tokenizer.encode(text, disallowed_special=()))
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Truncate a text to at most max_tokens tokens.
+
+    Args:
+        text: Text to truncate
+        max_tokens: Maximum number of tokens to keep
+
+    Returns:
+        The text, truncated if it was over the limit
+    """
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return text[:max_tokens * 4]
+    tokens = tokenizer.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return tokenizer.decode(tokens[:max_tokens])
+
+def pack_batches(sizes: List[int], max_total: int, max_items: int) -> List[Tuple[int, int]]:
+    """
+    Greedily pack consecutive items into batches bounded by a total size and an item count.
+    An item larger than max_total on its own gets a batch to itself.
+
+    Args:
+        sizes: Size of each item (tokens, bytes, ...)
+        max_total: Maximum summed size of a batch
+        max_items: Maximum number of items in a batch
+
+    Returns:
+        List of (start, end) index ranges covering all items in order
+    """
+    batches = []
+    start = 0
+    total = 0
+    for i, size in enumerate(sizes):
+        if i > start and (total + size > max_total or i - start >= max_items):
+            batches.append((start, i))
+            start = i
+            total = 0
+        total += size
+    if start < len(sizes):
+        batches.append((start, len(sizes)))
+    return batches
+
+def estimate_row_bytes(row: Dict[str, Any]) -> int:
+    """
+    Estimate the JSON payload size of a row sent to Supabase.
+
+    Args:
+        row: Row to be inserted, optionally with an 'embedding' array
+
+    Returns:
+        Approximate size in bytes
+    """
+    embedding = row.get("embedding")
+    size = len(json.dumps({k: v for k, v in row.items() if k != "embedding"}).encode("utf-8"))
+    if embedding is not None:
+        size += len(embedding) * 20  # Roughly 20 bytes per serialized float
+    return size
+
+async def upsert_rows(
+    client: AsyncClient,
+    table_name: str,
+    rows: List[Dict[str, Any]],
+    on_conflict: str = "url,chunk_number"
+) -> int:
+    """
+    Upsert rows into a Supabase table on their natural key, in payloads bounded by
+    SUPABASE_INSERT_MAX_BYTES, retrying failed payloads with exponential backoff and
+    finally row by row.
+
+    Rows replace the existing row with the same key in place, so a page being re-ingested
+    never has zero rows.
+
+    Args:
+        client: Supabase client
+        table_name: Name of the table to upsert into
+        rows: Rows to upsert
+        on_conflict: Comma-separated columns of the unique constraint to upsert on
+
+    Returns:
+        Number of rows written
+    """
+    inserted = 0
+    row_sizes = [estimate_row_bytes(row) for row in rows]
+    for start, end in pack_batches(row_sizes, SUPABASE_INSERT_MAX_BYTES, len(rows)):
+        # Embeddings are serialized to JSON lists only here, one payload at a time
+        batch_data = [
+            {**row, "embedding": row["embedding"].tolist()} if isinstance(row.get("embedding"), np.ndarray) else row
+            for row in rows[start:end]
+        ]
+        max_retries = 3
+        retry_delay = 1.0
+
+        for retry in range(max_retries):
+            try:
+                await client.table(table_name).upsert(batch_data, on_conflict=on_conflict).execute()
+                inserted += len(batch_data)
+                break # Success
+            except Exception as e:
+                if retry < max_retries - 1:
+                    print(f"Error upserting batch into Supabase (attempt {retry + 1}/{max_retries}): {e}")
+                    print(f"Retrying in {retry_delay} seconds...")
+                    await asyncio.sleep(retry_delay)
+                    retry_delay *= 2
+                else:
+                    print(f"Failed to upsert batch after {max_retries} attempts: {e}. Attempting individual upserts.")
+                    successful_inserts = 0
+                    for record in batch_data:
+                        try:
+                            await client.table(table_name).upsert(record, on_conflict=on_conflict).execute()
+                            successful_inserts += 1
+                        except Exception as individual_error:
+                            print(f"Failed to upsert individual record for URL {record.get('url', 'N/A')}: {individual_error}")
+                    print(f"Successfully upserted {successful_inserts}/{len(batch_data)} records individually after batch failure.")
+                    inserted += successful_inserts
+    return inserted
+
+async def get_or_create_source_uuid(client: AsyncClient, domain_name: str, table_name_for_source: str) -> Optional[str]:
     """
     Retrieves the UUID of an existing source by its domain name or creates a new source entry
     if it doesn't exist, then returns the UUID.
@@ -33,9 +560,9 @@ def get_or_create_source_uuid(client: Client, domain_name: str, table_name_for_s
         
     try:
         # Check if the source already exists
-        response = client.table("sources").select("id").eq("source", domain_name).maybe_single().execute()
+        response = await client.table("sources").select("id").eq("source", domain_name).maybe_single().execute()
         
-        if response.data:
+        if response and response.data:
             return response.data["id"]
         else:
             # Source does not exist, create it
@@ -47,22 +574,22 @@ def get_or_create_source_uuid(client: Client, domain_name: str, table_name_for_s
                 "summary": f"Content from {domain_name}", # Default summary
                 "total_words": 0 # Default word count
             }
-            insert_response = client.table("sources").insert(insert_data).execute()
+            insert_response = await client.table("sources").insert(insert_data).execute()
             if insert_response.data and len(insert_response.data) > 0:
                 return insert_response.data[0]["id"] # Return the new UUID
             else:
-                print(f"Error creating new source {domain_name}: No data returned after insert. Error: {insert_response.error}")
+                print(f"Error creating new source {domain_name}: No data returned after insert.")
                 return None
     except Exception as e:
         print(f"Exception in get_or_create_source_uuid for {domain_name}: {e}")
         return None
 
-def get_supabase_client() -> Client:
+async def get_supabase_client() -> AsyncClient:
     """
-    Get a Supabase client with the URL and key from environment variables.
+    Get an async Supabase client with the URL and key from environment variables.
     
     Returns:
-        Supabase client instance
+        Async Supabase client instance
     """
     url = os.getenv("SUPABASE_URL")
     key = os.getenv("SUPABASE_SERVICE_KEY")
@@ -70,26 +597,26 @@ def get_supabase_client() -> Client:
     if not url or not key:
         raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set in environment variables")
     
-    return create_client(url, key)
+    return await acreate_client(url, key)
 
-def create_embeddings_batch(texts: List[str]) -> List[List[float]]:
+async def create_embeddings_batch(texts: List[str]) -> np.ndarray:
     """
-    Create embeddings for multiple texts in a single API call.
+    Create embeddings for multiple texts in a single provider call without blocking the event loop.
+    Texts already present in the embedding cache are not sent to the provider.
     
     Args:
         texts: List of texts to create embeddings for
         
     Returns:
-        List of embeddings (each embedding is a list of floats)
+        float32 array of shape (len(texts), dimension); rows for empty or failed texts are zero vectors
     """
-    if not texts:
-        return []
-
-    # Assuming 1536 is the embedding dimension for "text-embedding-3-small"
-    embedding_dim = 1536 
+    provider = get_embedding_provider()
+    embedding_dim = provider.dimension
     
     # Initialize final_embeddings with zero vectors, matching the length of the original texts list
-    final_embeddings = [[0.0] * embedding_dim for _ in range(len(texts))]
+    final_embeddings = np.zeros((len(texts), embedding_dim), dtype=np.float32)
+    if not texts:
+        return final_embeddings
 
     # Identify valid texts and their original indices
     valid_texts_with_indices = []
@@ -101,86 +628,158 @@ def create_embeddings_batch(texts: List[str]) -> List[List[float]]:
         # All texts were empty or whitespace, return all zero vectors
         return final_embeddings
 
+    # Serve what we can from the embedding cache; only misses go to the API
+    cache = get_embedding_cache()
+    if cache:
+        try:
+            cached = await asyncio.to_thread(cache.get_many, provider.cache_key, [text for _, text in valid_texts_with_indices])
+        except Exception as e:
+            print(f"Error reading embedding cache: {e}")
+            cached = {}
+        for k, embedding in cached.items():
+            final_embeddings[valid_texts_with_indices[k][0]] = embedding
+        valid_texts_with_indices = [item for k, item in enumerate(valid_texts_with_indices) if k not in cached]
+        if not valid_texts_with_indices:
+            return final_embeddings
+
     original_indices, texts_to_embed_list = zip(*valid_texts_with_indices)
+    original_indices = np.asarray(original_indices)
     texts_to_embed = list(texts_to_embed_list) # Ensure it's a list for the API
+    # Inputs over the model's per-input token limit are truncated rather than failing the whole batch
+    api_inputs = [truncate_to_tokens(text, EMBEDDING_MAX_INPUT_TOKENS) for text in texts_to_embed]
 
     max_retries = 3
     retry_delay = 1.0
-    embeddings_for_valid_texts = [] # Stores embeddings for non-empty inputs
+    embeddings_for_valid_texts = np.zeros((len(texts_to_embed), embedding_dim), dtype=np.float32)
 
-    if texts_to_embed: # Proceed only if there are valid texts to embed
-        for retry in range(max_retries):
-            try:
-                api_response = openai.embeddings.create(
-                    model="text-embedding-3-small",
-                    input=texts_to_embed
+    for retry in range(max_retries):
+        try:
+            # Any exception raised by the provider (including for partial failures) is caught by
+            # the outer 'except Exception as e:' block, leading to the retry and fallback logic.
+            current_embeddings = await provider.embed(api_inputs)
+
+            if current_embeddings.shape == embeddings_for_valid_texts.shape:
+                embeddings_for_valid_texts = current_embeddings
+                break  # Success: batch processing completed and all items yielded embeddings.
+            else:
+                # If the provider returns a different number of embeddings (or a different dimension)
+                # than expected without raising, this is an unexpected state.
+                # We force a fallback to ensure all texts are processed.
+                print(f"Warning: Batch embedding API returned shape {current_embeddings.shape} for {len(texts_to_embed)} inputs. Triggering fallback.")
+                raise ValueError("Batch embedding response shape mismatch, ensuring all texts are processed individually.")
+        except Exception as e:
+            if retry < max_retries - 1:
+                print(f"Error creating batch embeddings (attempt {retry + 1}/{max_retries}): {e}")
+                print(f"Retrying in {retry_delay} seconds...")
+                await asyncio.sleep(retry_delay)
+                retry_delay *= 2  # Exponential backoff
+            else:
+                print(f"Failed to create batch embeddings after {max_retries} attempts: {e}")
+                # Fallback: try creating embeddings one by one for the valid texts
+                print("Attempting to create embeddings individually for valid texts...")
+
+                async def embed_single(i: int) -> None:
+                    try:
+                        embeddings_for_valid_texts[i] = (await provider.embed([api_inputs[i]]))[0]
+                    except Exception as individual_error:
+                        # Left as a zero vector
+                        print(f"Failed to create individual embedding for text (len {len(api_inputs[i])}): {individual_error}")
+
+                await gather_bounded(
+                    [embed_single(i) for i in range(len(api_inputs))],
+                    EMBEDDING_MAX_CONCURRENCY
                 )
+                break # Break from retry loop (after attempting individual embeddings)
 
-                if len(api_response.data) == len(texts_to_embed):
-                    # This list comprehension will raise AttributeError if any item in api_response.data
-                    # does not have an 'embedding' attribute (e.g., it's an error object).
-                    # This exception will be caught by the outer 'except Exception as e:' block,
-                    # leading to the fallback logic, which is the desired behavior for partial failures.
-                    current_embeddings = [item.embedding for item in api_response.data]
-                    embeddings_for_valid_texts = current_embeddings
-                    break  # Success: batch processing completed and all items yielded embeddings.
-                else:
-                    # If the API returns a list of a different length than the input,
-                    # without the client library raising an exception, this is an unexpected state.
-                    # We force a fallback to ensure all texts are processed.
-                    print(f"Warning: Batch embedding API returned {len(api_response.data)} items for {len(texts_to_embed)} inputs. Triggering fallback.")
-                    raise ValueError("Batch embedding response length mismatch, ensuring all texts are processed individually.")
-            except Exception as e:
-                if retry < max_retries - 1:
-                    print(f"Error creating batch embeddings (attempt {retry + 1}/{max_retries}): {e}")
-                    print(f"Retrying in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # Exponential backoff
-                else:
-                    print(f"Failed to create batch embeddings after {max_retries} attempts: {e}")
-                    # Fallback: try creating embeddings one by one for the valid texts
-                    print("Attempting to create embeddings individually for valid texts...")
-                    temp_individual_embeddings = []
-                    for single_text in texts_to_embed:
-                        try:
-                            individual_response = openai.embeddings.create(
-                                model="text-embedding-3-small",
-                                input=[single_text]  # API expects a list even for a single item
-                            )
-                            temp_individual_embeddings.append(individual_response.data[0].embedding)
-                        except Exception as individual_error:
-                            print(f"Failed to create individual embedding for text (len {len(single_text)}): {individual_error}")
-                            temp_individual_embeddings.append([0.0] * embedding_dim) # Use zero vector on failure
-                    embeddings_for_valid_texts = temp_individual_embeddings
-                    break # Break from retry loop (after attempting individual embeddings)
-    
-    # Populate final_embeddings with successfully created embeddings at their original positions
-    for i, original_idx in enumerate(original_indices):
-        if i < len(embeddings_for_valid_texts): # Ensure we have an embedding for this index
-            final_embeddings[original_idx] = embeddings_for_valid_texts[i]
-        # If not, it remains a zero vector (already initialized)
+    # Non-finite rows are treated as failures; failures and zero rows stay zero vectors
+    valid_rows = valid_embedding_mask(embeddings_for_valid_texts)
+    final_embeddings[original_indices[valid_rows]] = embeddings_for_valid_texts[valid_rows]
+
+    # Only real embeddings are cached; zero vectors from failures are retried next time
+    if cache and valid_rows.any():
+        try:
+            await asyncio.to_thread(
+                cache.put_many,
+                provider.cache_key,
+                [text for text, valid in zip(texts_to_embed, valid_rows) if valid],
+                embeddings_for_valid_texts[valid_rows]
+            )
+        except Exception as e:
+            print(f"Error writing embedding cache: {e}")
 
     return final_embeddings
 
-def create_embedding(text: str) -> List[float]:
+def valid_embedding_mask(embeddings: np.ndarray) -> np.ndarray:
+    """
+    Check which rows of an embedding matrix are usable.
+    
+    Args:
+        embeddings: float32 array of shape (n, dimension)
+        
+    Returns:
+        Boolean array of shape (n,), False for rows that are all zeros or contain NaN/inf
+    """
+    return np.isfinite(embeddings).all(axis=1) & embeddings.any(axis=1)
+
+async def create_embedding(text: str) -> np.ndarray:
     """
-    Create an embedding for a single text using OpenAI's API.
+    Create an embedding for a single text with the configured embedding provider.
     
     Args:
         text: Text to create an embedding for
         
     Returns:
-        List of floats representing the embedding
+        float32 array representing the embedding
     """
     try:
-        embeddings = create_embeddings_batch([text])
-        return embeddings[0] if embeddings else [0.0] * 1536
+        return (await create_embeddings_batch([text]))[0]
     except Exception as e:
         print(f"Error creating embedding: {e}")
         # Return empty embedding if there's an error
-        return [0.0] * 1536
+        return np.zeros(get_embedding_provider().dimension, dtype=np.float32)
+
+async def create_query_embedding(query: str) -> np.ndarray:
+    """
+    Create the embedding of a search query, served from the in-process query cache when possible.
+    
+    Args:
+        query: Query text, already normalized with normalize_query
+        
+    Returns:
+        float32 array representing the embedding (read-only when it comes from the cache)
+    """
+    return (await create_query_embeddings([query]))[0]
+
+async def create_query_embeddings(queries: List[str]) -> List[np.ndarray]:
+    """
+    Create the embeddings of several search queries, embedding every cache miss in one batch.
+    
+    Args:
+        queries: Query texts, already normalized with normalize_query
+        
+    Returns:
+        List of float32 arrays aligned with queries (read-only when they come from the cache)
+    """
+    cache = get_query_embedding_cache()
+    if cache is None:
+        return list(await create_embeddings_batch(queries))
+
+    cache_key_prefix = get_embedding_provider().cache_key
+    keys = [f"{cache_key_prefix}\0{query}" for query in queries]
+    embeddings: List[Optional[np.ndarray]] = [cache.get(key) for key in keys]
+    missing = list(dict.fromkeys(query for query, embedding in zip(queries, embeddings) if embedding is None))
+    if missing:
+        new_embeddings = await create_embeddings_batch(missing)
+        valid = valid_embedding_mask(new_embeddings)
+        by_query = dict(zip(missing, new_embeddings))
+        for query, embedding, is_valid in zip(missing, new_embeddings, valid):
+            # Failed embeddings come back as zero vectors; don't pin them in the cache
+            if is_valid:
+                cache.put(f"{cache_key_prefix}\0{query}", embedding)
+        embeddings = [by_query[query] if embedding is None else embedding for query, embedding in zip(queries, embeddings)]
+    return embeddings
 
-def generate_contextual_embedding(full_document: str, chunk: str) -> Tuple[str, bool]:
+async def generate_contextual_embedding(full_document: str, chunk: str) -> Tuple[str, bool]:
     """
     Generate contextual information for a chunk within a document to improve retrieval.
     
@@ -207,7 +806,7 @@ Here is the chunk we want to situate within the whole document
 Please give a short succinct context to situate this chunk within the overall document for the purposes of improving search retrieval of the chunk. Answer only with the succinct context and nothing else."""
 
         # Call the OpenAI API to generate contextual information
-        response = openai.chat.completions.create(
+        response = await get_async_openai_client().chat.completions.create(
             model=model_choice,
             messages=[
                 {"role": "system", "content": "You are a helpful assistant that provides concise contextual information."},
@@ -228,34 +827,229 @@ Please give a short succinct context to situate this chunk within the overall do
         print(f"Error generating contextual embedding: {e}. Using original chunk instead.")
         return chunk, False
 
-def process_chunk_with_context(args):
+async def contextualize_contents(
+    urls: List[str],
+    contents: List[str],
+    metadatas: List[Dict[str, Any]],
+    url_to_full_document: Dict[str, str]
+) -> List[str]:
+    """
+    Generate contextual text for a batch of chunks concurrently, one LLM call per chunk.
+    Marks the metadata of every successfully contextualized chunk with contextual_embedding=True.
+
+    Args:
+        urls: URLs of the chunks
+        contents: Chunk contents
+        metadatas: Chunk metadata (updated in place)
+        url_to_full_document: Dictionary mapping URLs to their full document content
+
+    Returns:
+        Contextual contents aligned with the input chunks
+    """
+    results = await gather_bounded(
+        [
+            generate_contextual_embedding(url_to_full_document.get(urls[j], ""), content)
+            for j, content in enumerate(contents)
+        ],
+        CONTEXTUAL_MAX_CONCURRENCY
+    )
+
+    contextual_results_ordered = []
+    for j, (result_text, success_flag) in enumerate(results):
+        contextual_results_ordered.append(result_text)
+        if success_flag:
+            metadatas[j]["contextual_embedding"] = True
+    return contextual_results_ordered
+
+async def generate_document_contexts(full_document: str, chunks: List[str]) -> List[Tuple[str, bool]]:
     """
-    Process a single chunk with contextual embedding.
-    This function is designed to be used with concurrent.futures.
+    Generate contextual information for several chunks of one document in a single LLM call.
+    
+    The system prompt and the document come first and are identical for every call made for the
+    same document, so provider-side prompt caching applies when a document needs several calls.
+    The model answers with a JSON object mapping chunk indices to contexts.
     
     Args:
-        args: Tuple containing (url, content, full_document)
+        full_document: The complete document text
+        chunks: The chunks of the document to generate context for
         
     Returns:
-        Tuple containing:
+        List aligned with chunks of tuples containing:
         - The contextual text that situates the chunk within the document
         - Boolean indicating if contextual embedding was performed
     """
-    url, content, full_document = args
-    return generate_contextual_embedding(full_document, content)
+    model_choice = os.getenv("MODEL_CHOICE")
+    chunk_list = "\n".join(f'<chunk index="{i}">\n{chunk}\n</chunk>' for i, chunk in enumerate(chunks))
+
+    try:
+        response = await get_async_openai_client().chat.completions.create(
+            model=model_choice,
+            messages=[
+                {"role": "system", "content": CONTEXTUAL_DOCUMENT_SYSTEM_PROMPT},
+                {"role": "user", "content": f"<document>\n{full_document[:25000]}\n</document>"},
+                {"role": "user", "content": f"Here are the chunks we want to situate within the whole document:\n{chunk_list}"}
+            ],
+            response_format={"type": "json_object"},
+            max_completion_tokens=150 * len(chunks) + 100
+        )
+
+        contexts = {}
+        for item in json.loads(response.choices[0].message.content).get("contexts", []):
+            index = item.get("index")
+            context = (item.get("context") or "").strip()
+            if isinstance(index, int) and 0 <= index < len(chunks) and context:
+                contexts[index] = context
+
+        if len(contexts) < len(chunks):
+            print(f"Warning: Contexts returned for {len(contexts)}/{len(chunks)} chunks. Using original content for the rest.")
+
+        # Combine each context with its original chunk
+        return [
+            (f"{contexts[i]}\n---\n{chunk}", True) if i in contexts else (chunk, False)
+            for i, chunk in enumerate(chunks)
+        ]
+
+    except Exception as e:
+        print(f"Error generating document contexts: {e}. Using original chunks instead.")
+        return [(chunk, False) for chunk in chunks]
+
+async def contextualize_documents(
+    urls: List[str],
+    contents: List[str],
+    metadatas: List[Dict[str, Any]],
+    url_to_full_document: Dict[str, str]
+) -> List[str]:
+    """
+    Generate contextual text for chunks grouped by document, with one LLM call per
+    CONTEXTUAL_CHUNKS_PER_CALL chunks of a document instead of one call per chunk.
+    Marks the metadata of every successfully contextualized chunk with contextual_embedding=True.
+
+    Args:
+        urls: URLs of the chunks
+        contents: Chunk contents
+        metadatas: Chunk metadata (updated in place)
+        url_to_full_document: Dictionary mapping URLs to their full document content
+
+    Returns:
+        Contextual contents aligned with the input chunks
+    """
+    indices_by_url: Dict[str, List[int]] = {}
+    for j, url in enumerate(urls):
+        indices_by_url.setdefault(url, []).append(j)
+
+    groups = []
+    for url, indices in indices_by_url.items():
+        for start in range(0, len(indices), CONTEXTUAL_CHUNKS_PER_CALL):
+            groups.append((url, indices[start:start + CONTEXTUAL_CHUNKS_PER_CALL]))
+
+    results = await gather_bounded(
+        [generate_document_contexts(url_to_full_document.get(url, ""), [contents[j] for j in indices]) for url, indices in groups],
+        CONTEXTUAL_MAX_CONCURRENCY
+    )
+
+    contextual_contents = list(contents)
+    for (_, indices), group_results in zip(groups, results):
+        for j, (result_text, success_flag) in zip(indices, group_results):
+            contextual_contents[j] = result_text
+            if success_flag:
+                metadatas[j]["contextual_embedding"] = True
+    return contextual_contents
+
+async def fetch_chunk_hashes(client: AsyncClient, table_name: str, urls: List[str]) -> Dict[Tuple[str, int], Optional[str]]:
+    """
+    Fetch the stored content hash of every chunk for a set of URLs.
+
+    Args:
+        client: Supabase client
+        table_name: Name of the table holding the chunks
+        urls: URLs to fetch chunk hashes for
+
+    Returns:
+        Dictionary mapping (url, chunk_number) to the stored content hash (None for rows stored without one)
+    """
+    hashes: Dict[Tuple[str, int], Optional[str]] = {}
+    page_size = 1000  # PostgREST's default maximum rows per response
+    for start in range(0, len(urls), 20):
+        url_slice = urls[start:start + 20]
+        offset = 0
+        while True:
+            response = await client.table(table_name)\
+                .select("url, chunk_number, content_hash")\
+                .in_("url", url_slice)\
+                .order("id")\
+                .range(offset, offset + page_size - 1)\
+                .execute()
+            rows = response.data or []
+            for row in rows:
+                hashes[(row["url"], row["chunk_number"])] = row.get("content_hash")
+            if len(rows) < page_size:
+                break
+            offset += page_size
+    return hashes
+
+async def prune_chunks(client: AsyncClient, table_name: str, chunk_counts: Dict[str, int]) -> int:
+    """
+    Delete the trailing chunks of pages that now produce fewer chunks than before.
+
+    Every chunk numbered at or above a URL's new chunk count is removed in a single statement
+    for all URLs, through the prune_<table_name> database function. Databases without the
+    function fall back to one delete per URL.
+
+    Args:
+        client: Supabase client
+        table_name: Name of the table holding the chunks ('crawled_pages' or 'code_examples')
+        chunk_counts: Dictionary mapping each URL to the number of chunks it now has
+
+    Returns:
+        Number of rows deleted (-1 if unknown)
+    """
+    if not chunk_counts:
+        return 0
+
+    local_index = get_local_vector_index() if table_name == "crawled_pages" else None
+    if local_index:
+        try:
+            await asyncio.to_thread(local_index.prune, chunk_counts)
+        except Exception as e:
+            print(f"Error pruning local vector index: {e}")
+
+    urls = list(chunk_counts)
+    try:
+        response = await client.rpc(f"prune_{table_name}", {
+            "urls": urls,
+            "chunk_counts": [chunk_counts[url] for url in urls]
+        }).execute()
+        invalidate_cached_results(urls)
+        return response.data if isinstance(response.data, int) else -1
+    except Exception as e:
+        print(f"Error pruning {table_name} with prune_{table_name} ({e}). Falling back to one delete per URL.")
+
+    for url in urls:
+        try:
+            await client.table(table_name).delete().eq("url", url).gte("chunk_number", chunk_counts[url]).execute()
+        except Exception as e:
+            print(f"Error pruning {table_name} chunks for URL {url}: {e}")
+    invalidate_cached_results(urls)
+    return -1
 
-def add_documents_to_supabase(
-    client: Client, 
+async def add_documents_to_supabase(
+    client: AsyncClient, 
     urls: List[str], 
     chunk_numbers: List[int],
     contents: List[str], 
     metadatas: List[Dict[str, Any]],
-    url_to_full_document: Dict[str, str],
-    batch_size: int = 20
-) -> None:
+    url_to_full_document: Dict[str, str]
+) -> Dict[str, int]:
     """
-    Add documents to the Supabase crawled_pages table in batches.
-    Deletes existing records with the same URLs before inserting to prevent duplicates.
+    Add documents to the Supabase crawled_pages table.
+    
+    Each chunk is stored with a hash of its content. Chunks whose hash matches the row already
+    stored for the same (url, chunk_number) are skipped entirely; only new or changed chunks are
+    contextualized, embedded and upserted over their previous row, and trailing chunks that
+    disappeared from a page are pruned in one statement. Chunks whose embedding or contextual
+    text failed are stored without a hash, so the next ingest retries them. Every chunk of a page must be passed
+    in the same call. Chunks are packed into embedding requests by token budget, and rows into
+    upsert payloads by size, with up to EMBEDDING_MAX_CONCURRENCY embedding requests in flight.
     
     Args:
         client: Supabase client
@@ -264,182 +1058,232 @@ def add_documents_to_supabase(
         contents: List of document contents
         metadatas: List of document metadata
         url_to_full_document: Dictionary mapping URLs to their full document content
-        batch_size: Size of each batch for insertion
+        
+    Returns:
+        Dictionary with the number of chunks inserted, skipped as unchanged and deleted
     """
     domain_to_uuid_cache: Dict[str, Optional[str]] = {} # Initialize cache for source UUIDs
-
-    # Get unique URLs to delete existing records
-    unique_urls_to_delete = list(set(urls))
-    
-    try:
-        if unique_urls_to_delete:
-            client.table("crawled_pages").delete().in_("url", unique_urls_to_delete).execute()
-    except Exception as e:
-        print(f"Batch delete failed: {e}. Trying one-by-one deletion as fallback.")
-        for url_del in unique_urls_to_delete:
-            try:
-                client.table("crawled_pages").delete().eq("url", url_del).execute()
-            except Exception as inner_e:
-                print(f"Error deleting record for URL {url_del}: {inner_e}")
     
     use_contextual_embeddings = os.getenv("USE_CONTEXTUAL_EMBEDDINGS", "false") == "true"
     print(f"\n\nUse contextual embeddings: {use_contextual_embeddings}\n\n")
-    
-    for i in range(0, len(contents), batch_size):
-        batch_end = min(i + batch_size, len(contents))
-        
-        # Initial slices for the current main batch
-        _current_batch_urls = urls[i:batch_end]
-        _current_batch_chunk_numbers = chunk_numbers[i:batch_end]
-        _current_batch_contents = contents[i:batch_end]
-        _current_batch_metadatas = metadatas[i:batch_end]
-        
-        # 1. Get source UUIDs for the current batch, using cache
-        _current_batch_source_uuids: List[Optional[str]] = []
-        for url_in_sub_batch in _current_batch_urls:
-            parsed_url_for_source = urlparse(url_in_sub_batch)
-            domain_name_for_source = parsed_url_for_source.netloc or parsed_url_for_source.path
-            if not domain_name_for_source:
-                print(f"Warning: Could not determine domain for URL {url_in_sub_batch}. Will skip this record.")
-                _current_batch_source_uuids.append(None)
-                continue
-            
-            source_uuid: Optional[str] = None
-            if domain_name_for_source in domain_to_uuid_cache:
-                source_uuid = domain_to_uuid_cache[domain_name_for_source]
-            else:
-                table_name_for_this_source = f"crawled_pages_{domain_name_for_source.replace('.', '_').replace('-', '_')}"
-                source_uuid = get_or_create_source_uuid(client, domain_name_for_source, table_name_for_this_source)
-                domain_to_uuid_cache[domain_name_for_source] = source_uuid # Cache the result
-            
-            _current_batch_source_uuids.append(source_uuid)
-
-        # 2. Filter items: only keep those with a valid source_uuid
-        final_batch_urls: List[str] = []
-        final_batch_chunk_numbers: List[int] = []
-        final_batch_contents: List[str] = []
-        final_batch_metadatas: List[Dict[str, Any]] = []
-        final_batch_source_uuids: List[str] = [] # Guaranteed to be str, not Optional[str]
-
-        for k in range(len(_current_batch_urls)):
-            source_uuid_val = _current_batch_source_uuids[k]
-            if source_uuid_val:
-                final_batch_urls.append(_current_batch_urls[k])
-                final_batch_chunk_numbers.append(_current_batch_chunk_numbers[k])
-                final_batch_contents.append(_current_batch_contents[k])
-                final_batch_metadatas.append(_current_batch_metadatas[k])
-                final_batch_source_uuids.append(source_uuid_val)
-            else:
-                print(f"Warning: URL {_current_batch_urls[k]} is being skipped due to missing source UUID (no embedding/contextualization performed).")
 
-        if not final_batch_contents: # If all items in this batch were filtered out
-            print(f"Info: All items in batch starting at original index {i} were skipped due to missing source UUIDs.")
-            continue
+    # Hash what determines the stored row: the raw chunk, the embedding model and the contextual mode
+    hash_namespace = f"{get_embedding_provider().cache_key}:{'contextual' if use_contextual_embeddings else 'plain'}"
+    content_hashes = [content_hash(hash_namespace, content) for content in contents]
 
-        # 3. Apply contextual embedding (if enabled) to the filtered batch
-        contextual_contents: List[str]
-        if use_contextual_embeddings and final_batch_contents:
-            contextual_results_ordered = [None] * len(final_batch_contents)
-            
-            with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                future_to_final_idx = {}
-                for j_final, content_final in enumerate(final_batch_contents):
-                    url_final = final_batch_urls[j_final]
-                    full_document = url_to_full_document.get(url_final, "")
-                    future = executor.submit(process_chunk_with_context, (url_final, content_final, full_document))
-                    future_to_final_idx[future] = j_final
-                
-                for future in concurrent.futures.as_completed(future_to_final_idx):
-                    j_final_idx = future_to_final_idx[future]
-                    try:
-                        result_text, success_flag = future.result()
-                        contextual_results_ordered[j_final_idx] = result_text
-                        if success_flag:
-                            final_batch_metadatas[j_final_idx]["contextual_embedding"] = True
-                    except Exception as e:
-                        print(f"Error processing chunk for URL {final_batch_urls[j_final_idx]} (final index {j_final_idx}): {e}. Using original content.")
-                        contextual_results_ordered[j_final_idx] = final_batch_contents[j_final_idx] # Fallback
-            contextual_contents = contextual_results_ordered
-        elif final_batch_contents: # Not using contextual embeddings, but have content
-            contextual_contents = final_batch_contents
-        else: # Should have been caught by "if not final_batch_contents" already
-            contextual_contents = []
-
-
-        # 4. Create embeddings for the (filtered and potentially contextualized) batch
-        batch_embeddings = create_embeddings_batch(contextual_contents)
-        
-        # 5. Prepare batch_data for insertion (all items here are valid and have a source_id)
-        batch_data_to_insert = []
-        for j_final in range(len(contextual_contents)):
-            # All lists (final_batch_*, contextual_contents, batch_embeddings) are aligned and filtered
-            data = {
-                "url": final_batch_urls[j_final],
-                "chunk_number": final_batch_chunk_numbers[j_final],
-                "content": contextual_contents[j_final],
+    unique_urls = list(dict.fromkeys(urls))
+    try:
+        stored_hashes = await fetch_chunk_hashes(client, "crawled_pages", unique_urls)
+    except Exception as e:
+        # Without stored hashes we can't diff, so every chunk is re-ingested and upserted in place
+        print(f"Error fetching stored chunk hashes: {e}. Re-ingesting all chunks.")
+        stored_hashes = None
+
+    # Chunks are numbered 0..n-1 per page, so anything numbered n or above is stale
+    chunk_counts: Dict[str, int] = {}
+    for url, chunk_number in zip(urls, chunk_numbers):
+        chunk_counts[url] = max(chunk_counts.get(url, 0), chunk_number + 1)
+
+    changed_indices = list(range(len(contents)))
+    stats = {"inserted": 0, "unchanged": 0, "deleted": 0}
+    if stored_hashes is not None:
+        changed_indices = [
+            k for k in range(len(contents))
+            if stored_hashes.get((urls[k], chunk_numbers[k])) != content_hashes[k]
+        ]
+        stats["unchanged"] = len(contents) - len(changed_indices)
+        stats["deleted"] = sum(1 for url, chunk_number in stored_hashes if chunk_number >= chunk_counts.get(url, 0))
+        print(f"Incremental ingest: {len(changed_indices)} new or changed chunks, {stats['unchanged']} unchanged, {stats['deleted']} removed")
+
+    # 1. Filter items: only keep those with a valid source_uuid
+    final_urls: List[str] = []
+    final_chunk_numbers: List[int] = []
+    final_contents: List[str] = []
+    final_metadatas: List[Dict[str, Any]] = []
+    final_source_uuids: List[str] = [] # Guaranteed to be str, not Optional[str]
+    final_hashes: List[str] = []
+
+    for k in changed_indices:
+        url = urls[k]
+        parsed_url_for_source = urlparse(url)
+        domain_name_for_source = parsed_url_for_source.netloc or parsed_url_for_source.path
+        source_uuid: Optional[str] = None
+        if not domain_name_for_source:
+            print(f"Warning: Could not determine domain for URL {url}. Will skip this record.")
+        elif domain_name_for_source in domain_to_uuid_cache:
+            source_uuid = domain_to_uuid_cache[domain_name_for_source]
+        else:
+            table_name_for_this_source = f"crawled_pages_{domain_name_for_source.replace('.', '_').replace('-', '_')}"
+            source_uuid = await get_or_create_source_uuid(client, domain_name_for_source, table_name_for_this_source)
+            domain_to_uuid_cache[domain_name_for_source] = source_uuid # Cache the result
+
+        if source_uuid:
+            final_urls.append(url)
+            final_chunk_numbers.append(chunk_numbers[k])
+            final_contents.append(contents[k])
+            final_metadatas.append(metadatas[k])
+            final_source_uuids.append(source_uuid)
+            final_hashes.append(content_hashes[k])
+        else:
+            print(f"Warning: URL {url} is being skipped due to missing source UUID (no embedding/contextualization performed).")
+
+    if not final_contents:
+        print("Info: No new or changed documents to insert.")
+        if stats["deleted"] or stored_hashes is None:
+            await prune_chunks(client, "crawled_pages", chunk_counts)
+        return stats
+
+    # 2. Apply contextual embedding (if enabled) without blocking the event loop
+    if use_contextual_embeddings and CONTEXTUAL_EMBEDDING_MODE == "document":
+        contextual_contents = await contextualize_documents(
+            final_urls, final_contents, final_metadatas, url_to_full_document
+        )
+    elif use_contextual_embeddings:
+        contextual_contents = await contextualize_contents(
+            final_urls, final_contents, final_metadatas, url_to_full_document
+        )
+    else:
+        contextual_contents = final_contents
+
+    # 3. Pack chunks into token-budgeted embedding requests; embed and insert each pack
+    token_counts = [min(count_tokens(text), EMBEDDING_MAX_INPUT_TOKENS) for text in contextual_contents]
+    packs = pack_batches(token_counts, EMBEDDING_BATCH_MAX_TOKENS, EMBEDDING_BATCH_MAX_ITEMS)
+
+    async def process_pack(start: int, end: int) -> None:
+        batch_embeddings = await create_embeddings_batch(contextual_contents[start:end])
+        valid = valid_embedding_mask(batch_embeddings)
+
+        batch_data_to_upsert = []
+        for j, embedding, is_valid in zip(range(start, end), batch_embeddings, valid):
+            # Rows stored with a failed embedding or without their context get no hash,
+            # so the next ingest sees them as changed and retries them
+            complete = is_valid and (not use_contextual_embeddings or final_metadatas[j].get("contextual_embedding"))
+            # All lists (final_*, contextual_contents) are aligned and filtered
+            batch_data_to_upsert.append({
+                "url": final_urls[j],
+                "chunk_number": final_chunk_numbers[j],
+                "content": contextual_contents[j],
                 "metadata": {
-                    "chunk_size": len(contextual_contents[j_final]),
-                    **final_batch_metadatas[j_final]
+                    "chunk_size": len(contextual_contents[j]),
+                    **final_metadatas[j]
                 },
-                "source_id": final_batch_source_uuids[j_final], # Guaranteed not None
-                "embedding": batch_embeddings[j_final]
-            }
-            batch_data_to_insert.append(data)
+                "source_id": final_source_uuids[j], # Guaranteed not None
+                "content_hash": final_hashes[j] if complete else None,
+                "embedding": embedding
+            })
+
+        stats["inserted"] += await upsert_rows(client, "crawled_pages", batch_data_to_upsert)
+
+        # Keep the local vector index in step with the table
+        local_index = get_local_vector_index()
+        if local_index:
+            try:
+                await asyncio.to_thread(local_index.upsert, batch_data_to_upsert)
+            except Exception as e:
+                print(f"Error updating local vector index: {e}")
+
+    print(f"Embedding {len(contextual_contents)} chunks in {len(packs)} requests")
+    await gather_bounded([process_pack(start, end) for start, end in packs], EMBEDDING_MAX_CONCURRENCY)
+
+    # Prune after the upserts so a page never has fewer rows than it ends up with
+    if stats["deleted"] or stored_hashes is None:
+        await prune_chunks(client, "crawled_pages", chunk_counts)
+    invalidate_cached_results(final_urls)
+    return stats
+
+def keyset_params(after: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the keyset parameters of match_crawled_pages and match_code_examples.
+    
+    Args:
+        after: Similarity, url and chunk_number of the last row of the previous page, and the
+            number of rows returned before it (offset)
         
-        # 6. Insert batch into Supabase (if batch_data_to_insert is not empty)
-        if batch_data_to_insert:
-            max_retries = 3
-            retry_delay = 1.0
-            
-            for retry in range(max_retries):
-                try:
-                    client.table("crawled_pages").insert(batch_data_to_insert).execute()
-                    break # Success
-                except Exception as e:
-                    if retry < max_retries - 1:
-                        print(f"Error inserting batch into Supabase (attempt {retry + 1}/{max_retries}): {e}")
-                        print(f"Retrying in {retry_delay} seconds...")
-                        time.sleep(retry_delay)
-                        retry_delay *= 2
-                    else:
-                        print(f"Failed to insert batch after {max_retries} attempts: {e}. Attempting individual inserts.")
-                        successful_inserts = 0
-                        for record_idx, record in enumerate(batch_data_to_insert):
-                            try:
-                                client.table("crawled_pages").insert(record).execute()
-                                successful_inserts += 1
-                            except Exception as individual_error:
-                                print(f"Failed to insert individual record for URL {record.get('url', 'N/A')} (final index {record_idx}): {individual_error}")
-                        print(f"Successfully inserted {successful_inserts}/{len(batch_data_to_insert)} records individually after batch failure.")
-        else:
-            print(f"Info: No data to insert for batch starting at original index {i} after processing.")
+    Returns:
+        RPC parameters selecting the rows that follow it
+    """
+    return {
+        'after_similarity': after['similarity'],
+        'after_url': after['url'],
+        'after_chunk_number': after['chunk_number'],
+        'after_offset': after.get('offset', 0)
+    }
 
-def search_documents(
-    client: Client, 
+def drop_keyset_row(rows: List[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Drop the row a page was started after, if the database returned it again.
+    
+    A first page served by the local vector index carries float32 similarities, which can
+    differ from the database's in the last digits and let the boundary row through.
+    
+    Args:
+        rows: Rows returned by the search
+        after: Keyset the page was started after, if any
+        
+    Returns:
+        Rows without the boundary row
+    """
+    if not after or not rows:
+        return rows
+    return [row for row in rows if (row.get('url'), row.get('chunk_number')) != (after['url'], after['chunk_number'])]
+
+async def search_documents(
+    client: AsyncClient, 
     query: str, 
     match_count: int = 10, 
-    filter_metadata: Optional[Dict[str, Any]] = None
+    filter_metadata: Optional[Dict[str, Any]] = None,
+    use_hybrid_search: bool = False,
+    query_embedding: Optional[np.ndarray] = None,
+    after: Optional[Dict[str, Any]] = None
 ) -> List[Dict[str, Any]]:
     """
     Search for documents in Supabase using vector similarity.
     
+    In hybrid mode, vector and full-text results are fused with reciprocal rank fusion
+    by the hybrid_search_crawled_pages function in a single round-trip. Otherwise, when the
+    local vector index is enabled and ready, vector search is served from it without a
+    round-trip, falling back to match_crawled_pages if it fails.
+    
+    Vector results are ordered by (similarity desc, url, chunk_number). Passing the last
+    row of a page as `after` returns the next page with a keyset condition in
+    match_crawled_pages. The database still reads every row before the page, plus two
+    pages, from its vector index, so deeper pages cost more. Pages after the first always
+    come from Supabase.
+    
     Args:
         client: Supabase client
         query: Query text
         match_count: Maximum number of results to return
         filter_metadata: Optional metadata filter
+        use_hybrid_search: Whether to fuse in full-text search results
+        query_embedding: Embedding of the query, if already computed (e.g. in a batch)
+        after: Optional similarity, url and chunk_number of the last row of the previous page, and the rows returned so far (vector search only)
         
     Returns:
         List of matching documents
     """
+    if after and use_hybrid_search:
+        raise ValueError("Keyset pagination is only supported for vector search")
+    
     # Create embedding for the query
-    query_embedding = create_embedding(query)
+    if query_embedding is None:
+        query_embedding = await create_query_embedding(normalize_query(query))
+    
+    # Serve plain vector searches (optionally filtered by source) from the local index
+    local_index = get_local_vector_index()
+    if local_index and local_index.ready and not use_hybrid_search and not after and set(filter_metadata or {}) <= {"source"}:
+        try:
+            return await asyncio.to_thread(
+                local_index.search, query_embedding, match_count, (filter_metadata or {}).get("source")
+            )
+        except Exception as e:
+            print(f"Error searching local vector index: {e}. Falling back to Supabase.")
     
     # Execute the search using the match_crawled_pages function
     try:
         # Only include filter parameter if filter_metadata is provided and not empty
         params = {
-            'query_embedding': query_embedding,
+            'query_embedding': query_embedding.tolist(),
             'match_count': match_count
         }
         
@@ -447,9 +1291,15 @@ def search_documents(
         if filter_metadata:
             params['filter'] = filter_metadata  # Pass the dictionary directly, not JSON-encoded
         
-        result = client.rpc('match_crawled_pages', params).execute()
+        if use_hybrid_search:
+            params['query_text'] = query
+            result = await client.rpc('hybrid_search_crawled_pages', params).execute()
+        else:
+            if after:
+                params.update(keyset_params(after))
+            result = await client.rpc('match_crawled_pages', params).execute()
         
-        return result.data
+        return drop_keyset_row(result.data, after)
     except Exception as e:
         print(f"Error searching documents: {e}")
         return []
@@ -537,7 +1387,7 @@ def extract_code_blocks(markdown_content: str, min_length: int = 1000) -> List[D
     return code_blocks
 
 
-def generate_code_example_summary(code: str, context_before: str, context_after: str) -> str:
+async def generate_code_example_summary(code: str, context_before: str, context_after: str) -> str:
     """
     Generate a summary for a code example using its surrounding context.
     
@@ -568,7 +1418,7 @@ Based on the code example and its surrounding context, provide a concise summary
 """
     
     try:
-        response = openai.chat.completions.create(
+        response = await get_async_openai_client().chat.completions.create(
             model=model_choice,
             messages=[
                 {"role": "system", "content": "You are a helpful assistant that provides concise code example summaries."},
@@ -584,17 +1434,21 @@ Based on the code example and its surrounding context, provide a concise summary
         return "Code example for demonstration purposes."
 
 
-def add_code_examples_to_supabase(
-    client: Client,
+async def add_code_examples_to_supabase(
+    client: AsyncClient,
     urls: List[str],
     chunk_numbers: List[int],
     code_examples: List[str],
     summaries: List[str],
-    metadatas: List[Dict[str, Any]],
-    batch_size: int = 20
+    metadatas: List[Dict[str, Any]]
 ):
     """
-    Add code examples to the Supabase code_examples table in batches.
+    Add code examples to the Supabase code_examples table.
+    Examples are upserted over the previous rows with the same (url, chunk_number), and
+    trailing examples that no longer exist are pruned afterwards; every example of a page
+    must be passed in the same call. Examples are packed into embedding requests by token
+    budget, and rows into upsert payloads by size, with up to EMBEDDING_MAX_CONCURRENCY
+    embedding requests in flight.
     
     Args:
         client: Supabase client
@@ -603,57 +1457,38 @@ def add_code_examples_to_supabase(
         code_examples: List of code example contents
         summaries: List of code example summaries
         metadatas: List of metadata dictionaries
-        batch_size: Size of each batch for insertion
     """
     if not urls:
         return
         
-    # Delete existing records for these URLs
-    unique_urls = list(set(urls))
-    for url in unique_urls:
-        try:
-            client.table('code_examples').delete().eq('url', url).execute()
-        except Exception as e:
-            print(f"Error deleting existing code examples for {url}: {e}")
-    
-    # Process in batches
-    total_items = len(urls)
-    for i in range(0, total_items, batch_size):
-        batch_end = min(i + batch_size, total_items)
-        batch_texts = []
-        
-        # Create combined texts for embedding (code + summary)
-        for j in range(i, batch_end):
-            combined_text = f"{code_examples[j]}\n\nSummary: {summaries[j]}"
-            batch_texts.append(combined_text)
-        
-        # Create embeddings for the batch
-        embeddings = create_embeddings_batch(batch_texts)
-        
-        # Check if embeddings are valid (not all zeros)
-        valid_embeddings = []
-        for embedding in embeddings:
-            if embedding and not all(v == 0.0 for v in embedding):
-                valid_embeddings.append(embedding)
-            else:
-                print(f"Warning: Zero or invalid embedding detected, creating new one...")
-                # Try to create a single embedding as fallback
-                single_embedding = create_embedding(batch_texts[len(valid_embeddings)])
-                valid_embeddings.append(single_embedding)
+    chunk_counts: Dict[str, int] = {}
+    for url, chunk_number in zip(urls, chunk_numbers):
+        chunk_counts[url] = max(chunk_counts.get(url, 0), chunk_number + 1)
+
+    # Create combined texts for embedding (code + summary)
+    texts = [f"{code}\n\nSummary: {summary}" for code, summary in zip(code_examples, summaries)]
+    token_counts = [min(count_tokens(text), EMBEDDING_MAX_INPUT_TOKENS) for text in texts]
+    packs = pack_batches(token_counts, EMBEDDING_BATCH_MAX_TOKENS, EMBEDDING_BATCH_MAX_ITEMS)
+
+    async def process_pack(pack_number: int, start: int, end: int) -> None:
+        batch_texts = texts[start:end]
+
+        # Create embeddings for the pack
+        embeddings = await create_embeddings_batch(batch_texts)
+        
+        # Retry rows that came back zero or non-finite one at a time
+        for j in np.flatnonzero(~valid_embedding_mask(embeddings)):
+            print(f"Warning: Zero or invalid embedding detected, creating new one...")
+            embeddings[j] = await create_embedding(batch_texts[j])
         
         # Prepare batch data
         batch_data = []
-        for j, embedding in enumerate(valid_embeddings):
-            idx = i + j
+        for j, embedding in enumerate(embeddings):
+            idx = start + j
             
             # Extract source_id from URL
             parsed_url = urlparse(urls[idx])
             source_domain_for_code = parsed_url.netloc or parsed_url.path # This is correct if code_examples.source_id is TEXT
-            
-            # current_code_source_id_val = batch_code_source_uuids[j] # If it were UUID
-            # if not current_code_source_id_val: # If it were UUID
-            #     print(f"Warning: Missing source UUID for code example URL {urls[idx]}. Skipping.")
-            #     continue
 
             batch_data.append({
                 'url': urls[idx],
@@ -665,40 +1500,20 @@ def add_code_examples_to_supabase(
                 'embedding': embedding
             })
         
-        # Insert batch into Supabase with retry logic
-        max_retries = 3
-        retry_delay = 1.0  # Start with 1 second delay
-        
-        for retry in range(max_retries):
-            try:
-                client.table('code_examples').insert(batch_data).execute()
-                # Success - break out of retry loop
-                break
-            except Exception as e:
-                if retry < max_retries - 1:
-                    print(f"Error inserting batch into Supabase (attempt {retry + 1}/{max_retries}): {e}")
-                    print(f"Retrying in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # Exponential backoff
-                else:
-                    # Final attempt failed
-                    print(f"Failed to insert batch after {max_retries} attempts: {e}")
-                    # Optionally, try inserting records one by one as a last resort
-                    print("Attempting to insert records individually...")
-                    successful_inserts = 0
-                    for record in batch_data:
-                        try:
-                            client.table('code_examples').insert(record).execute()
-                            successful_inserts += 1
-                        except Exception as individual_error:
-                            print(f"Failed to insert individual record for URL {record['url']}: {individual_error}")
-                    
-                    if successful_inserts > 0:
-                        print(f"Successfully inserted {successful_inserts}/{len(batch_data)} records individually")
-        print(f"Inserted batch {i//batch_size + 1} of {(total_items + batch_size - 1)//batch_size} code examples")
+        await upsert_rows(client, 'code_examples', batch_data)
+        print(f"Upserted batch {pack_number + 1} of {len(packs)} code examples")
 
+    await gather_bounded(
+        [process_pack(n, start, end) for n, (start, end) in enumerate(packs)],
+        EMBEDDING_MAX_CONCURRENCY
+    )
 
-def update_source_info(client: Client, domain_name: str, summary: str, word_count: int, table_name_for_source: Optional[str] = None):
+    # Remove examples numbered past the new count for each page
+    await prune_chunks(client, 'code_examples', chunk_counts)
+    invalidate_cached_results(urls)
+
+
+async def update_source_info(client: AsyncClient, domain_name: str, summary: str, word_count: int, table_name_for_source: Optional[str] = None):
     """
     Update or insert source information in the sources table.
     Uses domain_name (source column) as the conflict target for upsert.
@@ -737,25 +1552,21 @@ def update_source_info(client: Client, domain_name: str, summary: str, word_coun
         # This will insert if no row with the given 'source' (domain_name) exists,
         # or update the existing row if it does.
         # A unique constraint on the 'source' column is required for on_conflict.
-        response = client.table("sources").upsert(
+        # Errors are raised as exceptions by the client, so reaching the print means success
+        await client.table("sources").upsert(
             data_to_upsert, 
             on_conflict="source" # Assumes 'source' column has a unique constraint
         ).execute()
-
-        if response.error:
-            print(f"Error upserting source info for {domain_name}: {response.error}")
-        else:
-            # Upsert might not return data on success depending on PostgREST version/config
-            # and whether it was an insert or update.
-            # Checking for presence of data and specific count might be too strict.
-            # The absence of an error is the primary success indicator here.
-            print(f"Successfully upserted source info for: {domain_name}")
+        print(f"Successfully upserted source info for: {domain_name}")
             
     except Exception as e:
         print(f"Exception during update_source_info for {domain_name}: {e}")
 
+    if _result_cache is not None:
+        _result_cache.bump(domain_name)
+
 
-def extract_source_summary(source_id: str, content: str, max_length: int = 500) -> str:
+async def extract_source_summary(source_id: str, content: str, max_length: int = 500) -> str:
     """
     Extract a summary for a source from its content using an LLM.
     
@@ -791,7 +1602,7 @@ The above content is from the documentation for '{source_id}'. Please provide a
     
     try:
         # Call the OpenAI API to generate the summary
-        response = openai.chat.completions.create(
+        response = await get_async_openai_client().chat.completions.create(
             model=model_choice,
             messages=[
                 {"role": "system", "content": "You are a helpful assistant that provides concise library/tool/framework summaries."},
@@ -814,38 +1625,52 @@ The above content is from the documentation for '{source_id}'. Please provide a
         return default_summary
 
 
-def search_code_examples(
-    client: Client, 
+async def search_code_examples(
+    client: AsyncClient, 
     query: str, 
     match_count: int = 10, 
     filter_metadata: Optional[Dict[str, Any]] = None,
-    source_id: Optional[str] = None
+    source_id: Optional[str] = None,
+    use_hybrid_search: bool = False,
+    after: Optional[Dict[str, Any]] = None
 ) -> List[Dict[str, Any]]:
     """
     Search for code examples in Supabase using vector similarity.
     
+    In hybrid mode, vector and full-text results are fused with reciprocal rank fusion
+    by the hybrid_search_code_examples function in a single round-trip. Full-text search
+    matches the raw query rather than the enhanced query used for the embedding.
+    Vector results are paged with the same keyset as search_documents, and deeper pages
+    likewise read more candidates from the vector index.
+    
     Args:
         client: Supabase client
         query: Query text
         match_count: Maximum number of results to return
         filter_metadata: Optional metadata filter
         source_id: Optional source ID to filter results
+        use_hybrid_search: Whether to fuse in full-text search results
+        after: Optional similarity, url and chunk_number of the last row of the previous page, and the rows returned so far (vector search only)
         
     Returns:
         List of matching code examples
     """
+    if after and use_hybrid_search:
+        raise ValueError("Keyset pagination is only supported for vector search")
+    
     # Create a more descriptive query for better embedding match
     # Since code examples are embedded with their summaries, we should make the query more descriptive
+    query = normalize_query(query)
     enhanced_query = f"Code example for {query}\n\nSummary: Example code showing {query}"
     
     # Create embedding for the enhanced query
-    query_embedding = create_embedding(enhanced_query)
+    query_embedding = await create_query_embedding(enhanced_query)
     
     # Execute the search using the match_code_examples function
     try:
         # Only include filter parameter if filter_metadata is provided and not empty
         params = {
-            'query_embedding': query_embedding,
+            'query_embedding': query_embedding.tolist(),
             'match_count': match_count
         }
         
@@ -857,9 +1682,15 @@ def search_code_examples(
         if source_id:
             params['source_filter'] = source_id
         
-        result = client.rpc('match_code_examples', params).execute()
+        if use_hybrid_search:
+            params['query_text'] = query
+            result = await client.rpc('hybrid_search_code_examples', params).execute()
+        else:
+            if after:
+                params.update(keyset_params(after))
+            result = await client.rpc('match_code_examples', params).execute()
         
-        return result.data
+        return drop_keyset_row(result.data, after)
     except Exception as e:
         print(f"Error searching code examples: {e}")
         return []
\ No newline at end of file
@@ -0,0 +1,387 @@
+"""
+Local vector index mirroring crawled_pages for low-latency search inside the MCP server.
+"""
+import os
+import asyncio
+import json
+import sqlite3
+import threading
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:  # Optional: without it the index falls back to exact search over the memmap
+    hnswlib = None
+
+
+class LocalVectorIndex:
+    """
+    Persistent in-process mirror of the crawled_pages embeddings.
+
+    Vectors are L2-normalized and stored in a memory-mapped float32 file, one row per label.
+    Row metadata (url, chunk_number, source, content, metadata) lives in SQLite next to it.
+    When hnswlib is installed, an HNSW graph over the same labels serves approximate
+    nearest-neighbour queries and is saved on close, so a restart only reloads files.
+    Without hnswlib, queries are answered exactly with a matrix-vector product over the memmap.
+
+    Rows are keyed by (url, chunk_number) like the table they mirror: upserting a key
+    replaces its vector in place, and pruned rows are masked out until their key is reused.
+    While the index is bootstrapped, URLs written by ingestion are remembered and the
+    bootstrap skips their rows, so a page fetched from the table before the write cannot
+    bring back stale chunks.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        dimension: int,
+        m: int = 16,
+        ef_construction: int = 200,
+        ef_search: int = 64
+    ):
+        """
+        Open (or create) the index.
+
+        Args:
+            directory: Directory holding the index files
+            dimension: Dimension of the embeddings
+            m: HNSW graph degree
+            ef_construction: HNSW candidate list size while inserting
+            ef_search: HNSW candidate list size while querying
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.dimension = dimension
+        self.ef_search = ef_search
+        self.ready = False
+        self.exact_searches = 0
+        self._lock = threading.Lock()
+        self._ingested_urls: Set[str] = set()
+        self._stop_bootstrap = threading.Event()
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._hnsw_path = os.path.join(directory, "hnsw.bin")
+
+        self._conn = sqlite3.connect(os.path.join(directory, "rows.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rows (
+                label INTEGER PRIMARY KEY,
+                url TEXT NOT NULL,
+                chunk_number INTEGER NOT NULL,
+                source TEXT,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                alive INTEGER NOT NULL,
+                UNIQUE (url, chunk_number)
+            )
+            """
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+
+        stored_dimension = self._conn.execute("SELECT value FROM info WHERE key = 'dimension'").fetchone()
+        if stored_dimension and int(stored_dimension[0]) != dimension:
+            raise ValueError(
+                f"Local vector index in {directory} has dimension {stored_dimension[0]}, not {dimension}. "
+                "Delete the directory to rebuild it."
+            )
+        self._conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('dimension', ?)", (str(dimension),))
+        self._conn.commit()
+
+        # In-memory views of the SQLite rows, used to mask and resolve search results
+        stored_rows = self._conn.execute("SELECT label, url, chunk_number, source, alive FROM rows").fetchall()
+        self._count = len(stored_rows)
+        self._capacity = max(1024, self._count)
+        self._labels: Dict[Tuple[str, int], int] = {}
+        self._sources: Dict[Optional[str], int] = {}
+        self._alive = np.zeros(self._capacity, dtype=bool)
+        self._source_codes = np.zeros(self._capacity, dtype=np.int32)
+        for label, url, chunk_number, source, alive in stored_rows:
+            self._labels[(url, chunk_number)] = label
+            self._alive[label] = bool(alive)
+            self._source_codes[label] = self._source_code(source)
+        self._vectors = self._open_vectors(self._capacity)
+
+        self._hnsw = None
+        if hnswlib is not None:
+            self._hnsw = hnswlib.Index(space="ip", dim=dimension)
+            if os.path.exists(self._hnsw_path):
+                self._hnsw.load_index(self._hnsw_path, max_elements=self._capacity)
+            else:
+                self._hnsw.init_index(max_elements=self._capacity, ef_construction=ef_construction, M=m)
+            if self._hnsw.get_current_count() != self._count:
+                # The graph was not saved since the last writes (e.g. after a crash); rebuild it from the memmap
+                self._hnsw = hnswlib.Index(space="ip", dim=dimension)
+                self._hnsw.init_index(max_elements=self._capacity, ef_construction=ef_construction, M=m)
+                if self._count:
+                    self._hnsw.add_items(self._vectors[:self._count], np.arange(self._count))
+                for label in np.flatnonzero(~self._alive[:self._count]):
+                    self._hnsw.mark_deleted(int(label))
+            self._hnsw.set_ef(ef_search)
+        else:
+            print(
+                "hnswlib is not installed: local vector index searches scan every vector exactly. "
+                "Install the 'ann' extra for HNSW search."
+            )
+
+        # Only a completed bootstrap makes the index a full mirror; rows added by ingestion alone do not
+        self.ready = self._conn.execute("SELECT value FROM info WHERE key = 'bootstrapped'").fetchone() is not None
+
+    def _source_code(self, source: Optional[str]) -> int:
+        if source not in self._sources:
+            self._sources[source] = len(self._sources)
+        return self._sources[source]
+
+    def _open_vectors(self, capacity: int) -> np.memmap:
+        size = capacity * self.dimension * 4
+        with open(self._vectors_path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        return np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dimension))
+
+    def _grow(self, needed: int) -> None:
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        if capacity == self._capacity:
+            return
+        self._vectors.flush()
+        del self._vectors
+        self._vectors = self._open_vectors(capacity)
+        if self._hnsw is not None:
+            self._hnsw.resize_index(capacity)
+        self._alive = np.concatenate([self._alive, np.zeros(capacity - len(self._alive), dtype=bool)])
+        self._source_codes = np.concatenate([self._source_codes, np.zeros(capacity - len(self._source_codes), dtype=np.int32)])
+        self._capacity = capacity
+
+    def upsert(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        Insert or replace rows, keyed by (url, chunk_number).
+
+        Args:
+            rows: crawled_pages rows with url, chunk_number, content, metadata and embedding
+        """
+        if not rows:
+            return
+
+        with self._lock:
+            if not self.ready:
+                self._ingested_urls.update(row["url"] for row in rows)
+            self._upsert_locked(rows)
+
+    def _upsert_locked(self, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        self._grow(self._count + len(rows))
+
+        labels = []
+        records = []
+        for row in rows:
+            key = (row["url"], row["chunk_number"])
+            label = self._labels.get(key)
+            if label is None:
+                label = self._count
+                self._labels[key] = label
+                self._count += 1
+            elif self._hnsw is not None and not self._alive[label]:
+                self._hnsw.unmark_deleted(label)
+            source = (row.get("metadata") or {}).get("source")
+            self._alive[label] = True
+            self._source_codes[label] = self._source_code(source)
+            labels.append(label)
+            records.append((
+                label, row["url"], row["chunk_number"], source, row["content"],
+                json.dumps(row.get("metadata") or {})
+            ))
+
+        vectors = np.stack([np.asarray(row["embedding"], dtype=np.float32) for row in rows])
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        label_array = np.asarray(labels)
+        self._vectors[label_array] = vectors
+        if self._hnsw is not None:
+            self._hnsw.add_items(vectors, label_array)
+
+        self._conn.executemany(
+            """
+            INSERT INTO rows (label, url, chunk_number, source, content, metadata, alive)
+            VALUES (?, ?, ?, ?, ?, ?, 1)
+            ON CONFLICT(label) DO UPDATE SET
+                source = excluded.source,
+                content = excluded.content,
+                metadata = excluded.metadata,
+                alive = 1
+            """,
+            records
+        )
+        self._conn.commit()
+
+    def prune(self, chunk_counts: Dict[str, int]) -> None:
+        """
+        Remove every row numbered at or above its URL's new chunk count.
+
+        Args:
+            chunk_counts: Dictionary mapping each URL to the number of chunks it now has
+        """
+        with self._lock:
+            if not self.ready:
+                self._ingested_urls.update(chunk_counts)
+            labels = [
+                label for (url, chunk_number), label in self._labels.items()
+                if url in chunk_counts and chunk_number >= chunk_counts[url] and self._alive[label]
+            ]
+            for label in labels:
+                self._alive[label] = False
+                if self._hnsw is not None:
+                    self._hnsw.mark_deleted(label)
+            if labels:
+                self._conn.executemany("UPDATE rows SET alive = 0 WHERE label = ?", [(label,) for label in labels])
+                self._conn.commit()
+
+    def search(self, query_embedding: np.ndarray, match_count: int, source: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Find the rows most similar to a query embedding.
+
+        Args:
+            query_embedding: Query embedding
+            match_count: Maximum number of results to return
+            source: Optional source domain to restrict results to (metadata 'source')
+
+        Returns:
+            Rows shaped like match_crawled_pages results, with cosine similarity
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        with self._lock:
+            if source is not None and source not in self._sources:
+                return []
+            code = self._sources.get(source)
+            alive = self._alive[:self._count]
+            allowed = alive if source is None else alive & (self._source_codes[:self._count] == code)
+            available = int(allowed.sum())
+            if not available:
+                return []
+            k = min(match_count, available)
+
+            labels = None
+            if self._hnsw is not None:
+                try:
+                    self._hnsw.set_ef(max(self.ef_search, k))
+                    found, distances = self._hnsw.knn_query(
+                        query, k=k, filter=None if source is None else (lambda label: bool(allowed[label]))
+                    )
+                    labels = found[0]
+                    scores = 1 - distances[0]  # hnswlib's "ip" distance is 1 - inner product
+                except RuntimeError:
+                    # HNSW could not find k neighbours through a very selective filter; search exactly instead
+                    labels = None
+            if labels is None:
+                self.exact_searches += 1
+                scores = np.where(allowed, self._vectors[:self._count] @ query, -np.inf)
+                labels = np.argpartition(-scores, k - 1)[:k]
+                labels = labels[np.argsort(-scores[labels])]
+                scores = scores[labels]
+
+            placeholders = ",".join("?" * len(labels))
+            rows = {
+                row[0]: row for row in self._conn.execute(
+                    f"SELECT label, url, chunk_number, source, content, metadata FROM rows WHERE label IN ({placeholders})",
+                    [int(label) for label in labels]
+                )
+            }
+
+        results = []
+        for label, score in zip(labels, scores):
+            row = rows.get(int(label))
+            if row is None:
+                continue
+            results.append({
+                "url": row[1],
+                "chunk_number": row[2],
+                "content": row[4],
+                "metadata": json.loads(row[5]),
+                "source_id": row[3],
+                "similarity": float(score)
+            })
+        return results
+
+    async def bootstrap(self, client: Any, page_size: int = 500) -> int:
+        """
+        Fill the index from the crawled_pages table.
+
+        Runs until every row is loaded or cancel_bootstrap() is called; the index only
+        becomes ready once every row is loaded. Rows of URLs that ingestion wrote or pruned
+        in the meantime are skipped, since the index already holds their current chunks. Pages are fetched with the async Supabase
+        client and inserted on a worker thread, so the event loop keeps serving requests.
+
+        Args:
+            client: Async Supabase client
+            page_size: Rows fetched per request
+
+        Returns:
+            Number of rows loaded
+        """
+        loaded = 0
+        last_id = 0
+        while not self._stop_bootstrap.is_set():
+            response = await client.table("crawled_pages")\
+                .select("id, url, chunk_number, content, metadata, embedding")\
+                .gt("id", last_id)\
+                .order("id")\
+                .limit(page_size)\
+                .execute()
+            rows = response.data or []
+            if not rows:
+                with self._lock:
+                    self._conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('bootstrapped', '1')")
+                    self._conn.commit()
+                    self.ready = True
+                    self._ingested_urls.clear()
+                break
+            for row in rows:
+                # PostgREST returns pgvector values as their text form, e.g. "[0.1,0.2,...]"
+                if isinstance(row["embedding"], str):
+                    row["embedding"] = json.loads(row["embedding"])
+            await asyncio.to_thread(self._upsert_bootstrap, [row for row in rows if row.get("embedding")])
+            loaded += len(rows)
+            last_id = rows[-1]["id"]
+        return loaded
+
+    def _upsert_bootstrap(self, rows: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._upsert_locked([row for row in rows if row["url"] not in self._ingested_urls])
+
+    def cancel_bootstrap(self) -> None:
+        """Stop a running bootstrap() after the page it is loading."""
+        self._stop_bootstrap.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get size counters for the index.
+
+        Returns:
+            Dictionary with backend, searches answered by exact scan, ready flag and row counts
+        """
+        return {
+            "backend": "hnsw" if self._hnsw is not None else "exact",
+            "exact_searches": self.exact_searches,
+            "ready": self.ready,
+            "rows": int(self._alive[:self._count].sum()),
+            "labels": self._count,
+            "dimension": self.dimension
+        }
+
+    def close(self) -> None:
+        """Flush vectors, save the HNSW graph and close the database connection."""
+        with self._lock:
+            self._vectors.flush()
+            if self._hnsw is not None:
+                self._hnsw.save_index(self._hnsw_path)
+            self._conn.close()